@@ -1,30 +1,219 @@
-import matplotlib.pyplot as plt
-import matplotlib.animation as anim
+"""
+Live view of the telemetry hardware_control.Car records:
+    python animation.py <telemetry directory> [--png <frames directory>] [--frames N]\n
+Every frame reads only the records appended since the last one (telemetry.Tail). The path shows the last points
+of a bounded ring, the heading and motor plots the whole drive decimated to the minimum and maximum of every pixel
+wide bucket, so a frame costs the same after hours of driving as after seconds. The lines are made once and updated
+with set_data and blitting, the whole figure is only drawn again when an axis has to grow.
+With --png it runs without a display and writes every frame to a PNG file.
+matplotlib is only imported when a LiveView is made
+"""
+import argparse
+import os
+import numpy
+from magnetometer import RingBuffer
+from telemetry import Tail
+from timing import REAL_CLOCK
 
-fig = plt.figure()
-ax1 = plt.subplot(111)
+# Fields of the STATE records in the time plots, axes index and label
+SERIES = (('current_angle', 0, 'current'), ('wanted_angle', 0, 'wanted'), ('left', 1, 'left'), ('right', 1, 'right'))
 
 
+def decimate(t, y, width, origin=0.0):
+    """
+    Returns the points of (t, y) that are the minimum or the maximum of y in their bucket of t,
+    the buckets being width wide from origin. t is ascending, so are the at most two points kept per bucket
+    """
+    if not len(t):
+        return t, y
+    buckets = numpy.floor((t - origin) / width)
+    order = numpy.lexsort((y, buckets))
+    grouped = buckets[order]
+    first = numpy.flatnonzero(numpy.concatenate(([True], grouped[1:] != grouped[:-1])))
+    last = numpy.concatenate((first[1:] - 1, [len(t) - 1]))
+    keep = numpy.unique(numpy.concatenate((order[first], order[last])))
+    return t[keep], y[keep]
 
-def animFunc(x):
-    file = open('C:\\Users\\HP\\Desktop\\data2.txt', 'r').read()
-    lines= file.split('\n')
-    xs = []
-    ys = []
-    for line in lines:
-        if len(line) > 1:
-            x, y = line.split(',')
-            xs.append(int(x))
-            ys.append(int(y))
-    ax1.clear()
-    ax1.plot(xs, ys)
 
-func = anim.FuncAnimation(fig, animFunc, interval=1000)
-plt.show()
+def decimate_path(x, y, resolution):
+    """ Drops the points of the path (x, y) that are in the same resolution wide square as the point before """
+    if len(x) < 3 or not resolution > 0:
+        return x, y
+    cells = numpy.floor(numpy.column_stack((x, y)) / resolution)
+    keep = numpy.concatenate(([True], (cells[1:] != cells[:-1]).any(axis=1)))
+    keep[-1] = True
+    return x[keep], y[keep]
 
 
+class History:
+    """
+    Series of a whole drive decimated to about buckets min/max buckets\n
+    The buckets start width seconds wide and double whenever the drive gets longer than buckets of them,
+    so the memory and the cost of drawing it stay bounded. times and values hold the points kept of every series
+    """
 
+    def __init__(self, count, buckets=1000, width=0.05):
+        self.buckets = buckets
+        self.width = width
+        self.origin = None
+        self.times = [numpy.empty(0)] * count
+        self.values = [numpy.empty(0)] * count
 
-    
-        
-    
+    def add(self, times, values):
+        """ Adds the points of ascending times, values has a column per series """
+        if not len(times):
+            return
+        if self.origin is None:
+            self.origin = times[0]
+        while times[-1] - self.origin > self.buckets * self.width:
+            self.width *= 2  # The min and max of two buckets are among their min and max points
+            for i in range(len(self.times)):
+                self.times[i], self.values[i] = decimate(self.times[i], self.values[i], self.width, self.origin)
+        for i in range(len(self.times)):
+            old_times, old_values = self.times[i], self.values[i]
+            # The last bucket may still be filling, decimate it again together with the new points
+            split = 0
+            if len(old_times):
+                buckets = numpy.floor((old_times - self.origin) / self.width)
+                split = int(numpy.searchsorted(buckets, buckets[-1]))
+            new_times, new_values = decimate(numpy.concatenate((old_times[split:], times)),
+                                             numpy.concatenate((old_values[split:], values[:, i])), self.width, self.origin)
+            self.times[i] = numpy.concatenate((old_times[:split], new_times))
+            self.values[i] = numpy.concatenate((old_values[:split], new_values))
+
+
+class LiveView:
+    """
+    The path, heading and motor values of the 'state' stream recorded in directory\n
+    recent is how many of the last points the path shows. update() reads the new records and draws a frame,
+    run() does that every interval seconds, in a window or, with png set to a directory, into PNG files there
+    """
+
+    def __init__(self, directory, recent=5000, interval=0.2, png=None, size=(12, 6), clock=REAL_CLOCK):
+        self.tail = Tail(directory, 'state')
+        self.recent = RingBuffer(recent, 2)  # current x and y
+        self.interval = interval
+        self.png = png
+        self.clock = clock
+        self.frames = 0
+        if png is None:
+            import matplotlib.pyplot as pyplot
+            self.figure = pyplot.figure(figsize=size)
+        else:
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            from matplotlib.figure import Figure
+            self.figure = Figure(figsize=size)
+            FigureCanvasAgg(self.figure)
+            os.makedirs(png, exist_ok=True)
+        grid = self.figure.add_gridspec(2, 2)
+        self.path_axes = self.figure.add_subplot(grid[:, 0], aspect='equal', adjustable='box', xlim=(-1, 1), ylim=(-1, 1),
+                                                 title='Path', xlabel='x (m)', ylabel='y (m)')
+        heading_axes = self.figure.add_subplot(grid[0, 1], xlim=(0, 10), ylim=(-180, 180), ylabel='Heading (degrees)')
+        motor_axes = self.figure.add_subplot(grid[1, 1], sharex=heading_axes, ylim=(-1, 1), xlabel='Time (s)', ylabel='Motor value')
+        self.time_axes = (heading_axes, motor_axes)
+        self.path, = self.path_axes.plot([], [], animated=True, label='current')
+        self.target, = self.path_axes.plot([], [], 'x', animated=True, label='wanted')
+        self.lines = [self.time_axes[axes].plot([], [], animated=True, label=label)[0] for field, axes, label in SERIES]
+        for axes in (self.path_axes,) + self.time_axes:
+            axes.legend(loc='upper left')
+        self.figure.tight_layout()
+        self.history = History(len(SERIES), buckets=int(heading_axes.get_window_extent().width))
+        self._background = None
+        self.figure.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def update(self):
+        """ Reads the records appended since the last update and draws them, returns how many there were """
+        records = self.tail.read()
+        if len(records):
+            self.recent.extend(numpy.column_stack((records['current_x'], records['current_y'])))
+            self.history.add(records['time'].astype(numpy.float64),
+                             numpy.column_stack([records[field] for field, axes, label in SERIES]).astype(numpy.float64))
+            self.target.set_data([records['wanted_x'][-1]], [records['wanted_y'][-1]])
+        points = self.recent.latest(self.recent.capacity)
+        width = self.path_axes.get_window_extent().width
+        x, y = decimate_path(points[:, 0], points[:, 1], numpy.ptp(self.path_axes.get_xlim()) / width)
+        self.path.set_data(x, y)
+        for line, times, values in zip(self.lines, self.history.times, self.history.values):
+            line.set_data(times - self.history.origin if len(times) else times, values)
+        grown = self._grow(self.path_axes, (x, self.target.get_xdata()), (y, self.target.get_ydata()))
+        for axes in self.time_axes:
+            lines = [line for line in self.lines if line.axes is axes]
+            grown = self._grow(axes, [line.get_xdata() for line in lines], [line.get_ydata() for line in lines], time=True) or grown
+        self._draw(grown)
+        return len(records)
+
+    def run(self, frames=None):
+        """ Updates every interval seconds, for frames frames or until the window is closed (or interrupted) """
+        if self.png is None:
+            import matplotlib.pyplot as pyplot
+            timer = self.figure.canvas.new_timer(interval=int(self.interval * 1000))
+            timer.add_callback(self.update)
+            timer.start()
+            pyplot.show()
+            return
+        while frames is None or self.frames < frames:
+            self.update()
+            self.save(os.path.join(self.png, 'frame-{:06d}.png'.format(self.frames)))
+            self.frames += 1
+            self.clock.sleep(self.interval)
+
+    def save(self, path):
+        """ Writes the frame last drawn to a PNG file, from the canvas buffer so nothing is drawn again """
+        import matplotlib.image
+        matplotlib.image.imsave(path, numpy.asarray(self.figure.canvas.buffer_rgba()))
+
+    @staticmethod
+    def _grow(axes, xs, ys, time=False):
+        """ Widens the limits of axes to the data with some room to spare, returns whether they changed """
+        xs = numpy.concatenate([numpy.asarray(x, dtype=numpy.float64) for x in xs])
+        ys = numpy.concatenate([numpy.asarray(y, dtype=numpy.float64) for y in ys])
+        finite = numpy.isfinite(xs) & numpy.isfinite(ys)
+        if not finite.any():
+            return False
+        grown = False
+        for data, limits, set_limits in ((xs[finite], axes.get_xlim(), axes.set_xlim), (ys[finite], axes.get_ylim(), axes.set_ylim)):
+            low, high = min(limits), max(limits)
+            if data.min() >= low and data.max() <= high:
+                continue
+            if time and set_limits == axes.set_xlim:
+                high = data.max() * 1.5  # Time only grows, by half again so the redraws get rarer
+            else:
+                room = (max(high, data.max()) - min(low, data.min())) * 0.1
+                low, high = min(low, data.min() - room), max(high, data.max() + room)
+            set_limits(low, high)
+            grown = True
+        return grown
+
+    def _draw(self, full):
+        canvas = self.figure.canvas
+        if full or self._background is None:
+            canvas.draw()  # Draws the axes and takes the background in _on_draw
+        else:
+            canvas.restore_region(self._background)
+            self._draw_lines()
+        canvas.blit(self.figure.bbox)
+        canvas.flush_events()
+
+    def _on_draw(self, event):
+        # Also after the window is resized, the lines are animated so the background is drawn without them
+        self._background = self.figure.canvas.copy_from_bbox(self.figure.bbox)
+        self._draw_lines()
+
+    def _draw_lines(self):
+        for line in [self.path, self.target] + self.lines:
+            line.axes.draw_artist(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Live view of the telemetry of the car')
+    parser.add_argument('directory', help='the telemetry directory given to Car.record_telemetry')
+    parser.add_argument('--png', help='write the frames as PNG files to this directory instead of showing them')
+    parser.add_argument('--frames', type=int, help='stop after this many frames')
+    parser.add_argument('--interval', type=float, default=0.2, help='seconds between frames')
+    parser.add_argument('--recent', type=int, default=5000, help='points of the path shown')
+    arguments = parser.parse_args()
+    LiveView(arguments.directory, arguments.recent, arguments.interval, arguments.png).run(arguments.frames)
+
+
+if __name__ == '__main__':
+    main()
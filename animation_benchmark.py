@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+import numpy
+from animation import *
+from telemetry import LogFile, STATE
+from geometry_2d_benchmark import best_time
+
+sizes = (1000, 100000, 1000000)
+
+
+def state_records(first, count):
+    records = numpy.zeros(count, STATE)
+    records['time'] = numpy.arange(first, first + count) * 0.05
+    records['current_x'] = numpy.cos(records['time'] / 10)
+    records['current_y'] = numpy.sin(records['time'] / 7)
+    records['current_angle'] = records['time'] % 360
+    records['left'] = records['right'] = 0.5
+    return records
+
+
+def bench_frame():
+    """ A frame with 10 new records after size records were recorded, tailing against reading and plotting it all """
+    import matplotlib.pyplot as pyplot
+    pyplot.switch_backend('agg')
+    for size in sizes:
+        directory = tempfile.mkdtemp()
+        try:
+            log = LogFile(os.path.join(directory, 'state-000000.tel'), 'state', STATE, size + 10 ** 6)
+            recorded = state_records(0, size)
+            log.append(recorded)
+            view = LiveView(directory, png=directory)
+            view.update()
+
+            def frame():
+                log.append(state_records(log.count, 10))
+                view.update()
+            tailing = best_time(frame, repeat=3)
+            text = os.path.join(directory, 'data.txt')
+            with open(text, 'w') as file:
+                file.writelines('{},{}\n'.format(int(x * 100), int(y * 100)) for x, y in zip(recorded['current_x'], recorded['current_y']))
+            figure = pyplot.figure()
+            axes = figure.add_subplot(111)
+
+            def reread():
+                # What the old animation did every frame
+                xs, ys = [], []
+                for line in open(text).read().split('\n'):
+                    if len(line) > 1:
+                        x, y = line.split(',')
+                        xs.append(int(x))
+                        ys.append(int(y))
+                axes.clear()
+                axes.plot(xs, ys)
+                figure.canvas.draw()
+            rereading = best_time(reread, repeat=1)
+            pyplot.close(figure)
+            print('frame after {:>8} records  tailing {:>8.2f}ms  rereading {:>9.2f}ms'.format(size, tailing * 1e3, rereading * 1e3))
+            log.close()
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    bench_frame()
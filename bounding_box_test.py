@@ -1,4 +1,4 @@
-from coordinate_system_utils import *
+from geometry_2d import *
 import matplotlib.pyplot as plt
 
 points = (0, 0), (0, 1), (0.5, 2), (1, 1), (1, 0)
@@ -15,7 +15,7 @@ mbbox_points = get_mbbox(points)
 mbbox, = axes.plot(*tuple(zip(*(mbbox_points + (mbbox_points[0],)))), 'bs--')
 
 while True:
-    points = rotate_points(points, center, 0.01 * numpy.pi)
+    points = rotate(points, 0.01 * numpy.pi, refpoint=center)
     poly.set_xy(points)
     sbbox_points = get_sbbox(points)
     sbx,sby = tuple(zip(*(sbbox_points+(sbbox_points[0],))))
@@ -0,0 +1,294 @@
+"""
+Motor calibration that runs inside the control loop, drift detection and the calibration profile on disk\n
+A profile is a dict of response_time (seconds), speed_factors ({'left_min', 'left_max', 'right_min', 'right_max'}),
+speed_factor_pairs (list of (left, right) motor values that drive straight) and optionally iron_calibration
+(heading_filter.IronCalibration.to_dict()). It is saved as JSON together with PROFILE_VERSION
+"""
+import copy
+import json
+import math
+import os
+import numpy
+
+PROFILE_VERSION = 1
+
+
+def save_profile(path, profile):
+    """
+    Saves the profile to path, replacing the old one in one step so it is never left half written: the new one
+    is written to a temporary file and on disk before it takes the place of the old one
+    """
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as file:
+        json.dump(dict(profile, version=PROFILE_VERSION), file, indent=2)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+def load_profile(path):
+    """
+    Returns the profile saved at path, or None if there is none, it was saved with another PROFILE_VERSION
+    or it cannot be read, e.g. cut short by a power cut, so that the car calibrates again
+    """
+    try:
+        with open(path) as file:
+            profile = json.load(file)
+        if profile.pop('version', None) != PROFILE_VERSION:
+            return None
+        profile['response_time'] = float(profile['response_time'])
+        profile['speed_factors'] = {name: float(profile['speed_factors'][name])
+                                    for name in ('left_min', 'left_max', 'right_min', 'right_max')}
+        profile['speed_factor_pairs'] = [(float(left), float(right)) for left, right in profile['speed_factor_pairs']]
+        if 'iron_calibration' in profile:
+            iron = profile['iron_calibration']
+            if (numpy.asarray(iron['offset'], dtype=numpy.float64).shape != (2,)
+                    or numpy.asarray(iron['matrix'], dtype=numpy.float64).shape != (2, 2)):
+                raise ValueError('iron_calibration is not a 2D calibration')
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+    return profile
+
+
+class Calibrator:
+    """
+    The motor calibration as an incremental state machine\n
+    update(pose, dt) takes one step and returns the (left, right) motor values to set, so it runs as the controller
+    of the control loop without ever blocking it. The heading changes it waits for are changes of pose.theta
+    above angle_threshold (radians). The phases run in order:
+    'response' measures the time from starting a motor to a heading change (response_time),
+    'minimum' searches the smallest value that still turns each motor and
+    'pairs' finds the left and right values that drive straight at every speed from 1 down to the minimum,
+    forward and backward: a pair drives straight when the heading changes by at most pair_threshold (radians,
+    a quarter of angle_threshold by default) in pair_time seconds.
+    profile holds the results, starting from the profile given. done is set when finished and finished is set with it.
+    After budget seconds the calibration gives up and sets failed too
+    """
+    PHASES = ('response', 'minimum', 'pairs')
+
+    def __init__(self, clock, profile, angle_threshold=math.radians(5), phases=PHASES, speed_step=0.02, budget=120,
+                 pair_time=1.0, pair_threshold=None):
+        self.clock = clock
+        self.profile = copy.deepcopy(profile)
+        self.angle_threshold = angle_threshold
+        self.speed_step = speed_step
+        self.pair_time = pair_time
+        self.pair_threshold = angle_threshold / 4 if pair_threshold is None else pair_threshold
+        self.budget = budget
+        self.done = False
+        self.failed = False
+        self.finished = clock.Event()
+        self._steps = self._run(phases)
+        self._begin = None
+        self._now = None
+        self._theta = None
+
+    def update(self, pose, dt):
+        if self.done:
+            return 0.0, 0.0
+        self._now, self._theta = self.clock(), pose.theta
+        if self._begin is None:
+            self._begin = self._now
+        try:
+            if self._now - self._begin > self.budget:
+                raise TimeoutError
+            return next(self._steps)
+        except StopIteration:
+            pass
+        except TimeoutError:
+            self.failed = True
+        self.done = True
+        self.finished.set()
+        return 0.0, 0.0
+
+    def stop(self):
+        """ Gives up, e.g. when the car is needed for something else """
+        if not self.done:
+            self.failed = self.done = True
+            self.finished.set()
+
+    def _hold(self, values, seconds, watch=True, threshold=None):
+        """
+        Keeps the motors at values for seconds or, if watching, until the heading changes by more than threshold
+        (angle_threshold by default), returns the change or 0.0
+        """
+        end = self._now + seconds
+        reference = self._theta
+        threshold = self.angle_threshold if threshold is None else threshold
+        while True:
+            change = math.remainder(self._theta - reference, 2 * math.pi)
+            if watch and abs(change) > threshold:
+                return change
+            if self._now >= end:
+                return 0.0
+            yield values
+
+    def _run(self, phases):
+        for phase in phases:
+            yield from getattr(self, '_' + phase)()
+
+    def _response(self):
+        times = []
+        for motor in ((0.0, 1.0), (1.0, 0.0)):  # Right, then left
+            for i in range(3):
+                begin = self._now
+                yield from self._hold(motor, math.inf)
+                times.append(self._now - begin)
+                self.profile['response_time'] = max(times)
+                yield from self._hold((0.0, 0.0), self.profile['response_time'], watch=False)
+
+    def _minimum(self):
+        factors = self.profile['speed_factors']
+        response_time = self.profile['response_time']
+        for side, index in (('right', 1), ('left', 0)):
+            upper, lower = factors[side + '_max'], 0.0
+            for i in range(5):
+                middle = (upper + lower) / 2
+                values = (middle, 0.0) if index == 0 else (0.0, middle)
+                yield from self._hold(values, response_time * 5, watch=False)  # Get up to speed
+                if (yield from self._hold(values, response_time * 5)):
+                    upper = middle
+                else:
+                    lower = middle
+            factors[side + '_min'] = upper  # The safer boundary
+            yield from self._hold((0.0, 0.0), response_time, watch=False)
+
+    def _pairs(self):
+        factors = self.profile['speed_factors']
+        response_time = self.profile['response_time']
+        pairs = []
+        for speed in numpy.arange(1, max(factors['right_min'], factors['left_min']), -0.1):
+            for sign in (1, -1):
+                left = right = float(speed)
+                # The heading lags behind, let the turn of the last direction die out before watching it
+                yield from self._hold((sign * left, sign * right), response_time, watch=False)
+                while left > 0 and right > 0:
+                    # Long enough for a few percent of mismatch to turn the car measurably
+                    change = yield from self._hold((sign * left, sign * right), self.pair_time, threshold=self.pair_threshold)
+                    if not change:
+                        pairs.append((sign * left, sign * right))
+                        break
+                    # Slow down the faster wheel: the left one when turning clockwise forward or counter clockwise backward
+                    if (change < 0) == (sign > 0):
+                        left -= self.speed_step
+                    else:
+                        right -= self.speed_step
+        self.profile['speed_factor_pairs'] = pairs
+        if pairs:
+            left, right = zip(*pairs)
+            factors['left_max'], factors['right_max'] = max(left), max(right)
+
+
+class DriftMonitor:
+    """
+    Watches the controller for motors that no longer match their calibration\n
+    With matched motors a controller driving forward steers both ways about equally, so the mean of
+    (right - left) / 2 stays near zero. add(time, command) keeps that mean over the last time_constant seconds
+    of driving forward. drifted is set once it is beyond threshold after at least time_constant seconds of it
+    """
+
+    def __init__(self, threshold=0.15, time_constant=10.0):
+        self.threshold = threshold
+        self.time_constant = time_constant
+        self.reset()
+
+    def reset(self):
+        self.bias = 0.0
+        self.driving = 0.0  # Seconds driven forward
+        self.drifted = False
+        self._time = None
+
+    def add(self, time, command):
+        dt = 0.0 if self._time is None else max(time - self._time, 0.0)
+        self._time = time
+        left, right = command
+        if left <= 0 or right <= 0:
+            return
+        self.driving += dt
+        self.bias += -math.expm1(-dt / self.time_constant) * ((right - left) / 2 - self.bias)
+        self.drifted = self.driving >= self.time_constant and abs(self.bias) > self.threshold
+
+
+class SpeedTable:
+    """
+    Motor values for commanded wheel speeds, interpolated from the calibrated speed_factor_pairs\n
+    Every pair drives straight at the speed of its faster motor value, its nominal speed. The minimum speed factors
+    are the slowest pair. A command magnitude in (0, 1] is mapped linearly onto the nominal speeds from the slowest
+    to the fastest pair of its direction and each motor gets the value interpolated between the pairs around it.
+    The results for size steps of each direction are precomputed in table, so lookup() is one index per wheel.
+    A direction without pairs is the linear scaling between the minimum and maximum speed factors, pairs() leaves
+    its made up knot out so it is never saved as calibrated\n
+    refine() adjusts the pairs while driving: a controller that keeps asking one wheel to go faster than the other
+    to hold the heading from the odometry is compensating for that motor being weak at this speed.
+    The faster motor of a pair stays at its nominal speed and the slowest pair is not refined
+    """
+
+    def __init__(self, pairs, speed_factors, size=1000):
+        self.size = size
+        self.table = numpy.zeros((2 * size + 1, 2))  # Row size + i is the command i / size, columns left and right
+        low = (speed_factors['left_min'], speed_factors['right_min'])
+        high = (speed_factors['left_max'], speed_factors['right_max'])
+        self._knots = {}  # Direction: (nominal speeds, (K, 2) motor value magnitudes) of the slowest pair and the pairs
+        self._calibrated = {}  # Direction: whether its knots after the slowest one are calibrated pairs
+        for sign in (1, -1):
+            chosen = sorted((max(abs(l), abs(r)), abs(l), abs(r)) for l, r in pairs if l * sign > 0 and r * sign > 0)
+            chosen = [pair for pair in chosen if pair[0] > max(low)]
+            self._calibrated[sign] = bool(chosen)
+            chosen = chosen or [(max(high), high[0], high[1])]
+            knots = numpy.array([(max(low),) + low] + chosen, dtype=numpy.float64)
+            self._knots[sign] = (knots[:, 0], knots[:, 1:])
+            self._fill(sign, 1, size + 1)
+
+    def lookup(self, command):
+        """ Returns the (left, right) motor values for (left, right) commands in [-1, 1] """
+        size = self.size
+        left = min(max(int(round(command[0] * size)), -size), size)
+        right = min(max(int(round(command[1] * size)), -size), size)
+        return self.table.item(size + left, 0), self.table.item(size + right, 1)
+
+    def refine(self, command, dt, rate=0.5, max_steering=0.3):
+        """
+        Moves the pairs at the speed of the faster wheel by rate * dt of the steering in it, call it every control tick
+        with the controller's command. Only commands driving in one direction and steering (half the difference)
+        by at most max_steering count, larger steering is turning rather than holding the heading
+        """
+        left, right = command
+        steering = (abs(right) - abs(left)) / 2
+        if left * right <= 0 or abs(steering) > max_steering:
+            return
+        sign = 1 if left > 0 else -1
+        nominals, values = self._knots[sign]
+        nominal = nominals[0] + min(max(abs(left), abs(right)), 1.0) * (nominals[-1] - nominals[0])
+        upper = min(max(int(numpy.searchsorted(nominals, nominal)), 1), len(nominals) - 1)
+        weight = (nominal - nominals[upper - 1]) / (nominals[upper] - nominals[upper - 1]) if nominals[upper] > nominals[upper - 1] else 1.0
+        for knot, share in ((upper - 1, 1 - weight), (upper, weight)):
+            if knot == 0:
+                continue  # The minimum speed factors stay as calibrated
+            step = rate * dt * steering * share
+            values[knot] *= (1 - step, 1 + step)
+            values[knot] *= nominals[knot] / values[knot].max()  # The faster motor stays at the nominal speed
+        first = upper - 2 if upper > 1 else 0
+        last = min(upper + 1, len(nominals) - 1)
+        span = nominals[-1] - nominals[0]
+        begin = int(numpy.ceil((nominals[first] - nominals[0]) / span * self.size)) if span > 0 else 1
+        end = int((nominals[last] - nominals[0]) / span * self.size) + 1 if span > 0 else self.size + 1
+        self._fill(sign, max(begin, 1), min(end, self.size + 1))
+
+    def pairs(self):
+        """ The calibrated (left, right) pairs of the table as refined, forward and backward, for the calibration profile """
+        pairs = []
+        for sign in (1, -1):
+            if not self._calibrated[sign]:
+                continue
+            nominals, values = self._knots[sign]
+            pairs += [(sign * float(left), sign * float(right)) for left, right in values[1:]]
+        return pairs
+
+    def _fill(self, sign, begin, end):
+        """ Interpolates the table rows of the commands begin / size to (end - 1) / size in the direction """
+        nominals, values = self._knots[sign]
+        commands = numpy.arange(begin, end) / self.size
+        speeds = nominals[0] + commands * (nominals[-1] - nominals[0])
+        rows = self.size + sign * numpy.arange(begin, end)
+        for column in (0, 1):
+            self.table[rows, column] = sign * numpy.interp(speeds, nominals, values[:, column])
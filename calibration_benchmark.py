@@ -0,0 +1,58 @@
+from calibration import *
+from controller import scale_command
+from geometry_2d_benchmark import best_time
+
+speed_factors = {'left_min': 0.2, 'left_max': 0.8, 'right_min': 0.2, 'right_max': 1.0}
+pairs = [(0.8 * s, s) for s in (1.0, 0.9, 0.8, 0.7, 0.6, 0.5, 0.4, 0.3)]
+pairs += [(-left, -right) for left, right in pairs]
+
+
+def bench_speed_table():
+    table = SpeedTable(pairs, speed_factors)
+    command = (0.42, 0.57)
+    print('SpeedTable build {:.1f}us  lookup {:.2f}us  refine {:.1f}us  scale_command {:.2f}us'.format(
+        best_time(lambda: SpeedTable(pairs, speed_factors)) * 1e6, best_time(lambda: table.lookup(command)) * 1e6,
+        best_time(lambda: table.refine(command, 0.05)) * 1e6, best_time(lambda: scale_command(command, speed_factors)) * 1e6))
+
+
+def bench_drift_recalibration(gains=(0.7, 1.0), legs=8):
+    """
+    Calibrates a simulated car, weakens its left motor by gains and drives legs of 2m until the drift monitor
+    starts a background calibration of the pairs, which has to finish with pairs for the weaker motor.
+    speed_table.refine() takes up most of such a bias while driving, so the monitor is more sensitive than the default
+    """
+    import math
+    from hardware_control import Car
+    from simulation import Simulator
+    simulator = Simulator()
+    car = Car(simulator, profile_path=None)
+    calibrator = car.calibrate()
+    car.turn_on()
+    while not calibrator.finished.is_set():
+        car.clock.sleep(1)
+    fastest = lambda: max(car.speed_table.pairs(), key=sum)
+    before = fastest()
+    car.drift_monitor = DriftMonitor(threshold=0.05)
+    simulator.plant.gains = gains
+    begin = car.clock()
+    for leg in range(legs):
+        car.move_to_point(car.current_point[0] + 2 * math.cos(leg), car.current_point[1] + 2 * math.sin(leg))
+        car.clock.sleep(8)
+        if car.calibrator is not None:
+            break
+    recalibration = car.calibrator
+    assert recalibration is not None, 'no recalibration after {} legs with gains {}'.format(legs, gains)
+    started = car.clock() - begin
+    while not recalibration.finished.is_set():
+        car.clock.sleep(1)
+    assert not recalibration.failed, 'the recalibration gave way or timed out'
+    after, took = fastest(), car.clock() - begin - started
+    car.turn_off()
+    assert after[0] / after[1] > before[0] / before[1], 'the pairs do not favour the weaker left motor'
+    print('drift with gains {}: recalibrating after {:.0f}s, took {:.0f}s  fastest pair ({:.2f}, {:.2f}) -> ({:.2f}, {:.2f})'.format(
+        gains, started, took, *before, *after))
+
+
+if __name__ == '__main__':
+    bench_speed_table()
+    bench_drift_recalibration()
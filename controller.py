@@ -0,0 +1,264 @@
+import collections
+import math
+import time
+from geometry_2d import get_angle, signed_angle_dif
+from timing import REAL_CLOCK
+
+OverrunReport = collections.namedtuple('OverrunReport', 'time duration lateness')
+OverrunReport.__doc__ = """ A tick that took longer than the period, times in seconds """
+
+
+class RunningStats:
+    """ Count, mean, standard deviation and maximum of a stream of values without storing them (Welford) """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.maximum = -math.inf
+        self._m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self.maximum = max(self.maximum, value)
+
+    @property
+    def std(self):
+        return math.sqrt(self._m2 / self.count) if self.count else 0.0
+
+    def to_dict(self):
+        return {'count': self.count, 'mean': self.mean, 'std': self.std,
+                'max': self.maximum if self.count else 0.0}
+
+
+class Scheduler:
+    """
+    Runs a control law at a fixed rate on a monotonic deadline loop\n
+    Every tick calls command = controller.update(sense(), dt) and actuate(command).
+    notify() wakes the loop as soon as new sensor data arrives, but never sooner than min_interval after the last tick.
+    The next deadline is then one period after that tick. Deadlines that were missed are skipped and counted,
+    instead of running a burst of ticks to catch up\n
+    The lateness of deadline ticks (jitter), the time between ticks and the real time each tick took are tracked.
+    A tick longer than the period is an overrun: it is kept in overruns and passed to on_overrun\n
+    clock is a timing clock, simulation.run_headless can also drive tick() with a VirtualClock instead of run()
+    """
+
+    def __init__(self, period, controller, sense, actuate, min_interval=None, clock=REAL_CLOCK, on_overrun=None):
+        self.period = period
+        self.controller = controller
+        self.sense = sense
+        self.actuate = actuate
+        self.min_interval = period / 4 if min_interval is None else min_interval
+        self.clock = clock
+        self.on_overrun = on_overrun
+        self.lateness = RunningStats()
+        self.intervals = RunningStats()
+        self.durations = RunningStats()
+        self.overruns = collections.deque(maxlen=100)
+        self.missed = 0  # Deadlines skipped because a tick ran late
+        self.event_ticks = 0  # Ticks started by notify()
+        self.last_tick = -math.inf
+        self._wake = clock.Event()
+        self._running = False
+
+    def notify(self):
+        """ Wakes the loop for new sensor data, safe to call from any thread """
+        self._wake.set()
+
+    def run(self):
+        """ Runs the loop in the calling thread until stop() """
+        self._running = True
+        deadline = self.clock()
+        while self._running:
+            timeout = deadline - self.clock()
+            woken = timeout > 0 and self._wake.wait(timeout)
+            if woken:
+                self._wake.clear()
+                early = self.last_tick + self.min_interval - self.clock()
+                if early > 0:
+                    # Too soon after the last tick, run at min_interval unless the deadline comes first
+                    if early >= deadline - self.clock():
+                        continue
+                    self.clock.sleep(early)
+            now = self.clock()
+            if woken:
+                self.tick(now)
+                deadline = now + self.period
+            else:
+                self.tick(now, deadline)
+                deadline = self.next_deadline(deadline, now)
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+
+    def tick(self, now, deadline=None):
+        """ Runs one control step at time now, deadline is the time it was scheduled for or None for a notify() """
+        begin = time.perf_counter()
+        if deadline is None:
+            self.event_ticks += 1
+        else:
+            self.lateness.add(now - deadline)
+        dt = now - self.last_tick if self.last_tick > -math.inf else self.period
+        if self.last_tick > -math.inf:
+            self.intervals.add(dt)
+        self.last_tick = now
+        command = self.controller.update(self.sense(), dt)
+        if command is not None:
+            self.actuate(command)
+        duration = time.perf_counter() - begin
+        self.durations.add(duration)
+        if duration > self.period:
+            report = OverrunReport(now, duration, 0.0 if deadline is None else now - deadline)
+            self.overruns.append(report)
+            if self.on_overrun is not None:
+                self.on_overrun(report)
+
+    def next_deadline(self, deadline, now):
+        """ The deadline after a deadline tick, skipping the ones already missed """
+        deadline += self.period
+        if deadline <= now:
+            missed = int((now - deadline) // self.period) + 1
+            self.missed += missed
+            deadline += missed * self.period
+        return deadline
+
+    def statistics(self):
+        return {'lateness': self.lateness.to_dict(), 'intervals': self.intervals.to_dict(),
+                'durations': self.durations.to_dict(), 'overruns': len(self.overruns),
+                'missed': self.missed, 'event_ticks': self.event_ticks}
+
+
+# -----------------------Controllers-----------------------
+# A controller has update(pose, dt) returning (left, right) wheel commands in [-1, 1] or None to leave the motors,
+# pose is an odometry.Pose with theta in radians. Paths are lists of (x, y) points visited in order
+
+
+class PID:
+    """ PID on an error with the output clamped to [-limit, limit], the integral stops growing while clamped """
+
+    def __init__(self, kp, ki=0.0, kd=0.0, limit=1.0):
+        self.kp, self.ki, self.kd = kp, ki, kd
+        self.limit = limit
+        self.reset()
+
+    def reset(self):
+        self.integral = 0.0
+        self._previous = None
+
+    def update(self, error, dt):
+        derivative = (error - self._previous) / dt if self._previous is not None and dt > 0 else 0.0
+        self._previous = error
+        integral = self.integral + error * dt
+        output = self.kp * error + self.ki * integral + self.kd * derivative
+        if abs(output) <= self.limit:
+            self.integral = integral
+        return max(-self.limit, min(self.limit, output))
+
+
+class PointController:
+    """
+    Drives to the points of the path one after the other like speed_control did:
+    turns in place while the heading error is above turn_threshold (radians), otherwise drives at speed
+    and steers with the PID on the heading error. A point is reached within arrive_distance.
+    With an empty path it turns to heading if one is set and then stops\n
+    mode is what the last update decided, one of MODES: 'idle', 'turn' in place towards the next point, 'drive'
+    or 'rotate' to heading. error is the heading error it steered on (radians) and turn the PID output
+    """
+    MODES = ('idle', 'turn', 'drive', 'rotate')
+
+    def __init__(self, pid=None, speed=1.0, turn_threshold=math.radians(20), arrive_distance=0.05,
+                 heading_tolerance=math.radians(5)):
+        self.pid = PID(1.5, 0.0, 0.1) if pid is None else pid
+        self.speed = speed
+        self.turn_threshold = turn_threshold
+        self.arrive_distance = arrive_distance
+        self.heading_tolerance = heading_tolerance
+        self.path = []
+        self.heading = None
+        self.mode = 'idle'
+        self.error = 0.0
+        self.turn = 0.0
+
+    def set_path(self, points, heading=None):
+        self.path = [tuple(p) for p in points]
+        self.heading = heading
+        self.pid.reset()
+
+    def update(self, pose, dt):
+        while self.path and math.hypot(self.path[0][0] - pose.x, self.path[0][1] - pose.y) < self.arrive_distance:
+            self.path.pop(0)
+        if self.path:
+            error = signed_angle_dif(get_angle(self.path[0], (pose.x, pose.y)), pose.theta, degrees=False)
+        elif self.heading is not None:
+            error = signed_angle_dif(self.heading, pose.theta, degrees=False)
+            if abs(error) < self.heading_tolerance:
+                self.heading = None
+                self.mode, self.error, self.turn = 'idle', error, 0.0
+                return 0.0, 0.0
+        else:
+            self.mode, self.error, self.turn = 'idle', 0.0, 0.0
+            return 0.0, 0.0
+        turn = self.pid.update(error, dt)
+        self.error, self.turn = error, turn
+        if not self.path or abs(error) > self.turn_threshold:
+            self.mode = 'turn' if self.path else 'rotate'
+            return -turn, turn
+        self.mode = 'drive'
+        return _clamp(self.speed - turn), _clamp(self.speed + turn)
+
+
+class PurePursuit:
+    """
+    Follows the path by steering along the arc to the first path point at least lookahead (m) away,
+    track_width is the distance between the wheels. Stops within arrive_distance of the last point
+    and turns in place when the goal point is behind the car
+    """
+
+    def __init__(self, lookahead=0.2, speed=1.0, track_width=0.16, arrive_distance=0.05):
+        self.lookahead = lookahead
+        self.speed = speed
+        self.track_width = track_width
+        self.arrive_distance = arrive_distance
+        self.path = []
+
+    def set_path(self, points):
+        self.path = [tuple(p) for p in points]
+
+    def update(self, pose, dt):
+        while len(self.path) > 1 and math.hypot(self.path[0][0] - pose.x, self.path[0][1] - pose.y) < self.lookahead:
+            self.path.pop(0)
+        if not self.path:
+            return 0.0, 0.0
+        goal = self.path[0]
+        distance = math.hypot(goal[0] - pose.x, goal[1] - pose.y)
+        if len(self.path) == 1 and distance < self.arrive_distance:
+            self.path.pop()
+            return 0.0, 0.0
+        alpha = signed_angle_dif(get_angle(goal, (pose.x, pose.y)), pose.theta, degrees=False)
+        if abs(alpha) > math.pi / 2:
+            turn = self.speed if alpha > 0 else -self.speed
+            return -turn, turn
+        curvature = 2 * math.sin(alpha) / max(distance, 1e-9)
+        left = 1 - curvature * self.track_width / 2
+        right = 1 + curvature * self.track_width / 2
+        scale = self.speed / max(abs(left), abs(right))
+        return left * scale, right * scale
+
+
+def scale_command(command, speed_factors):
+    """
+    Maps (left, right) commands in [-1, 1] to motor values between the minimum and maximum speed factors
+    of each side, keeping the sign. Commands within 1e-3 of zero stop the motor
+    """
+    values = []
+    for value, side in zip(command, ('left', 'right')):
+        low, high = speed_factors[side + '_min'], speed_factors[side + '_max']
+        values.append(0.0 if abs(value) < 1e-3 else math.copysign(low + abs(value) * (high - low), value))
+    return tuple(values)
+
+
+def _clamp(value, limit=1.0):
+    return max(-limit, min(limit, value))
@@ -1,3 +1,5 @@
+import functools
+import math
 import numpy
 
 # -----------------------Essential Transformations-----------------------
@@ -11,13 +13,16 @@ def move(points, x, y, absolute=False, refpoint=None):
     If absolute = False:
     adds x,y to all the points
     (Ignores the reference point)\n
-    Format for points: ((x1,y1),(x2,y2),(x3,y3))
+    Format for points: ((x1,y1),(x2,y2),(x3,y3)), an (N, 2) numpy.ndarray or a Polygon
+    (an ndarray input returns an ndarray and a Polygon returns a new Polygon)
     """
     if absolute:
         if refpoint is None:
             refpoint = get_centeroid(points)
         x = x - refpoint[0]
         y = y - refpoint[1]
+    if isinstance(points, (numpy.ndarray, Polygon)):
+        return _transform_array(points, _translation_matrix(x, y))
     rpoints = []
     for px, py in points:
         rx = px + x
@@ -34,7 +39,8 @@ def scale(points, x, y, absolute=False, refpoint=None):
     If absolute = False:
     Uses x and y as factors for scaling width and height respectively
     If the reference point is None the centeroid of the points will be used as reference\n
-    Format for points: ((x1,y1),(x2,y2),(x3,y3))
+    Format for points: ((x1,y1),(x2,y2),(x3,y3)), an (N, 2) numpy.ndarray or a Polygon
+    (an ndarray input returns an ndarray and a Polygon returns a new Polygon)
     """
     if refpoint is None:
         refpoint = get_centeroid(points)
@@ -42,6 +48,8 @@ def scale(points, x, y, absolute=False, refpoint=None):
         xlength, ylength = get_bbox_size(points)
         x = x / xlength
         y = y / ylength
+    if isinstance(points, (numpy.ndarray, Polygon)):
+        return _transform_array(points, _scaling_matrix(x, y, refpoint))
     rpoints = []
     for px, py in points:
         rx = (px-refpoint[0]) * x + refpoint[0]
@@ -62,64 +70,318 @@ def rotate(points, angle, absolute=False, refpoint=None, refline=None):
     rotates the point counter clock wise a certain amount around a reference point
     If the reference point is None the centeroid of the points will be used as reference
     (Ignores the reference line)\n
-    Format for points: ((x1,y1),(x2,y2),(x3,y3))
+    Format for points: ((x1,y1),(x2,y2),(x3,y3)), an (N, 2) numpy.ndarray or a Polygon
+    (an ndarray input returns an ndarray and a Polygon returns a new Polygon)
     """
     if refpoint is None:
         refpoint = get_centeroid(points)
     if absolute:
         angle = angle - get_angle(*refline)
+    if isinstance(points, (numpy.ndarray, Polygon)):
+        return _transform_array(points, _rotation_matrix(angle, refpoint))
+    cos, sin = numpy.cos(angle), numpy.sin(angle)
     rpoints = []
     for px, py in points:
-        rx = numpy.cos(angle) * (px - refpoint[0]) - numpy.sin(angle) * (py - refpoint[1]) + refpoint[0]
-        ry = numpy.sin(angle) * (px - refpoint[0]) + numpy.cos(angle) * (py - refpoint[1]) + refpoint[1]
+        rx = cos * (px - refpoint[0]) - sin * (py - refpoint[1]) + refpoint[0]
+        ry = sin * (px - refpoint[0]) + cos * (py - refpoint[1]) + refpoint[1]
         rpoints += [(rx, ry)]
     return tuple(rpoints)
 
+
+# -----------------------Affine matrices-----------------------
+
+
+def _translation_matrix(x, y):
+    """ Returns the 3x3 homogeneous matrix that adds x,y to a point """
+    return numpy.array([[1.0, 0.0, x],
+                        [0.0, 1.0, y],
+                        [0.0, 0.0, 1.0]])
+
+
+def _scaling_matrix(x, y, refpoint=(0, 0)):
+    """ Returns the 3x3 homogeneous matrix that scales by x,y around the reference point """
+    rx, ry = refpoint
+    return numpy.array([[x, 0.0, rx - x * rx],
+                        [0.0, y, ry - y * ry],
+                        [0.0, 0.0, 1.0]])
+
+
+def _rotation_matrix(angle, refpoint=(0, 0)):
+    """ Returns the 3x3 homogeneous matrix that rotates counter clock wise around the reference point """
+    c = numpy.cos(angle)
+    s = numpy.sin(angle)
+    rx, ry = refpoint
+    return numpy.array([[c, -s, rx - c * rx + s * ry],
+                        [s, c, ry - s * rx - c * ry],
+                        [0.0, 0.0, 1.0]])
+
+
+def _apply_matrix(points, matrix):
+    """
+    Applies a 3x3 homogeneous matrix to an (N, 2) array of points in one pass\n
+    Returns a new (N, 2) float64 array
+    """
+    points = numpy.asarray(points, dtype=numpy.float64)
+    return points @ matrix[:2, :2].T + matrix[:2, 2]
+
+
+def _transform_array(points, matrix):
+    """ Applies the matrix to an ndarray or a Polygon and returns the same type """
+    if isinstance(points, Polygon):
+        return Polygon(_apply_matrix(points.points, matrix), copy=False)
+    return _apply_matrix(points, matrix)
+
+
+_TRANSFORM_CACHE_SIZE = 32  # Composed transforms remembered per Transform
+
+
+class Transform:
+    """
+    An affine transformation stored as a 3x3 homogeneous matrix\n
+    Chains built with then() collapse into a single matrix, so applying an
+    arbitrarily long chain costs one matrix multiply per call.
+    Transforms are immutable; composed and inverted matrices are cached on the instance.\n
+    Example: Transform.scale(2, 2, refpoint=(0, 0)).then(Transform.move(1, 0)).apply(points)
+    """
+    __slots__ = ('matrix', '_key', '_composed', '_inverse')
+
+    def __init__(self, matrix=None):
+        if matrix is None:
+            matrix = numpy.identity(3)
+        matrix = numpy.array(matrix, dtype=numpy.float64)
+        if matrix.shape != (3, 3):
+            raise ValueError('Transform matrix must be 3x3, got {}'.format(matrix.shape))
+        matrix.setflags(write=False)
+        self.matrix = matrix
+        self._key = matrix.tobytes()
+        self._composed = {}
+        self._inverse = None
+
+    @classmethod
+    def move(cls, x, y, absolute=False, refpoint=None, points=None):
+        """
+        Same semantics as move()
+        If absolute = True and the reference point is None the centeroid of points is used as reference
+        """
+        if absolute:
+            refpoint = _default_refpoint(refpoint, points)
+            x = x - refpoint[0]
+            y = y - refpoint[1]
+        return cls(_translation_matrix(x, y))
+
+    @classmethod
+    def scale(cls, x, y, absolute=False, refpoint=None, points=None):
+        """
+        Same semantics as scale()
+        points is needed when absolute = True or when the reference point is None
+        """
+        refpoint = _default_refpoint(refpoint, points)
+        if absolute:
+            if points is None:
+                raise ValueError('points are needed to scale to an absolute size')
+            xlength, ylength = get_bbox_size(points)
+            x = x / xlength
+            y = y / ylength
+        return cls(_scaling_matrix(x, y, refpoint))
+
+    @classmethod
+    def rotate(cls, angle, absolute=False, refpoint=None, refline=None, points=None):
+        """
+        Same semantics as rotate(), angle in radians
+        If the reference point is None the centeroid of points is used as reference
+        """
+        refpoint = _default_refpoint(refpoint, points)
+        if absolute:
+            angle = angle - get_angle(*refline)
+        return cls(_rotation_matrix(angle, refpoint))
+
+    def then(self, other):
+        """ Returns the transformation that applies self first and then other """
+        composed = self._composed.get(other._key)
+        if composed is None:
+            composed = Transform(other.matrix @ self.matrix)
+            if len(self._composed) >= _TRANSFORM_CACHE_SIZE:
+                self._composed.clear()
+            self._composed[other._key] = composed
+        return composed
+
+    def inverse(self):
+        """ Returns the transformation that undoes self """
+        if self._inverse is None:
+            self._inverse = Transform(numpy.linalg.inv(self.matrix))
+            self._inverse._inverse = self
+        return self._inverse
+
+    def apply(self, points):
+        """
+        Applies the transformation to the points
+        An (N, 2) numpy.ndarray returns an ndarray, a Polygon returns a new Polygon
+        and anything else returns a tuple of (x, y) tuples
+        """
+        if isinstance(points, (numpy.ndarray, Polygon)):
+            return _transform_array(points, self.matrix)
+        return tuple(map(tuple, _apply_matrix(points, self.matrix).tolist()))
+
+    def __eq__(self, other):
+        return isinstance(other, Transform) and self._key == other._key
+
+    def __hash__(self):
+        return hash(self._key)
+
+    def __repr__(self):
+        return 'Transform({})'.format(self.matrix.tolist())
+
+
+def _default_refpoint(refpoint, points):
+    if refpoint is not None:
+        return refpoint
+    if points is None:
+        raise ValueError('Either a reference point or the points are needed')
+    return get_centeroid(points)
+
+# -----------------------Polygon-----------------------
+
+
+class Polygon:
+    """
+    A closed shape stored as one contiguous (N, 2) float64 array (the closing point is not repeated)\n
+    Area, signed area, centeroid, straight bbox, perimeter and convex hull are computed on first use
+    and cached until the points are changed through set_points(), __setitem__ or transform().
+    The module's functions take a Polygon anywhere they take points and use the cache,
+    numpy.asarray(polygon) returns the points without copying
+    """
+    __slots__ = ('_points', '_cache')
+
+    def __init__(self, points, copy=True):
+        self._points = None
+        self._cache = {}
+        self.set_points(points, copy)
+
+    @property
+    def points(self):
+        """ Read only (N, 2) view of the points """
+        return self._points
+
+    def set_points(self, points, copy=True):
+        points = numpy.array(points, dtype=numpy.float64, copy=copy or None, order='C').reshape(-1, 2)
+        if len(points) > 1 and numpy.array_equal(points[0], points[-1]):
+            points = points[:-1]
+        points.setflags(write=False)
+        self._points = points
+        self._cache.clear()
+
+    def transform(self, transform):
+        """ Applies a Transform to the points in place """
+        self.set_points(_apply_matrix(self._points, transform.matrix), copy=False)
+
+    def __setitem__(self, index, point):
+        points = self._points.copy()
+        points[index] = point
+        self.set_points(points, copy=False)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(map(tuple, self._points[index].tolist()))
+        return tuple(self._points[index].tolist())
+
+    def __len__(self):
+        return len(self._points)
+
+    def __iter__(self):
+        return iter(map(tuple, self._points.tolist()))
+
+    def __array__(self, dtype=None, copy=None):
+        if copy or (dtype is not None and dtype != self._points.dtype):
+            return numpy.array(self._points, dtype=dtype)
+        return self._points
+
+    def __repr__(self):
+        return 'Polygon({})'.format(self._points.tolist())
+
+    def _cached(self, name, compute):
+        value = self._cache.get(name)
+        if value is None:
+            value = self._cache[name] = compute()
+        return value
+
+    @property
+    def signed_area(self):
+        """ Positive for counter clock wise points """
+        def compute():
+            x, y = self._points[:, 0], self._points[:, 1]
+            return 0.5 * float((x * numpy.roll(y, -1) - numpy.roll(x, -1) * y).sum())
+        return self._cached('signed_area', compute)
+
+    @property
+    def area(self):
+        return abs(self.signed_area)
+
+    @property
+    def centeroid(self):
+        return self._cached('centeroid', lambda: tuple(float(c) for c in _array_centeroid(self._points)))
+
+    @property
+    def extents(self):
+        """ (xmin, ymin, xmax, ymax) """
+        def compute():
+            (xmin, ymin), (xmax, ymax) = self._points.min(axis=0), self._points.max(axis=0)
+            return float(xmin), float(ymin), float(xmax), float(ymax)
+        return self._cached('extents', compute)
+
+    @property
+    def sbbox(self):
+        xmin, ymin, xmax, ymax = self.extents
+        return (xmin, ymin), (xmin, ymax), (xmax, ymax), (xmax, ymin)
+
+    @property
+    def perimeter(self):
+        def compute():
+            edges = numpy.roll(self._points, -1, axis=0) - self._points
+            return float(numpy.hypot(edges[:, 0], edges[:, 1]).sum())
+        return self._cached('perimeter', compute)
+
+    @property
+    def convex_hull(self):
+        """ (H, 2) read only array, counter clock wise """
+        def compute():
+            hull = _convex_hull(self._points)
+            hull.setflags(write=False)
+            return hull
+        return self._cached('convex_hull', compute)
+
 # -----------------------Essential calculations-----------------------
 
 
-def get_angle(p, o=(0, 0), principal=True):
+def get_angle(p, o=(0, 0), principal=True, degrees=False):
     """
     Calculates the angle the point makes with an origin
-    The angle is in radians counter clock wise from the positive x-axis
-    """
-    x = p[0] - o[0]
-    y = p[1] - o[1]
-    # Check if the point lies on an axis
-    if x == 0 and y == 0:
-        return 0
-    if x == 0:
-        if y > 0:
-            return numpy.pi * 1/2
-        else:
-            return numpy.pi * 3/2
-    elif y == 0:
-        if x > 0:
-            return 0
-        else:
-            return numpy.pi
-    theta = numpy.arctan(abs(y) / abs(x))
-    # Check the point's quarter
-    if x > 0 and y > 0:  # 1st
-        return theta
-    elif x < 0 and y > 0:  # 2nd
-        return numpy.pi - theta
-    elif x < 0 and y < 0:  # 3rd
-        if principal:
-            return -numpy.pi + theta
-        else:
-            return numpy.pi + theta
-    else:  # 4th
-        if principal:
-            return -theta
-        else:
-            return numpy.pi * 2 - theta
+    The angle is counter clock wise from the positive x-axis, in radians or in degrees if degrees = True
+    If principal = True the angle is in (-pi, pi] otherwise in [0, 2pi)\n
+    p and o may also be (..., 2) numpy.ndarrays, the result is then an array of angles
+    """
+    if not isinstance(p, numpy.ndarray) and not isinstance(o, numpy.ndarray):
+        # Single point, math.atan2 avoids the array overhead
+        angle = math.atan2(p[1] - o[1] + 0.0, p[0] - o[0])
+        if not principal and angle < 0:
+            angle += 2 * math.pi
+        return math.degrees(angle) if degrees else angle
+    d = numpy.asarray(p, dtype=numpy.float64) - numpy.asarray(o, dtype=numpy.float64)
+    return _scalar_or_array(_angles(d[..., 0], d[..., 1], principal, degrees))
 
 
 def get_length(points, closed=False):
     """
     Calculates the length of the path described by the list of ordered points
     """
+    if isinstance(points, Polygon):
+        if closed:
+            return points.perimeter
+        points = points.points
+    if isinstance(points, numpy.ndarray):
+        if closed:
+            points = numpy.concatenate((points, points[:1]))
+        steps = numpy.diff(points, axis=0)
+        return float(numpy.hypot(steps[:, 0], steps[:, 1]).sum())
     if closed:
         points = _first_last_point(points, add=True)
     length = 0
@@ -136,6 +398,12 @@ def get_bbox_size(points, mbbox=False):
     In the case of the minumum oriented bbox the height and width are determined by max and min functions
     In the case of the straight bbox the height is the length in the y axis and the width is the length in the x axis
     """
+    if isinstance(points, Polygon) and not mbbox:
+        xmin, ymin, xmax, ymax = points.extents
+        return xmax - xmin, ymax - ymin
+    if isinstance(points, numpy.ndarray) and not mbbox:
+        width, height = points.max(axis=0) - points.min(axis=0)
+        return width, height
     if mbbox:
         bbox = get_mbbox(points)
     else:
@@ -153,6 +421,13 @@ def get_area(points, signed=False):
     Calculates the area of an arbitary closed shape using the shoelace formula\n
     Format for points: ((x1,y1),(x2,y2),(x3,y3))\n
     """
+    if isinstance(points, Polygon):
+        return points.signed_area if signed else points.area
+    if isinstance(points, numpy.ndarray):
+        # A repeated closing point adds an edge of no area
+        x, y = points[:, 0], points[:, 1]
+        area = 0.5 * float((x * numpy.roll(y, -1) - numpy.roll(x, -1) * y).sum())
+        return area if signed else abs(area)
     points = _first_last_point(points, add=True)
     sum = 0
     x, y = zip(*points)
@@ -169,7 +444,22 @@ def get_area(points, signed=False):
 
 def get_mbbox(points):
     """
-    Computes the minimum oriented bounding box\n
+    Computes the minimum oriented bounding box in O(n log n)
+    using the convex hull and rotating calipers\n
+    Format for points: ((x1,y1),(x2,y2),(x3,y3)), an (N, 2) numpy.ndarray or a Polygon
+    (an ndarray or a Polygon returns a (4, 2) ndarray)
+    """
+    hull = points.convex_hull if isinstance(points, Polygon) else _convex_hull(points)
+    bbox = _min_area_rectangle(hull)
+    if isinstance(points, (numpy.ndarray, Polygon)):
+        return bbox
+    return tuple(map(tuple, bbox.tolist()))
+
+
+def _get_mbbox_reference(points):
+    """
+    The original O(n^2) minimum bounding box that tries every edge of the shape\n
+    Kept as a reference to check get_mbbox against\n
     Format for points: ((x1,y1),(x2,y2),(x3,y3))
     """
     points = _first_last_point(points, add=True)
@@ -189,11 +479,29 @@ def get_mbbox(points):
     return lowest_bbox
 
 
+def get_convex_hull(points):
+    """
+    Computes the convex hull using Andrew's monotone chain in O(n log n)
+    Returns the hull counter clock wise without repeating the first point
+    (collinear points on the hull's edges are dropped)\n
+    Format for points: ((x1,y1),(x2,y2),(x3,y3)), an (N, 2) numpy.ndarray or a Polygon
+    (an ndarray or a Polygon returns an ndarray)
+    """
+    if isinstance(points, Polygon):
+        return points.convex_hull
+    hull = _convex_hull(points)
+    if isinstance(points, numpy.ndarray):
+        return hull
+    return tuple(map(tuple, hull.tolist()))
+
+
 def get_sbbox(points):
     """
     Computes the straight un oriented bounding box\n
     Format for points: ((x1,y1),(x2,y2),(x3,y3))
     """
+    if isinstance(points, Polygon):
+        return points.sbbox
     p = tuple(zip(*points))
     xmax = max(p[0])
     xmin = min(p[0])
@@ -216,6 +524,10 @@ def get_centeroid(points, shape=True):
     Returns the centeroid of a cluster of points or a shape\n
     Format for points: ((x1,y1),(x2,y2),(x3,y3))\n
     """
+    if isinstance(points, Polygon):
+        return points.centeroid if shape else _array_centeroid(points.points, shape=False)
+    if isinstance(points, numpy.ndarray):
+        return _array_centeroid(points, shape)
     if shape:
         area = get_area(points, signed = True)
         points = _first_last_point(points, add=True)
@@ -238,11 +550,21 @@ def get_visual_center():
     pass
 
 
+_LOOP_INTERSECTIONS_LIMIT = 64  # Edge pairs below which the plain loop beats building a grid
+
+
 def get_intersections(shape1, shape2):
     """
     Returns the intersection points of the 2 shapes\n
     Format for shapes: ((x1,y1),(x2,y2),(x3,y3))\n
     """
+    if len(shape1) * len(shape2) > _LOOP_INTERSECTIONS_LIMIT:
+        points, _ = get_batch_intersections((shape1,), (shape2,))
+        return list(map(tuple, points.tolist()))
+    if isinstance(shape1, (numpy.ndarray, Polygon)):
+        shape1 = tuple(map(tuple, _as_points_array(shape1).tolist()))
+    if isinstance(shape2, (numpy.ndarray, Polygon)):
+        shape2 = tuple(map(tuple, _as_points_array(shape2).tolist()))
     shape1 = _first_last_point(shape1, add=True)
     shape2 = _first_last_point(shape2, add=True)
     # Start with a line from the first shape then go through all
@@ -278,16 +600,140 @@ def get_line_intersections(line1, line2, segment=True):
         return x, y
 
 
+def get_batch_intersections(shapes1, shapes2=None, cell_size=None):
+    """
+    Returns the intersection points between the edges of many closed shapes at once\n
+    The edges are bucketed in a uniform grid so only edges that share a cell are tested.
+    If shapes2 is None the shapes in shapes1 are tested against each other (never against themselves)\n
+    Returns (points, hits) where points is a (K, 2) array and every row of the (K, 4) int array hits is
+    (shape index in shapes1, edge index, shape index in shapes2, edge index).
+    Edge i goes from point i to point i+1 of its shape, the last edge closes the shape.
+    The hits are ordered the same way get_intersections orders its points.
+    The candidate pairs are tested a block at a time, so the memory needed is bounded by the hits\n
+    Format for shapes: (((x1,y1),(x2,y2),(x3,y3)), ((x1,y1),(x2,y2),(x3,y3)))
+    """
+    starts1, ends1, owners1, indices1 = _shape_edges(shapes1)
+    if shapes2 is None:
+        starts2, ends2, owners2, indices2 = starts1, ends1, owners1, indices1
+    else:
+        starts2, ends2, owners2, indices2 = _shape_edges(shapes2)
+    if len(starts1) == 0 or len(starts2) == 0:
+        return numpy.empty((0, 2)), numpy.empty((0, 4), dtype=numpy.intp)
+    low1, high1 = numpy.minimum(starts1, ends1), numpy.maximum(starts1, ends1)
+    low2, high2 = numpy.minimum(starts2, ends2), numpy.maximum(starts2, ends2)
+    found_points, found_hits = [], []
+    for a, b in _bbox_pair_blocks(low1, high1, low2, high2, cell_size):
+        if shapes2 is None:
+            keep = owners1[a] < owners2[b]
+            a, b = a[keep], b[keep]
+        points, hit = _intersect_segments(starts1[a], ends1[a], starts2[b], ends2[b])
+        a, b = a[hit], b[hit]
+        found_points.append(points[hit])
+        found_hits.append(numpy.stack((owners1[a], indices1[a], owners2[b], indices2[b]), axis=1))
+    if not found_points:
+        return numpy.empty((0, 2)), numpy.empty((0, 4), dtype=numpy.intp)
+    return numpy.concatenate(found_points), numpy.concatenate(found_hits)
+
+
+def _intersect_segments(p1, p2, p3, p4, segment=True):
+    """
+    Vectorized get_line_intersections for (K, 2) arrays of line end points\n
+    Returns (points, mask) where mask is False for parallel lines
+    and, if segment = True, for points that are not on both segments
+    """
+    x1, y1 = p1[:, 0], p1[:, 1]
+    x2, y2 = p2[:, 0], p2[:, 1]
+    x3, y3 = p3[:, 0], p3[:, 1]
+    x4, y4 = p4[:, 0], p4[:, 1]
+    det = (y2-y1) * (x3-x4) - (x1-x2) * (y4-y3)
+    mask = det != 0
+    safe_det = numpy.where(mask, det, 1)
+    xdet = (x1*y2-y1*x2) * (x3-x4) - (x1-x2) * (x3*y4-y3*x4)
+    ydet = (y2-y1) * (x3*y4-y3*x4) - (x1*y2-y1*x2) * (y4-y3)
+    x = xdet/safe_det
+    y = ydet/safe_det
+    if segment:
+        mask &= (numpy.minimum(x1, x2) <= x) & (x <= numpy.maximum(x1, x2))\
+            & (numpy.minimum(x3, x4) <= x) & (x <= numpy.maximum(x3, x4))\
+            & (numpy.minimum(y1, y2) <= y) & (y <= numpy.maximum(y1, y2))\
+            & (numpy.minimum(y3, y4) <= y) & (y <= numpy.maximum(y3, y4))
+    return numpy.stack((x, y), axis=1), mask
+
+
 def is_inside(inner_points, outer_points):
     """
     Returns True if all the inner_points are enclosed by the outer_points' shape\n
     Format for points: ((x1,y1),(x2,y2),(x3,y3))
     """
-    pass
+    ixmin, iymin, ixmax, iymax = _sbbox_extents(inner_points)
+    oxmin, oymin, oxmax, oymax = _sbbox_extents(outer_points)
+    if ixmin < oxmin or iymin < oymin or ixmax > oxmax or iymax > oymax:
+        return False
+    return bool(get_points_inside(inner_points, outer_points).all())
 
 
 def is_overlapping(points1, points2, tolerance=0):
-    pass
+    """
+    Returns True if the two shapes overlap or if their outlines are closer than tolerance\n
+    Format for points: ((x1,y1),(x2,y2),(x3,y3))
+    """
+    return bool(is_overlapping_many(points1, (points2,), tolerance)[0])
+
+
+def is_overlapping_many(points, candidates, tolerance=0):
+    """
+    Tests one shape against many candidate shapes in one batch
+    Returns a bool array with an entry for every candidate, see is_overlapping\n
+    Format for points: ((x1,y1),(x2,y2),(x3,y3))
+    Format for candidates: (((x1,y1),(x2,y2),(x3,y3)), ((x1,y1),(x2,y2),(x3,y3)))
+    """
+    result = numpy.zeros(len(candidates), dtype=bool)
+    if len(candidates) == 0:
+        return result
+    # Fast reject with the straight bounding boxes
+    xmin, ymin, xmax, ymax = _sbbox_extents(points)
+    extents = numpy.array([_sbbox_extents(c) for c in candidates])
+    near = (extents[:, 0] <= xmax + tolerance) & (extents[:, 2] >= xmin - tolerance)\
+        & (extents[:, 1] <= ymax + tolerance) & (extents[:, 3] >= ymin - tolerance)
+    survivors = numpy.flatnonzero(near)
+    if len(survivors) == 0:
+        return result
+    shape = _as_points_array(points)
+    others = [_as_points_array(candidates[i]) for i in survivors]
+    # Crossing outlines
+    _, hits = get_batch_intersections((shape,), others)
+    result[survivors[numpy.unique(hits[:, 2])]] = True
+    # One shape completely inside the other
+    starts, ends, owners, _ = _shape_edges(others)
+    crossings = _crossings(_interior_probe(shape)[None], starts, ends)[0]
+    inside = numpy.bincount(owners, weights=crossings, minlength=len(others)) % 2 == 1
+    inside |= get_points_inside(numpy.array([_interior_probe(o) for o in others]), shape)
+    result[survivors[inside]] = True
+    if tolerance > 0:
+        for i, other in zip(survivors, others):
+            if not result[i]:
+                result[i] = _outline_distance(shape, other) <= tolerance
+    return result
+
+
+def get_points_inside(points, polygon):
+    """
+    Tests many points against a closed polygon in one vectorized pass (crossing number / even-odd rule)
+    Returns a bool array, True for the points inside the polygon
+    (points lying exactly on the outline may go either way)\n
+    Format for points: ((x1,y1),(x2,y2),(x3,y3)) or an (N, 2) numpy.ndarray
+    """
+    points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+    starts, ends, _, _ = _shape_edges((polygon,))
+    xmin, ymin, xmax, ymax = _sbbox_extents(polygon)
+    inside = (points[:, 0] >= xmin) & (points[:, 0] <= xmax) & (points[:, 1] >= ymin) & (points[:, 1] <= ymax)
+    candidates = numpy.flatnonzero(inside)
+    # Bound the (points x edges) temporary arrays to a few million entries
+    step = max(1, _KERNEL_CHUNK // max(len(starts), 1))
+    for i in range(0, len(candidates), step):
+        chunk = candidates[i:i+step]
+        inside[chunk] = _crossings(points[chunk], starts, ends).sum(axis=1) % 2 == 1
+    return inside
 
 
 def get_similarity(points1, points2, tolerance=0, rotation=False, scale=False):
@@ -298,7 +744,97 @@ def get_similarity(points1, points2, tolerance=0, rotation=False, scale=False):
 
 
 def get_shortest_path(moving_shape, pivot_line, obstacles, destination, pivot_point=None, tolerance=0, refpoint=None):
-    pass
+    """
+    Returns the shortest path that gets the shape to the destination without touching the obstacles
+    as a list of points for the pivot point starting at its current position, or None if there is no path\n
+    pivot_line is the line the shape turns around (the wheels' axle), if the pivot point is None its center is used
+    The shape is expected to turn in place at every point of the path,
+    so the obstacles are grown by the circle it sweeps plus tolerance (Minkowski sum)
+    If the reference point is None the pivot point is moved to the destination,
+    otherwise the reference point is (keeping its current offset from the pivot point)\n
+    The visibility graph is cached between calls, see path_planning.plan\n
+    Format for shapes: ((x1,y1),(x2,y2),(x3,y3))
+    """
+    from path_planning import plan
+    if pivot_point is None:
+        pivot_point = get_line_center(*pivot_line)
+    if refpoint is not None:
+        destination = destination[0] - refpoint[0] + pivot_point[0], destination[1] - refpoint[1] + pivot_point[1]
+    return plan(moving_shape, pivot_point, obstacles, destination, tolerance)
+
+# -----------------------Batched calculations-----------------------
+
+
+def pack_shapes(shapes):
+    """
+    Packs many shapes into one ragged batch for the batched calculations\n
+    Returns (coordinates, offsets) where coordinates is an (N, 2) float64 array of all the points
+    and shape i is coordinates[offsets[i]:offsets[i+1]]
+    """
+    arrays = [numpy.asarray(shape, dtype=numpy.float64).reshape(-1, 2) for shape in shapes]
+    offsets = numpy.zeros(len(arrays) + 1, dtype=numpy.intp)
+    offsets[1:] = numpy.cumsum([len(a) for a in arrays])
+    coordinates = numpy.concatenate(arrays) if arrays else numpy.empty((0, 2))
+    return coordinates, offsets
+
+
+def get_areas(coordinates, offsets, signed=False):
+    """
+    get_area for every shape of a ragged batch in one pass, see pack_shapes\n
+    Returns an (M,) array
+    """
+    x, y, nx, ny, owners = _ragged_edges(coordinates, offsets)
+    areas = 0.5 * numpy.bincount(owners, x * ny - nx * y, minlength=len(offsets) - 1)
+    return areas if signed else numpy.abs(areas)
+
+
+def get_centeroids(coordinates, offsets, shape=True):
+    """
+    get_centeroid for every shape of a ragged batch in one pass, see pack_shapes\n
+    Returns an (M, 2) array, shapes with no area (or no points when shape = False) give nan
+    """
+    x, y, nx, ny, owners = _ragged_edges(coordinates, offsets)
+    count = len(offsets) - 1
+    if shape:
+        cross = x * ny - nx * y
+        sums = numpy.bincount(owners, (x + nx) * cross, minlength=count), numpy.bincount(owners, (y + ny) * cross, minlength=count)
+        divisors = 3 * numpy.bincount(owners, cross, minlength=count)
+    else:
+        sums = numpy.bincount(owners, x, minlength=count), numpy.bincount(owners, y, minlength=count)
+        divisors = numpy.diff(offsets)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        return numpy.stack(sums, axis=1) / divisors[:, None]
+
+
+def get_lengths(coordinates, offsets, closed=False):
+    """
+    get_length for every path of a ragged batch in one pass, see pack_shapes\n
+    Returns an (M,) array
+    """
+    x, y, nx, ny, owners = _ragged_edges(coordinates, offsets, closed)
+    return numpy.bincount(owners, numpy.hypot(nx - x, ny - y), minlength=len(offsets) - 1)
+
+
+def _ragged_edges(coordinates, offsets, closed=True):
+    """
+    Returns (x, y, next x, next y, owners) for the edges of a ragged batch
+    The last point of every shape is joined to its first point if closed, otherwise it is dropped
+    """
+    coordinates = numpy.asarray(coordinates, dtype=numpy.float64)
+    offsets = numpy.asarray(offsets, dtype=numpy.intp)
+    sizes = numpy.diff(offsets)
+    owners = numpy.repeat(numpy.arange(len(sizes)), sizes)
+    following = numpy.arange(1, len(coordinates) + 1)
+    last = offsets[1:][sizes > 0] - 1
+    following[last] = offsets[:-1][sizes > 0]
+    x, y = coordinates[:, 0], coordinates[:, 1]
+    nx, ny = x[following], y[following]
+    if not closed:
+        keep = numpy.ones(len(coordinates), dtype=bool)
+        keep[last] = False
+        return x[keep], y[keep], nx[keep], ny[keep], owners[keep]
+    return x, y, nx, ny, owners
+
 
 # -----------------------Small utility functions-----------------------
 
@@ -312,21 +848,292 @@ def _first_last_point(points, add=True):
         return points
 
 
-def principal_angle(angle):
-    while angle > 180:
-        angle -= 360
-    while angle <= -180:
-        angle += 360
-    return angle
+def _convex_hull(points):
+    """ Monotone chain convex hull of an array of points, returns an (H, 2) array ordered counter clock wise """
+    points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+    points = _discard_interior(points)
+    points = numpy.unique(points, axis=0)  # Also sorts by x then y
+    if len(points) < 3:
+        return points
+    lower = _half_hull(points.tolist())
+    upper = _half_hull(points[::-1].tolist())
+    return numpy.array(lower[:-1] + upper[:-1])
+
+
+def _half_hull(points):
+    hull = []
+    for p in points:
+        while len(hull) >= 2 and (hull[-1][0] - hull[-2][0]) * (p[1] - hull[-2][1])\
+                - (hull[-1][1] - hull[-2][1]) * (p[0] - hull[-2][0]) <= 0:
+            hull.pop()
+        hull.append(p)
+    return hull
+
+
+def _discard_interior(points):
+    """
+    Akl-Toussaint heuristic: drops the points that lie strictly inside the octagon
+    made by the extreme points in 8 directions so that the hull only walks the remaining ones
+    """
+    if len(points) < 16:
+        return points
+    x, y = points[:, 0], points[:, 1]
+    # Extreme points counter clock wise starting from the direction of the negative x axis
+    octagon = points[[x.argmin(), (x + y).argmin(), y.argmin(), (x - y).argmax(),
+                      x.argmax(), (x + y).argmax(), y.argmax(), (y - x).argmax()]]
+    inside = numpy.ones(len(points), dtype=bool)
+    for (x1, y1), (x2, y2) in zip(octagon, numpy.roll(octagon, -1, axis=0)):
+        inside &= (x2 - x1) * (y - y1) - (y2 - y1) * (x - x1) > 0
+    return points[~inside]
+
+
+def _min_area_rectangle(hull):
+    """
+    Rotating calipers over a counter clock wise convex hull\n
+    The outgoing edge angles of a convex polygon increase monotonically,
+    so the vertex touching each caliper is found for every edge at once with searchsorted\n
+    Returns the 4 corners of the smallest rectangle that has a side on one of the hull's edges
+    """
+    if len(hull) == 1:
+        return numpy.repeat(hull, 4, axis=0)
+    if len(hull) == 2:
+        return hull[[0, 0, 1, 1]]
+    edges = numpy.roll(hull, -1, axis=0) - hull
+    angles = numpy.unwrap(numpy.arctan2(edges[:, 1], edges[:, 0]))
+    angles -= angles[0]
+    u = edges / numpy.hypot(edges[:, 0], edges[:, 1])[:, None]
+    n = numpy.stack((-u[:, 1], u[:, 0]), axis=1)
+    # The vertex that is extreme in direction phi is the first one whose outgoing edge angle >= phi + pi/2
+    calipers = [numpy.searchsorted(angles, (angles + k * numpy.pi / 2) % (2 * numpy.pi)) % len(hull)
+                for k in (1, 2, 3)]
+    umax = numpy.einsum('ij,ij->i', hull[calipers[0]] - hull, u)
+    nmax = numpy.einsum('ij,ij->i', hull[calipers[1]] - hull, n)
+    umin = numpy.einsum('ij,ij->i', hull[calipers[2]] - hull, u)
+    i = numpy.argmin((umax - umin) * nmax)
+    corners = numpy.array([(umin[i], 0), (umin[i], nmax[i]), (umax[i], nmax[i]), (umax[i], 0)])
+    return hull[i] + corners[:, :1] * u[i] + corners[:, 1:] * n[i]
+
+
+_KERNEL_CHUNK = 1 << 22  # Maximum number of (point, edge) pairs evaluated at once
 
 
-def signed_angle_dif(target,source):
-    return (target-source+180) % 360 -180
+def _as_points_array(points):
+    """ Returns the points as an (N, 2) float64 array without the closing point """
+    points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+    if len(points) > 1 and numpy.array_equal(points[0], points[-1]):
+        return points[:-1]
+    return points
+
+
+def _sbbox_extents(points):
+    """ Returns (xmin, ymin, xmax, ymax), tuples of points and Polygons are cached """
+    if isinstance(points, Polygon):
+        return points.extents
+    if isinstance(points, tuple):
+        try:
+            return _cached_sbbox_extents(points)
+        except TypeError:  # Unhashable points
+            pass
+    points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+    (xmin, ymin), (xmax, ymax) = points.min(axis=0), points.max(axis=0)
+    return xmin, ymin, xmax, ymax
+
+
+@functools.lru_cache(maxsize=1024)
+def _cached_sbbox_extents(points):
+    (xmin, ymin), _, (xmax, ymax), _ = get_sbbox(points)
+    return xmin, ymin, xmax, ymax
+
+
+def _interior_probe(shape):
+    """
+    Returns a point just inside an (N, 2) shape: the middle of its longest edge nudged towards the inside\n
+    Unlike a vertex it does not lie on the outline, so identical or touching shapes are still classified
+    """
+    edges = numpy.roll(shape, -1, axis=0) - shape
+    i = numpy.argmax((edges ** 2).sum(axis=1))
+    x, y = shape[:, 0], shape[:, 1]
+    orientation = 1 if (x * numpy.roll(y, -1) - numpy.roll(x, -1) * y).sum() >= 0 else -1
+    # The left normal points inside a counter clock wise shape
+    normal = numpy.array((-edges[i, 1], edges[i, 0])) * orientation
+    return shape[i] + edges[i] / 2 + normal * 1e-7
+
+
+def _crossings(points, starts, ends):
+    """
+    Returns a (points x edges) bool array that is True where the ray going from the point
+    in the positive x direction crosses the edge
+    """
+    px, py = points[:, :1], points[:, 1:]
+    x1, y1, x2, y2 = starts[:, 0], starts[:, 1], ends[:, 0], ends[:, 1]
+    straddles = (y1 > py) != (y2 > py)
+    dy = numpy.where(y1 == y2, 1, y2 - y1)
+    return straddles & (px < x1 + (py - y1) * (x2 - x1) / dy)
+
+
+def _outline_distance(shape1, shape2):
+    """ Smallest distance between the closed outlines of two (N, 2) arrays that do not intersect """
+    distances = []
+    for points, shape in ((shape1, shape2), (shape2, shape1)):
+        starts, ends = shape, numpy.roll(shape, -1, axis=0)
+        d = ends - starts
+        lengths = numpy.maximum((d ** 2).sum(axis=1), 1e-300)
+        t = numpy.clip(((points[:, None, :] - starts) * d).sum(axis=2) / lengths, 0, 1)
+        closest = starts + t[:, :, None] * d
+        distances.append(numpy.sqrt(((points[:, None, :] - closest) ** 2).sum(axis=2)).min())
+    return min(distances)
+
+
+def _shape_edges(shapes):
+    """
+    Flattens the closed edges of many shapes into arrays\n
+    Returns (starts, ends, owners, indices) where owners is the shape index of every edge
+    and indices is the edge's index inside its shape
+    """
+    starts, ends, owners, indices = [], [], [], []
+    for owner, shape in enumerate(shapes):
+        shape = numpy.asarray(shape, dtype=numpy.float64).reshape(-1, 2)
+        if len(shape) > 1 and numpy.array_equal(shape[0], shape[-1]):
+            shape = shape[:-1]
+        starts.append(shape)
+        ends.append(numpy.roll(shape, -1, axis=0))
+        owners.append(numpy.full(len(shape), owner, dtype=numpy.intp))
+        indices.append(numpy.arange(len(shape), dtype=numpy.intp))
+    if not starts:
+        empty = numpy.empty((0, 2))
+        return empty, empty, numpy.empty(0, dtype=numpy.intp), numpy.empty(0, dtype=numpy.intp)
+    return (numpy.concatenate(starts), numpy.concatenate(ends),
+            numpy.concatenate(owners), numpy.concatenate(indices))
+
+
+def _grid_cells(low, high, origin, cell_size):
+    """
+    Returns (boxes, cells): one entry for every grid cell overlapped by every bounding box
+    Cells are encoded as a single int64 key
+    """
+    first = numpy.floor((low - origin) / cell_size).astype(numpy.int64)
+    last = numpy.floor((high - origin) / cell_size).astype(numpy.int64)
+    spans = last - first + 1
+    counts = spans[:, 0] * spans[:, 1]
+    boxes = numpy.repeat(numpy.arange(len(low)), counts)
+    offsets = _expand_ranges(numpy.zeros(len(low), dtype=numpy.int64), counts)
+    columns = first[boxes, 0] + offsets // spans[boxes, 1]
+    rows = first[boxes, 1] + offsets % spans[boxes, 1]
+    return boxes, columns * (1 << 32) + rows
 
 
-def to_polar(x, y):
-    return numpy.sqrt(x**2 + y**2), get_angle((x, y))
+_PAIR_BLOCK = 1 << 18  # Candidate pairs joined at once by _bbox_pair_blocks
 
 
-def to_cartesian(magnitude, angle):
+def _bbox_pairs(low1, high1, low2, high2, cell_size=None):
+    """
+    Broad phase shared by the batch kernels: buckets two sets of bounding boxes in a uniform grid\n
+    Returns (a, b) index arrays of every pair of boxes from the two sets that share a grid cell,
+    without repeats and ordered by a then b
+    If the cell size is None the mean box extent is used
+    """
+    blocks = list(_bbox_pair_blocks(low1, high1, low2, high2, cell_size))
+    if not blocks:
+        return numpy.empty(0, dtype=numpy.intp), numpy.empty(0, dtype=numpy.intp)
+    return numpy.concatenate([a for a, _ in blocks]), numpy.concatenate([b for _, b in blocks])
+
+
+def _bbox_pair_blocks(low1, high1, low2, high2, cell_size=None, block=_PAIR_BLOCK):
+    """
+    _bbox_pairs a block of about block candidate pairs at a time, so the memory stays bounded however many
+    boxes overlap. Yields (a, b) index arrays, together they are the pairs of _bbox_pairs in the same order
+    """
+    if len(low1) == 0 or len(low2) == 0:
+        return
+    if cell_size is None:
+        extents = numpy.concatenate((high1 - low1, high2 - low2)).max(axis=1)
+        cell_size = max(extents.mean(), 1e-9)
+    origin = numpy.minimum(low1.min(axis=0), low2.min(axis=0))
+    boxes1, cells1 = _grid_cells(low1, high1, origin, cell_size)
+    boxes2, cells2 = _grid_cells(low2, high2, origin, cell_size)
+    # Join the two (box, cell) lists on the cell
+    order = numpy.argsort(cells2, kind='stable')
+    boxes2, cells2 = boxes2[order], cells2[order]
+    first = numpy.searchsorted(cells2, cells1, side='left')
+    counts = numpy.searchsorted(cells2, cells1, side='right') - first
+    # Blocks split the (box, cell) list between boxes, all the cells of a box are joined in the same block
+    # so a pair that shares several cells is still only returned once
+    before = numpy.cumsum(counts) - counts
+    box_starts = numpy.searchsorted(boxes1, numpy.arange(len(low1)))
+    block_ids = before[box_starts][boxes1] // block
+    bounds = numpy.concatenate(([0], numpy.flatnonzero(numpy.diff(block_ids)) + 1, [len(boxes1)]))
+    for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+        a = numpy.repeat(boxes1[start:end], counts[start:end])
+        if not len(a):
+            continue
+        b = boxes2[_expand_ranges(first[start:end], counts[start:end])]
+        pairs = numpy.unique(a * len(low2) + b)
+        yield pairs // len(low2), pairs % len(low2)
+
+
+def _expand_ranges(starts, counts):
+    """ Concatenates arange(start, start + count) for every start and count without a Python loop """
+    total = counts.sum()
+    if total == 0:
+        return numpy.empty(0, dtype=numpy.int64)
+    ends = numpy.cumsum(counts)
+    steps = numpy.ones(total, dtype=numpy.int64)
+    nonempty = counts > 0
+    heads = (ends - counts)[nonempty]
+    steps[heads] = starts[nonempty]
+    steps[heads[1:]] -= (starts + counts - 1)[nonempty][:-1]
+    return numpy.cumsum(steps)
+
+
+def _array_centeroid(points, shape=True):
+    """ get_centeroid for an (N, 2) numpy.ndarray without converting it to tuples """
+    points = numpy.asarray(points, dtype=numpy.float64)
+    if len(points) > 1 and numpy.array_equal(points[0], points[-1]):
+        points = points[:-1]
+    x, y = points[:, 0], points[:, 1]
+    if not shape:
+        return x.mean(), y.mean()
+    nx, ny = numpy.roll(x, -1), numpy.roll(y, -1)
+    cross = x * ny - nx * y
+    area = 0.5 * cross.sum()
+    return ((x + nx) * cross).sum() / (6 * area), ((y + ny) * cross).sum() / (6 * area)
+
+
+def principal_angle(angle, degrees=True):
+    """ Wraps the angle into (-180, 180] degrees, or (-pi, pi] if degrees = False, works on arrays """
+    half_turn = 180 if degrees else numpy.pi
+    angle = numpy.asarray(angle, dtype=numpy.float64)
+    return _scalar_or_array(angle - 2 * half_turn * numpy.ceil((angle - half_turn) / (2 * half_turn)))
+
+
+def signed_angle_dif(target, source, degrees=True):
+    """ The signed difference target - source wrapped into [-180, 180) degrees, or [-pi, pi) if degrees = False """
+    half_turn = 180 if degrees else numpy.pi
+    return (target - source + half_turn) % (2 * half_turn) - half_turn
+
+
+def to_polar(x, y, degrees=False):
+    """ Returns (magnitude, principal angle), x and y may be arrays """
+    x = numpy.asarray(x, dtype=numpy.float64)
+    y = numpy.asarray(y, dtype=numpy.float64)
+    return _scalar_or_array(numpy.hypot(x, y)), _scalar_or_array(_angles(x, y, True, degrees))
+
+
+def to_cartesian(magnitude, angle, degrees=False):
+    """ Returns (x, y), magnitude and angle may be arrays """
+    if degrees:
+        angle = numpy.radians(angle)
     return magnitude * numpy.cos(angle), magnitude * numpy.sin(angle)
+
+
+def _angles(x, y, principal=True, degrees=False):
+    """ Vectorized atan2 following get_angle's ranges, atan2(-0.0, -1) gives pi like atan2(0, -1) """
+    angles = numpy.arctan2(y + 0.0, x)
+    if not principal:
+        angles = numpy.where(angles < 0, angles + 2 * numpy.pi, angles)
+    return numpy.degrees(angles) if degrees else angles
+
+
+def _scalar_or_array(value):
+    """ Returns a 0-d array as a float so scalar callers keep getting floats """
+    return float(value) if numpy.ndim(value) == 0 else value
@@ -0,0 +1,514 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import timeit
+import warnings
+import numpy
+import geometry_2d
+from geometry_2d import *
+from geometry_2d import _get_mbbox_reference
+from obstacle_index import ObstacleIndex
+from path_planning import VisibilityGraph, OccupancyGrid, FREE, get_footprint
+
+sizes = (10, 1000, 100000)
+
+
+def random_points(n, seed=0):
+    """ Returns n random points as an (N, 2) array and as a tuple of tuples """
+    array = numpy.random.default_rng(seed).uniform(-100, 100, (n, 2))
+    return array, tuple(map(tuple, array.tolist()))
+
+
+def best_time(func, repeat=5):
+    """ Returns the best time in seconds of calling func, averaged over enough calls to take ~0.2s """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def bench_transformations():
+    for n in sizes:
+        array, points = random_points(n)
+        for name, func in (('move', lambda p: move(p, 1, 2)),
+                           ('scale', lambda p: scale(p, 2, 3, refpoint=(0, 0))),
+                           ('rotate', lambda p: rotate(p, 0.3, refpoint=(0, 0)))):
+            t_tuple = best_time(lambda: func(points), repeat=3 if n > 1000 else 5)
+            t_array = best_time(lambda: func(array))
+            print('{:<8}{:>8} points  tuples {:>12.3f}us  ndarray {:>10.3f}us  x{:.1f}'.format(
+                name, n, t_tuple * 1e6, t_array * 1e6, t_tuple / t_array))
+
+
+def bench_transform_chain():
+    scaling = Transform.scale(2, 3, refpoint=(0, 0))
+    moving = Transform.move(1, 2)
+    rotating = Transform.rotate(0.3, refpoint=(0, 0))
+    for n in sizes:
+        array, points = random_points(n)
+        t_functions = best_time(lambda: rotate(move(scale(array, 2, 3, refpoint=(0, 0)), 1, 2), 0.3, refpoint=(0, 0)))
+        t_chain = best_time(lambda: scaling.then(moving).then(rotating).apply(array))
+        print('{:<8}{:>8} points  functions {:>9.3f}us  Transform {:>8.3f}us  x{:.1f}'.format(
+            'chain', n, t_functions * 1e6, t_chain * 1e6, t_functions / t_chain))
+
+
+def check_mbbox(cases=300, seed=9):
+    """
+    Asserts get_mbbox finds a box of the same area as the reference on random point sets, uniform ones and
+    ones on a small integer grid (repeated and collinear points). The reference tries the edges of the shape
+    as given, so it gets the convex hull, where the minimum box lies along one of them
+    """
+    rng = numpy.random.default_rng(seed)
+    for case in range(cases):
+        n = int(rng.integers(3, 60))
+        array = rng.uniform(-100, 100, (n, 2)) if case % 2 else rng.integers(-5, 6, (n, 2)).astype(numpy.float64)
+        points = tuple(map(tuple, array.tolist()))
+        hull = get_convex_hull(points)
+        area = get_area(get_mbbox(points))
+        assert numpy.isclose(get_area(get_mbbox(array)), area), points
+        if len(hull) < 3:
+            assert numpy.isclose(area, 0, atol=1e-9), points
+            continue
+        reference = get_area(_get_mbbox_reference(hull))
+        assert numpy.isclose(area, reference, rtol=1e-9, atol=1e-9), (points, area, reference)
+        assert area <= get_area(_get_mbbox_reference(points)) * (1 + 1e-9) + 1e-9, points
+    print('{:<8}{:>8} random point sets  get_mbbox matches the reference'.format('mbbox', cases))
+
+
+def bench_mbbox():
+    check_mbbox()
+    for n in (10, 100, 1000):
+        array, points = random_points(n)
+        t_reference = best_time(lambda: _get_mbbox_reference(points), repeat=3)
+        t_calipers = best_time(lambda: get_mbbox(array))
+        areas = get_area(_get_mbbox_reference(points)), get_area(get_mbbox(points))
+        print('{:<8}{:>8} points  reference {:>11.3f}us  calipers {:>9.3f}us  x{:.1f}  areas {:.6g} {:.6g}'.format(
+            'mbbox', n, t_reference * 1e6, t_calipers * 1e6, t_reference / t_calipers, *areas))
+    for n in (100000,):
+        array, _ = random_points(n)
+        print('{:<8}{:>8} points  calipers {:>9.3f}us'.format('mbbox', n, best_time(lambda: get_mbbox(array)) * 1e6))
+
+
+def bench_polygon():
+    """ Repeated derived property queries on one shape, as the control loop does """
+    for n in sizes:
+        array, points = random_points(n)
+        polygon = Polygon(array)
+        queries = lambda p: (get_area(p), get_centeroid(p), get_sbbox(p), get_length(p, closed=True))
+        t_tuple = best_time(lambda: queries(points), repeat=3 if n > 1000 else 5)
+        t_polygon = best_time(lambda: queries(polygon))
+        t_first = best_time(lambda: queries(Polygon(array, copy=False)), repeat=3)
+        print('{:<8}{:>8} points  tuples {:>12.3f}us  Polygon cached {:>8.3f}us  x{:.0f}  first use {:>10.3f}us'.format(
+            'polygon', n, t_tuple * 1e6, t_polygon * 1e6, t_tuple / t_polygon, t_first * 1e6))
+
+
+def bench_batched():
+    """ Area, centeroid and perimeter of many candidate poses of one shape """
+    for count in (10, 100, 1000):
+        shapes = list(random_obstacles(count, vertices=16, extent=100, seed=8))
+        tuples = [tuple(map(tuple, s.tolist())) for s in shapes]
+        coordinates, offsets = pack_shapes(shapes)
+        t_loop = best_time(lambda: [(get_area(s), get_centeroid(s), get_length(s, closed=True)) for s in tuples], repeat=3)
+        t_batch = best_time(lambda: (get_areas(coordinates, offsets), get_centeroids(coordinates, offsets),
+                                     get_lengths(coordinates, offsets, closed=True)))
+        t_pack = best_time(lambda: pack_shapes(shapes))
+        print('{:<14}{:>6} shapes  loop {:>12.3f}us  batched {:>10.3f}us  x{:.1f}  pack_shapes {:>9.3f}us'.format(
+            'batched', count, t_loop * 1e6, t_batch * 1e6, t_loop / t_batch, t_pack * 1e6))
+
+
+def random_obstacles(count, vertices=8, extent=1000, seed=0):
+    """ Returns count random star shaped obstacles scattered over an extent x extent map """
+    rng = numpy.random.default_rng(seed)
+    angles = numpy.sort(rng.uniform(0, 2 * numpy.pi, (count, vertices)), axis=1)
+    radii = rng.uniform(5, 15, (count, vertices))
+    centers = rng.uniform(0, extent, (count, 1, 2))
+    return centers + numpy.stack((radii * numpy.cos(angles), radii * numpy.sin(angles)), axis=2)
+
+
+def bench_intersections():
+    for count in (10, 100, 1000):
+        obstacles = random_obstacles(count)
+        car = random_obstacles(1, vertices=64, extent=1000, seed=1)[0]
+        car_tuples = tuple(map(tuple, car.tolist()))
+        obstacle_tuples = [tuple(map(tuple, o.tolist())) for o in obstacles]
+        t_loop = best_time(lambda: [get_intersections(car_tuples, o) for o in obstacle_tuples], repeat=3)
+        t_grid = best_time(lambda: get_batch_intersections((car,), obstacles))
+        print('{:<14}{:>6} obstacles  loop {:>12.3f}us  grid {:>10.3f}us  x{:.1f}'.format(
+            'intersections', count, t_loop * 1e6, t_grid * 1e6, t_loop / t_grid))
+        t_all = best_time(lambda: get_batch_intersections(obstacles), repeat=3)
+        print('{:<14}{:>6} obstacles  all pairs at once {:>10.3f}us'.format('intersections', count, t_all * 1e6))
+
+
+def bench_point_in_polygon():
+    obstacle = random_obstacles(1, vertices=100, extent=0, seed=2)[0] * 5
+    obstacles = random_obstacles(1000, vertices=100, extent=1000, seed=3)
+    for n in (100, 10000):
+        cloud = numpy.random.default_rng(4).uniform(-75, 75, (n, 2))
+        print('{:<14}{:>6} points vs 100 vertices  {:>10.3f}us'.format(
+            'points inside', n, best_time(lambda: get_points_inside(cloud, obstacle)) * 1e6))
+    print('{:<14}{:>6} obstacles  is_overlapping_many {:>10.3f}us'.format(
+        'overlapping', len(obstacles), best_time(lambda: is_overlapping_many(obstacles[0], obstacles)) * 1e6))
+
+
+def bench_obstacle_index():
+    """ Query time against obstacle count at a constant obstacle density """
+    for count in (100, 1000, 10000):
+        extent = 30 * numpy.sqrt(count)
+        obstacles = random_obstacles(count, extent=extent)
+        index = ObstacleIndex(cell_size=30)
+        ids = [index.insert(o) for o in obstacles]
+        car = random_obstacles(1, vertices=16, extent=0, seed=5)[0] + extent / 2
+        moved = obstacles[0] + (3, 3)
+        timings = (('window', lambda: index.query_window(extent / 2, extent / 2, extent / 2 + 60, extent / 2 + 60)),
+                   ('nearest k=5', lambda: index.nearest((extent / 2, extent / 2), k=5)),
+                   ('ray 200', lambda: index.ray((extent / 2, extent / 2), 0.3, 200)),
+                   ('overlapping', lambda: index.overlapping(car, tolerance=10)),
+                   ('update', lambda: index.update(ids[0], moved)),
+                   ('scan all', lambda: is_overlapping_many(car, obstacles, tolerance=10)))
+        print('{:<14}{:>6} obstacles  '.format('index', count) + '  '.join(
+            '{} {:.1f}us'.format(name, best_time(func, repeat=3) * 1e6) for name, func in timings))
+
+
+def bench_planner():
+    """ Moving one obstacle has to fit in the car's response_time, Car.move_to_point plans on the caller's thread """
+    from hardware_control import Car
+    from simulation import Simulator
+    response_time = Car(Simulator(), profile_path=None).response_time
+    car = (-1, -0.5), (1, -0.5), (1, 0.5), (-1, 0.5)
+    footprint = get_footprint(car, (0, 0))
+    rng = numpy.random.default_rng(6)
+    for count in (30, 100, 300):
+        extent = 30 * numpy.sqrt(count)
+        obstacles = list(random_obstacles(count, extent=extent, seed=count))
+        graph = VisibilityGraph(footprint)
+        t_build = best_time(lambda: VisibilityGraph(footprint).set_obstacles(obstacles), repeat=1)
+        graph.set_obstacles(obstacles)
+        queries = rng.uniform(0, extent, (20, 2, 2))
+        t_query = max(best_time(lambda: graph.shortest_path(*q), repeat=1) for q in queries)
+        moved = [obstacles[:], obstacles[:]]
+        moved[1][0] = moved[1][0] + 3
+        swaps = iter(moved * 1000)
+        t_update = best_time(lambda: graph.set_obstacles(next(swaps)), repeat=1)
+        print('{:<14}{:>6} obstacles  build {:>10.1f}ms  slowest query {:>7.1f}ms  one obstacle moved {:>7.1f}ms'.format(
+            'planner', count, t_build * 1e3, t_query * 1e3, t_update * 1e3))
+        assert t_update < response_time, 'moving one of {} obstacles takes {:.1f}ms, over the response time of {:.1f}ms'.format(
+            count, t_update * 1e3, response_time * 1e3)
+
+
+def bench_occupancy_grid():
+    for n in (250, 500, 1000, 2000):
+        grid = OccupancyGrid((0, 0), (n, n), 1.0)
+        obstacles = random_obstacles(n // 4, extent=n, seed=7)
+        t_raster = best_time(lambda: grid.add_obstacles(obstacles), repeat=1)
+        t_inflate = best_time(lambda: grid.inflate(5), repeat=1)
+        free = numpy.argwhere(grid.grid == FREE)
+        (r0, c0), (r1, c1) = free[0], free[len(free) // 2]
+        start, destination = (c0 + 0.5, r0 + 0.5), (c1 + 0.5, r1 + 0.5)
+        t_field = best_time(lambda: grid._wavefront(grid._cell(destination)), repeat=1)
+        field = grid.cost_to_go(destination)
+        t_path = best_time(lambda: grid.shortest_path(start, destination))
+        t_next = best_time(lambda: grid.next_point(start, destination))
+        print('{:<14}{:>5}x{:<5} raster {:>7.1f}ms  inflate {:>7.1f}ms  wavefront {:>7.1f}ms  path {:>6.2f}ms  '
+              'next_point {:>5.1f}us  bytes per cell: grid {} + cached field {}'.format(
+                  'grid', n, n, t_raster * 1e3, t_inflate * 1e3, t_field * 1e3, t_path * 1e3, t_next * 1e6,
+                  grid.cells.itemsize, field.itemsize))
+
+
+# -----------------------Suite with regression tracking-----------------------
+
+suite_sizes = (6, 10, 100, 1000, 10000)
+shape_classes = ('convex', 'concave', 'degenerate', 'convex-closed', 'concave-closed')
+suite_inputs = ('tuple', 'array')
+
+
+def make_shape(shape_class, n):
+    """
+    Returns n points of a shape class as an (N, 2) array: a convex ring (a regular polygon), a concave one (five lobes),
+    the same closed by repeating the first point at the end, or degenerate: points on a line, every one twice
+    """
+    if shape_class == 'degenerate':
+        line = numpy.linspace(-50, 50, (n + 1) // 2)
+        return numpy.repeat(numpy.column_stack((line, line / 2)), 2, axis=0)[:n]
+    closed = shape_class.endswith('-closed')
+    count = n - 1 if closed else n
+    angles = numpy.linspace(0, 2 * numpy.pi, count, endpoint=False)
+    radii = numpy.full(count, 50.0)
+    if shape_class.startswith('concave'):
+        radii += 20 * numpy.sin(5 * angles)
+    points = numpy.column_stack((radii * numpy.cos(angles), radii * numpy.sin(angles)))
+    return numpy.vstack((points, points[:1])) if closed else points
+
+
+def as_input(points, kind):
+    return points if kind == 'array' else tuple(map(tuple, points.tolist()))
+
+
+def _pair(function):
+    """ function(shape, the shape turned a little) """
+    def build(points):
+        other = rotate(points, 0.1, refpoint=(1, 1))
+        return lambda: function(points, other)
+    return build
+
+
+def _candidates(points):
+    candidates = [move(points, dx, 0) for dx in range(0, 200, 20)]
+    return lambda: is_overlapping_many(points, candidates)
+
+
+def _points_inside(points):
+    cloud = as_input(random_points(len(points))[0] / 2, 'array' if isinstance(points, numpy.ndarray) else 'tuple')
+    return lambda: get_points_inside(cloud, points)
+
+
+def _shortest_path(points):
+    car = (-1, -0.5), (1, -0.5), (1, 0.5), (-1, 0.5)
+    obstacles = [move(points, 100, 0)]
+    return lambda: get_shortest_path(car, ((0, -0.5), (0, 0.5)), obstacles, (200, 0))
+
+
+def _batched(function, **kwargs):
+    """ function of 16 copies of the shape packed """
+    def build(points):
+        packed = pack_shapes([points] * 16)
+        return lambda: function(*packed, **kwargs)
+    return build
+
+
+# (case, build) where build(points) returns the call to time, points are a shape of every class as every input
+shape_cases = (
+    ('move', lambda p: lambda: move(p, 1, 2)),
+    ('scale', lambda p: lambda: scale(p, 2, 3, refpoint=(0, 0))),
+    ('rotate', lambda p: lambda: rotate(p, 0.3, refpoint=(0, 0))),
+    ('Transform', lambda p: (lambda transform: lambda: transform.apply(p))(Transform.rotate(0.3, refpoint=(0, 0)).then(Transform.move(1, 2)))),
+    ('Polygon', lambda p: lambda: Polygon(p).area),
+    ('get_length', lambda p: lambda: get_length(p, closed=True)),
+    ('get_bbox_size', lambda p: lambda: get_bbox_size(p)),
+    ('get_bbox_size(mbbox)', lambda p: lambda: get_bbox_size(p, mbbox=True)),
+    ('get_area', lambda p: lambda: get_area(p)),
+    ('get_mbbox', lambda p: lambda: get_mbbox(p)),
+    ('get_convex_hull', lambda p: lambda: get_convex_hull(p)),
+    ('get_sbbox', lambda p: lambda: get_sbbox(p)),
+    ('get_centeroid', lambda p: lambda: get_centeroid(p)),
+    ('get_intersections', _pair(get_intersections)),
+    ('get_batch_intersections', _pair(lambda p, q: get_batch_intersections((p,), (q,)))),
+    ('is_inside', lambda p: (lambda inner: lambda: is_inside(inner, p))(scale(p, 0.5, 0.5, refpoint=(0, 0)))),
+    ('is_overlapping', _pair(is_overlapping)),
+    ('is_overlapping_many', _candidates),
+    ('get_points_inside', _points_inside),
+    ('get_similarity', _pair(get_similarity)),
+    ('get_shortest_path', _shortest_path),
+    ('pack_shapes', lambda p: lambda: pack_shapes([p] * 16)),
+    ('get_areas', _batched(get_areas)),
+    ('get_centeroids', _batched(get_centeroids)),
+    ('get_lengths', _batched(get_lengths, closed=True)),
+)
+# (case, build) where build(x, y) returns the call to time, x and y are single values or arrays of size values
+value_cases = (
+    ('get_angle', lambda x, y: lambda: get_angle(numpy.column_stack((x, y)) if isinstance(x, numpy.ndarray) else (x, y), (1, 1))),
+    ('principal_angle', lambda x, y: lambda: principal_angle(x * 100)),
+    ('signed_angle_dif', lambda x, y: lambda: signed_angle_dif(x * 100, y * 100)),
+    ('to_polar', lambda x, y: lambda: to_polar(x, y)),
+    ('to_cartesian', lambda x, y: lambda: to_cartesian(x, y)),
+)
+# (case, call) of the functions of single points and lines
+single_cases = (
+    ('get_visual_center', get_visual_center),
+    ('get_line_center', lambda: get_line_center((0, 0), (3, 4))),
+    ('get_line_intersections', lambda: get_line_intersections(((0, 0), (3, 4)), ((0, 4), (3, 0)))),
+)
+
+
+def suite_cases(sizes=suite_sizes):
+    """ Yields (function, shape class, input, size, call) of every case of the suite """
+    for n in sizes:
+        for shape_class in shape_classes:
+            array = make_shape(shape_class, n)
+            for kind in suite_inputs:
+                points = as_input(array, kind)
+                for name, build in shape_cases:
+                    yield name, shape_class, kind, n, lambda build=build, points=points: build(points)
+        x, y = random_points(n, seed=n)[0].T
+        for name, build in value_cases:
+            yield name, 'values', 'array', n, lambda build=build, x=x, y=y: build(x, y)
+    for name, build in value_cases:
+        yield name, 'values', 'scalar', 1, lambda build=build: build(0.3, -0.7)
+    for name, call in single_cases:
+        yield name, 'values', 'scalar', 1, lambda call=call: call
+
+
+def uncovered():
+    """ The public functions and classes of geometry_2d no case of the suite calls """
+    covered = {name.split('(')[0] for name, _ in shape_cases + value_cases + single_cases}
+    return sorted(name for name, value in vars(geometry_2d).items() if not name.startswith('_') and callable(value)
+                  and getattr(value, '__module__', None) == 'geometry_2d' and name not in covered)
+
+
+def quick_time(func, repeat=3, minimum=0.01):
+    """ Like best_time with repeats of ~minimum seconds, the suite has hundreds of cases """
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= minimum:
+            break
+        number = max(number * 2, int(number * minimum * 1.2 / max(elapsed, 1e-9)))
+    return min([elapsed] + timer.repeat(repeat - 1, number)) / number
+
+
+def _same(output, other):
+    """ Whether a tuple and an array input of a case gave the same output, or raised the same exception """
+    if isinstance(output, Exception) or isinstance(other, Exception):
+        return type(output) is type(other)
+    if output is None or other is None:
+        return output is other
+    try:
+        output, other = numpy.asarray(output, dtype=float), numpy.asarray(other, dtype=float)
+    except (TypeError, ValueError):
+        return len(output) == len(other) and all(_same(a, b) for a, b in zip(output, other))
+    return output.shape == other.shape and numpy.allclose(output, other, rtol=1e-9, atol=1e-9, equal_nan=True)
+
+
+def run_suite(sizes=suite_sizes, functions=None, progress=None):
+    """
+    Times every case, or those of the functions named in functions, and returns the results as a JSON friendly dict:
+    {'meta': {...}, 'results': {'function/shape class/input/size': {'seconds': ...} or {'error': ...}},
+    'inconsistent': ['function/shape class/size' of the cases where the tuple and the array input disagree]}
+    A case that raises is kept with the exception as its error, degenerate shapes are expected to fail in places,
+    but the same way for both inputs: one raising where the other returns, or different outputs, is inconsistent
+    """
+    results = {}
+    tuple_outputs = {}  # 'function/shape class/size': what the tuple input gave, until the array input runs
+    inconsistent = []
+    with warnings.catch_warnings(), numpy.errstate(all='ignore'):
+        warnings.simplefilter('ignore')
+        for name, shape_class, kind, n, build in suite_cases(sizes):
+            if functions and name.split('(')[0] not in functions:
+                continue
+            key = '{}/{}/{}/{}'.format(name, shape_class, kind, n)
+            try:
+                call = build()
+                output = call()
+                results[key] = {'seconds': quick_time(call)}
+            except Exception as exception:
+                output = exception
+                results[key] = {'error': '{}: {}'.format(type(exception).__name__, exception)}
+            case = '{}/{}/{}'.format(name, shape_class, n)
+            if kind == 'tuple':
+                tuple_outputs[case] = output
+            elif case in tuple_outputs and not _same(tuple_outputs.pop(case), output):
+                inconsistent.append(case)
+            if progress is not None:
+                progress(key, results[key])
+    return {'meta': {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                     'numpy': numpy.__version__, 'machine': platform.platform(), 'processor': platform.processor(),
+                     'sizes': list(sizes), 'uncovered': uncovered()},
+            'results': results, 'inconsistent': inconsistent}
+
+
+def retime(results, keys, times=3):
+    """
+    Times the cases of keys again times times and keeps their best time, a slowdown that is noise goes away
+    when it is measured again while a real one stays
+    """
+    keys = set(keys)
+    with warnings.catch_warnings(), numpy.errstate(all='ignore'):
+        warnings.simplefilter('ignore')
+        for name, shape_class, kind, n, build in suite_cases(results['meta']['sizes']):
+            key = '{}/{}/{}/{}'.format(name, shape_class, kind, n)
+            if key in keys:
+                call = build()
+                for _ in range(times):
+                    results['results'][key]['seconds'] = min(results['results'][key]['seconds'], quick_time(call))
+
+
+def compare(results, baseline, threshold=0.25, floor=1e-7):
+    """
+    Compares suite results with a baseline run (on the same machine, timings of different ones say little)
+    A case is a regression if it got slower by more than threshold (0.25 = 25%) and by more than floor seconds,
+    which keeps the noise of the sub microsecond cases out, an improvement the other way round.
+    Returns {'regressions': [(key, baseline seconds, seconds)], 'improvements': [...],
+    'errors': [(key, baseline result, result)] of cases that started or stopped failing, 'missing': [keys], 'new': [keys],
+    'inconsistent': [cases] where the tuple and the array input of the results disagree}
+    """
+    old, new = baseline['results'], results['results']
+    report = {'regressions': [], 'improvements': [], 'errors': [], 'missing': sorted(set(old) - set(new)),
+              'new': sorted(set(new) - set(old)), 'inconsistent': results.get('inconsistent', [])}
+    for key in sorted(set(old) & set(new)):
+        before, after = old[key].get('seconds'), new[key].get('seconds')
+        if before is None or after is None:
+            if old[key] != new[key] and (before is None) != (after is None):
+                report['errors'].append((key, old[key], new[key]))
+        elif after > before * (1 + threshold) and after - before > floor:
+            report['regressions'].append((key, before, after))
+        elif before > after * (1 + threshold) and before - after > floor:
+            report['improvements'].append((key, before, after))
+    return report
+
+
+def print_comparison(report):
+    for title in ('regressions', 'improvements'):
+        for key, before, after in sorted(report[title], key=lambda entry: entry[1] / entry[2]):
+            print('{:<12} {:<52} {:>12.3f}us -> {:>12.3f}us  x{:.2f}'.format(title[:-1], key, before * 1e6, after * 1e6, after / before))
+    for key, before, after in report['errors']:
+        print('{:<12} {:<52} {} -> {}'.format('error', key, before.get('error', 'ok'), after.get('error', 'ok')))
+    for title in ('missing', 'new', 'inconsistent'):
+        if report[title]:
+            print('{} {}: {}'.format(len(report[title]), title, ', '.join(report[title][:5]) + (', ...' if len(report[title]) > 5 else '')))
+    print('{} regressions, {} improvements, {} changed errors, {} inconsistent'.format(
+        len(report['regressions']), len(report['improvements']), len(report['errors']), len(report['inconsistent'])))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of geometry_2d, the comparisons of the optimizations by default')
+    parser.add_argument('--suite', action='store_true', help='time every public function on every shape class, input and size')
+    parser.add_argument('--sizes', type=int, nargs='+', default=suite_sizes, help='the shape sizes of the suite')
+    parser.add_argument('--functions', nargs='+', help='only the cases of these functions')
+    parser.add_argument('--output', help='save the suite results to this JSON file')
+    parser.add_argument('--baseline', help='compare with the suite results in this JSON file, exits with 1 on regressions')
+    parser.add_argument('--results', help='compare these saved results with the baseline instead of running the suite')
+    parser.add_argument('--threshold', type=float, default=0.25, help='the slowdown counted as a regression, 0.25 = 25%%')
+    arguments = parser.parse_args()
+    if not (arguments.suite or arguments.results):
+        bench_transformations()
+        bench_transform_chain()
+        bench_mbbox()
+        bench_polygon()
+        bench_batched()
+        bench_intersections()
+        bench_point_in_polygon()
+        bench_obstacle_index()
+        bench_planner()
+        bench_occupancy_grid()
+        return
+    if arguments.results:
+        with open(arguments.results) as file:
+            results = json.load(file)
+    else:
+        def progress(key, result):
+            print('{:<52} {}'.format(key, '{:>12.3f}us'.format(result['seconds'] * 1e6) if 'seconds' in result else result['error']))
+        results = run_suite(arguments.sizes, arguments.functions, progress)
+        if results['meta']['uncovered']:
+            print('not benchmarked: ' + ', '.join(results['meta']['uncovered']))
+        if results['inconsistent']:
+            print('tuple and array inputs disagree: ' + ', '.join(results['inconsistent']))
+        if arguments.output:
+            with open(arguments.output, 'w') as file:
+                json.dump(results, file, indent=1)
+    if arguments.baseline:
+        with open(arguments.baseline) as file:
+            baseline = json.load(file)
+        report = compare(results, baseline, arguments.threshold)
+        if report['regressions'] and not arguments.results:
+            retime(results, [key for key, _, _ in report['regressions']])
+            report = compare(results, baseline, arguments.threshold)
+            if arguments.output:
+                with open(arguments.output, 'w') as file:
+                    json.dump(results, file, indent=1)
+        print_comparison(report)
+        if report['regressions']:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,333 +1,487 @@
-import gpiozero.output_devices as od
-import gpiozero.input_devices as id
-import threading
-from geometry_2d import *
-import time
-import smbus
+"""
+Drives the car: a Car runs the sensor threads, the control loop and the calibration on a backend\n
+Importing this module is cheap, numpy, the control modules and the devices are only loaded when a Car is made
+and each device only when it is first used. The module level names are those of default_car(), to read and to set,
+e.g. hardware_control.turn_on() and hardware_control.current_angle = 90, so scripts keep working with one car
+"""
+import collections
+import functools
 import math
-
-# Constants
-angle_threshold = 5
-location_threshold = 5
-speed_step = 0.02
-
-# Motors
-speed_factors = {'left_max': 0.6, 'left_min': 0.3, 'right_max': 0.6, 'right_min': 0.3}
-speed_factor_pairs = []
-response_time = 0.1
-left_motor = od.Motor(14, 15, pwm=True)
-right_motor = od.Motor(20, 21, pwm=True)
-
-# Sensors
-#ldr = id.DigitalInputDevice(0)
-length_moved_per_pulse = 0.01  # 1cm
-proximity_sensors = {'Front': 1, 'Right': 2,
-                     'Left': 3}
-# Variables
-debug = False
-running = False
-current_point = (0, 0)
-current_angle = 0
-wanted_point = (0, 0)
-wanted_angle = 0
-
-
-def move_forward(distance):
-    global wanted_point
-    p = to_cartesian(distance, wanted_angle)
-    wanted_point = wanted_point[0] + p[0], wanted_point[1] + p[1]
-
-
-def move_backward(distance):
-    global wanted_point
-    p = to_cartesian(distance, wanted_angle)
-    wanted_point = wanted_point[0] - p[0], wanted_point[1] - p[1]
-
-
-def move_to_point(x, y):
-    global wanted_point
-    wanted_point = x, y
-
-def rotate_to_angle(angle):
-    wanted_point = current_point
-    wanted_angle = angle
-
-def stop():
-    global wanted_point, wanted_angle
-    wanted_point = current_point
-    wanted_angle = current_angle
-
-
-def calibrate():
-    global response_time, speed_factor_pairs, speed_factors
-    if not current_angle_updater_thread.is_alive():
-        raise RuntimeError('Cannot calibrate before starting the angle updater thread')
-    speed_control_lock.acquire()
-    cbegin = time.perf_counter()
-    lprint("Calibrating...")
-    right_motor.stop()
-    left_motor.stop()
-    if not running:
-        raise InterruptedError
-    lprint("Computing maximum motor-sensor response time")
-    values = []
-    for motor in [right_motor,left_motor]:
-        for i in range(3):
-            if not running:
-                raise InterruptedError
-            current_angle_change_event.clear()
-            begin = time.perf_counter()
-            motor.forward(1)
-            current_angle_change_event.wait()
-            values += [time.perf_counter() - begin]
-            motor.stop()
-            response_time = max(values)
-            time.sleep(response_time)
-    lprint("= {}ms".format(response_time))
-
-    def min_speed_factor(motor, upper_bound, lower_bound):
-        for i in range(5):
-            if not running:
-                raise InterruptedError
-            mid_point = (upper_bound+lower_bound)/2
-            motor.forward(mid_point)
-            time.sleep(response_time*5)
-            current_angle_change_event.clear()
-            if current_angle_change_event.wait(response_time*5):
-                upper_bound = mid_point
-            else:
-                lower_bound = mid_point
-        motor.stop()
-        return upper_bound # The safer boundary
-    lprint("Computing minimum speed factor for right motor")
-    speed_factors['right_min'] = min_speed_factor(right_motor, speed_factors['right_max'], 0)
-    lprint('= {}'.format(speed_factors['right_min']))
-    lprint("Computing minimum speed factor for left motor")
-    speed_factors['left_min'] = min_speed_factor(left_motor, speed_factors['left_max'], 0)
-    lprint('= {}'.format(speed_factors['left_min']))
-
-    lprint("Computing speed differences between motors")
-    for i in numpy.arange(1, max(speed_factors['right_min'], speed_factors['left_min']), -0.1):
-        for o in 0, 1:
-            if o == 0:
-                right_motor.forward(i)
-                left_motor.forward(i)
-            else:
-                right_motor.backward(i)
-                left_motor.backward(i)
-            while True:
-                if not running:
-                    raise InterruptedError
-                current_angle_change_event.clear()
-                angle = current_angle
-                if current_angle_change_event.wait(response_time * 2):
-                    if angle > current_angle:  # Rotating clockwise
-                        if o == 0:
-                            left_motor.forward(left_motor.value - speed_step)
-                        else:
-                            right_motor.backward(left_motor.value - speed_step)
-
-                    else:  # Rotating counter clockwise
-                        if o == 0:
-                            right_motor.forward(left_motor.value - speed_step)
-                        else:
-                            left_motor.backward(left_motor.value - speed_step)
-                else:
-                    speed_factor_pairs += [(left_motor.value, right_motor.value)]
-                    break
-    lprint("= {}".format(speed_factor_pairs))
-    a = tuple(zip(*speed_factor_pairs))
-    lm, rm = max(a[0]), max(a[1])
-    speed_factors['left_max'] = lm
-    speed_factors['right_max'] = rm
-    lprint("Finished calibrating in {}ms".format(time.perf_counter() - cbegin))
-    speed_control_lock.release()
-
-
-#def get_proximity_readings():
- #   readings = {}
-  #  if proximity_sensors['Front'].is_active():
-   #     readings['Front'] = 0.1
-    #if proximity_sensors['Right'].is_active():
-    #    readings['Right'] = 0.02
-    #if proximity_sensors['Left'].is_active():
-    #    readings['Left'] = 0.02
-    #return readings
-
-
-def speed_control():
-    global current_angle, wanted_angle
-    while running:
-        time.sleep(response_time)
-        speed_control_lock.acquire()
-        wanted_angle = get_angle(wanted_point, current_point, principal=False)
-        angle_dif = signed_angle_dif(wanted_angle, current_angle)
-        match_point = get_length((wanted_point, current_point)) >= location_threshold
-        # If the difference was high Or if we arrived at wanted_point then stop and correct the angle
-        if abs(angle_dif) > angle_threshold * 4 or (not match_point and abs(angle_dif) > angle_threshold):
-            lprint('Big angle difference stopping and correcting')
-            if angle_dif > 90:
-                rs = speed_factors['right_max']
-                ls = speed_factors['left_max']
-            elif angle_dif > 45:
-                rs = (speed_factors['right_max'] + speed_factors['right_min']) / 2
-                ls = (speed_factors['left_max'] + speed_factors['left_min']) / 2
-            else:
-                rs = speed_factors['right_min']
-                ls = speed_factors['left_min']
-            if angle_dif < 0:
-                left_motor.forward(ls)
-                right_motor.backward(rs)
-            else:
-                left_motor.backward(ls)
-                right_motor.forward(rs)
-        # If there is a small angle difference but we still need to get to a point then correct it as the car is moving
-        elif abs(angle_dif) > angle_threshold and match_point:
-            lprint('Small angle difference while moving to point. Correcting ls={} rs{}'.format(left_motor.value,right_motor.value))
-            if angle_dif < 0:
-                if right_motor.value <= 0 or left_motor.value <= 0:
-                    right_motor.forward(speed_factors['right_max'])
-                    left_motor.forward(speed_factors['left_max'] - speed_step)
+import os
+import sys
+import threading
+import types
+
+
+class GpioBackend:
+    """ The real car: gpiozero motors and inputs on the Raspberry Pi and its I2C bus """
+
+    @functools.cached_property
+    def clock(self):
+        from timing import REAL_CLOCK
+        return REAL_CLOCK
+
+    def motor(self, name, forward_pin, backward_pin):
+        import gpiozero.output_devices as od
+        return od.Motor(forward_pin, backward_pin, pwm=True)
+
+    def smbus(self, number):
+        import smbus
+        return smbus.SMBus(number)
+
+    def input_device(self, pin):
+        import gpiozero.input_devices as id
+        return id.DigitalInputDevice(pin)
+
+
+def make_backend():
+    """ The real car, or simulation.Simulator in virtual time if SMARTCAR_BACKEND=simulation """
+    if os.environ.get('SMARTCAR_BACKEND') == 'simulation':
+        from simulation import Simulator
+        return Simulator()
+    return GpioBackend()
+
+
+class Car:
+    """
+    One car on a backend, by default make_backend(). Several cars can share a process, e.g. simulation.Simulators
+    that share one VirtualClock. The motors, the I2C bus and the encoder are made by the backend when first used\n
+    Positions are in meters and angles in degrees. profile_path is where the calibration profile is loaded from
+    by turn_on() and saved to after every calibration, None keeps it in memory only
+    """
+    # Constants
+    angle_threshold = 5
+    location_threshold = 0.05  # 5cm, positions are in meters
+    speed_step = 0.02
+    control_period = 0.05  # Seconds between control ticks, new sensor data wakes the controller sooner
+    motor_pins = {'left': (14, 15), 'right': (20, 21)}
+    encoder_pin = 0  # Wheel encoder (LDR) input, one pulse per length_moved_per_pulse
+    length_moved_per_pulse = 0.01  # 1cm
+    default_speed_factors = {'left_max': 0.6, 'left_min': 0.3, 'right_max': 0.6, 'right_min': 0.3}  # Until calibrated
+    declination = -0.00669  # define declination angle of location where measurement going to be done
+    proximity_sensors = {'Front': 1, 'Right': 2,
+                         'Left': 3}
+    # Path planning
+    car_shape = ((-0.1, -0.08), (0.1, -0.08), (0.1, 0.08), (-0.1, 0.08))  # Relative to current_point
+    axle_line = ((0, -0.08), (0, 0.08))  # Relative to current_point
+
+    def __init__(self, backend=None, profile_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'calibration.json')):
+        from calibration import DriftMonitor, SpeedTable
+        from controller import Scheduler, PointController
+        from heading_filter import Pipeline, IronCalibration, Heading, LowPass
+        from odometry import Odometry
+        self.backend = make_backend() if backend is None else backend
+        self.clock = self.backend.clock
+        self.profile_path = profile_path
+        # Motors
+        self.speed_factors = dict(self.default_speed_factors)
+        self.speed_factor_pairs = []
+        self.speed_table = SpeedTable(self.speed_factor_pairs, self.speed_factors)  # Commands -> motor values, refined while driving
+        self.response_time = 0.1
+        # Sensors
+        self.odometry = Odometry(self.length_moved_per_pulse)  # Pose from the encoder pulses and the heading stream
+        self.magnetometer = None  # magnetometer.HMC5883L, created by current_angle_updater
+        self.heading_pipeline = Pipeline(IronCalibration(), Heading(self.declination), LowPass(0.2))  # Raw samples -> (time, heading, variance)
+        # Path planning
+        self.obstacles = []  # Obstacle outlines that move_to_point plans around
+        self.occupancy_grid = None  # path_planning.OccupancyGrid, if set move_to_point plans on it instead of around obstacles
+        # Control
+        self.point_controller = PointController(turn_threshold=math.radians(self.angle_threshold * 4), arrive_distance=self.location_threshold,
+                                                heading_tolerance=math.radians(self.angle_threshold))
+        self.calibrator = None  # calibration.Calibrator while calibrating
+        self.background_calibration = False
+        self.drift_monitor = DriftMonitor()
+        self.control_scheduler = Scheduler(self.control_period, self, self.odometry.snapshot, self.drive, clock=self.clock,
+                                           on_overrun=self.report_overrun)
+        self.speed_control_lock = threading.RLock()
+        self.odometry_lock = threading.Lock()  # Between the encoder thread adding pulses and reanchor()
+        self.current_angle_change_event = self.clock.Event()
+        self.current_point_change_event = self.clock.Event()
+        self.threads = []
+        self.telemetry = None  # telemetry.Telemetry recording while the car is on, see record_telemetry()
+        self.goal_records = collections.deque()  # Goals from set_path() for the control thread to record
+        self.instruments = None  # instrumentation.Instruments measuring the hot paths, see instrument()
+        # Variables
+        self.debug = False
+        self.running = False
+        self.current_point = (0, 0)
+        self.current_angle = 0  # Degrees
+        self.current_angle_variance = 0  # Radians^2
+        self.wanted_point = (0, 0)
+        self.wanted_angle = 0
+
+    @functools.cached_property
+    def left_motor(self):
+        return self.backend.motor('left', *self.motor_pins['left'])
+
+    @functools.cached_property
+    def right_motor(self):
+        return self.backend.motor('right', *self.motor_pins['right'])
+
+    def move_forward(self, distance):
+        from geometry_2d import to_cartesian
+        p = to_cartesian(distance, self.wanted_angle, degrees=True)
+        self.wanted_point = self.wanted_point[0] + p[0], self.wanted_point[1] + p[1]
+        self.set_path([self.wanted_point])
+
+    def move_backward(self, distance):
+        from geometry_2d import to_cartesian
+        p = to_cartesian(distance, self.wanted_angle, degrees=True)
+        self.wanted_point = self.wanted_point[0] - p[0], self.wanted_point[1] - p[1]
+        self.set_path([self.wanted_point])
+
+    def move_to_point(self, x, y):
+        if self.occupancy_grid is not None:
+            path = self.occupancy_grid.shortest_path(self.current_point, (x, y))
+        elif self.obstacles:
+            from geometry_2d import move, get_shortest_path
+            shape = move(self.car_shape, *self.current_point)
+            line = move(self.axle_line, *self.current_point)
+            path = get_shortest_path(shape, line, self.obstacles, (x, y))
+        else:
+            path = [self.current_point, (x, y)]
+        if path is None:
+            self.lprint('No path to {} avoiding the obstacles'.format((x, y)))
+            return
+        self.wanted_point = path[1]
+        self.set_path(path[1:])
+
+    def rotate_to_angle(self, angle):
+        self.wanted_point = self.current_point
+        self.wanted_angle = float(angle)
+        self.set_path([], heading=self.wanted_angle)
+
+    def stop(self):
+        self.wanted_point = self.current_point
+        self.wanted_angle = self.current_angle
+        self.set_path([])
+
+    def set_path(self, points, heading=None):
+        """
+        Gives point_controller the points to drive to and the heading (degrees) to turn to after them, recording them
+        as goals. Any thread may call it, the control thread records the goals so the stream has one producer
+        """
+        self.point_controller.set_path(points, None if heading is None else math.radians(heading))
+        if self.telemetry is not None:
+            now = self.clock()
+            heading = math.nan if heading is None else heading
+            for index, point in enumerate(points or [(math.nan, math.nan)]):
+                self.goal_records.append((now, index) + tuple(point) + (heading,))
+
+    def record_goals(self):
+        """ Records the goals set_path() left, from the control thread or once it stopped """
+        while self.goal_records:
+            self.telemetry.record('goals', self.goal_records.popleft())
+
+    def calibrate(self, phases=None, background=False):
+        """
+        Starts calibrating the motors in the control loop and returns the Calibrator, its finished event is set when
+        it is done, phases defaults to all of Calibrator.PHASES. The results are applied and saved to profile_path
+        unless it failed. A background calibration gives way as soon as the car is told to move.
+        Calibrating pivots the car on one wheel, which the encoder cannot follow, so when it is over the positions
+        start over from (0, 0) where the car stopped, see reanchor()
+        """
+        from calibration import Calibrator
+        phases = Calibrator.PHASES if phases is None else phases
+        self.lprint("Calibrating {}".format(', '.join(phases)))
+        calibrator = Calibrator(self.clock, self.current_profile(), math.radians(self.angle_threshold), phases, self.speed_step)
+        self.background_calibration = background
+        self.calibrator = calibrator
+        return calibrator
+
+    def current_profile(self):
+        from heading_filter import IronCalibration
+        profile = {'response_time': self.response_time, 'speed_factors': dict(self.speed_factors),
+                   'speed_factor_pairs': self.speed_table.pairs() if self.speed_factor_pairs else []}
+        if isinstance(self.heading_pipeline.stages[0], IronCalibration):
+            profile['iron_calibration'] = self.heading_pipeline.stages[0].to_dict()
+        return profile
+
+    def apply_profile(self, profile):
+        from calibration import SpeedTable
+        from heading_filter import IronCalibration
+        self.response_time = profile['response_time']
+        self.speed_factors.update(profile['speed_factors'])
+        self.speed_factor_pairs = [tuple(pair) for pair in profile['speed_factor_pairs']]
+        self.speed_table = SpeedTable(self.speed_factor_pairs, self.speed_factors)
+        if 'iron_calibration' in profile:
+            self.heading_pipeline.stages[0] = IronCalibration.from_dict(profile['iron_calibration'])
+            self.heading_pipeline.reset()
+
+    def save_profile(self):
+        if self.profile_path:
+            from calibration import save_profile
+            save_profile(self.profile_path, self.current_profile())
+
+    def update(self, pose, dt):
+        """
+        The controller of control_scheduler: runs the calibrator while there is one and point_controller otherwise,
+        returning motor values from speed_table, which it refines with the commands. Once drift_monitor finds that
+        the motors drifted it calibrates the pairs again in the background while the car is idle, which gives way
+        as soon as the car is told to move
+        """
+        calibrator = self.calibrator
+        point_controller = self.point_controller
+        if calibrator is not None:
+            if self.background_calibration and (point_controller.path or point_controller.heading is not None):
+                calibrator.stop()
+            values = calibrator.update(pose, dt)
+            if calibrator.done:
+                self.finish_calibration(calibrator)
+                self.calibrator = None
+            return values
+        command = point_controller.update(pose, dt)
+        drifted = self.drift_monitor.drifted
+        self.drift_monitor.add(self.clock(), command)
+        if self.drift_monitor.drifted:
+            if not drifted:
+                self.lprint('Speed factors drifted by {:.2f}, calibrating the pairs when idle'.format(self.drift_monitor.bias))
+            if not point_controller.path and point_controller.heading is None:
+                self.calibrate(('pairs',), background=True)
+        self.speed_table.refine(command, dt)
+        return self.speed_table.lookup(command)
+
+    def finish_calibration(self, finished):
+        if finished._begin is not None:
+            self.reanchor()  # It drove the motors
+        self.drift_monitor.reset()
+        if finished.failed:
+            self.lprint("Calibration did not finish, keeping the previous calibration")
+            return
+        self.apply_profile(finished.profile)
+        self.lprint("Finished calibrating in {:.1f}s: {}".format(self.clock() - finished._begin, finished.profile))
+        self.save_profile()
+
+    def reanchor(self, x=0, y=0):
+        """ Starts the positions over at (x, y) where the car is now, keeping the heading """
+        with self.odometry_lock:
+            self.odometry.reset(x, y, self.odometry.snapshot().theta, self.clock())
+        self.current_point = self.wanted_point = (x, y)
+        self.lprint('Positions start over at {} here'.format((x, y)))
+
+    #def get_proximity_readings(self):
+     #   readings = {}
+      #  if self.proximity_sensors['Front'].is_active():
+       #     readings['Front'] = 0.1
+        #if self.proximity_sensors['Right'].is_active():
+        #    readings['Right'] = 0.02
+        #if self.proximity_sensors['Left'].is_active():
+        #    readings['Left'] = 0.02
+        #return readings
+
+    def speed_control(self):
+        """ Runs control_scheduler until turn_off(), new heading and position data wake it right away """
+        self.control_scheduler.run()
+        self.right_motor.stop()
+        self.left_motor.stop()
+        self.lprint('speed_control thread is exiting.')
+
+    def drive(self, values):
+        """
+        Sets the motors to (left, right) motor values, negative ones turn backward
+        Does nothing while calibrate_compass() holds speed_control_lock
+        """
+        if not self.speed_control_lock.acquire(blocking=False):
+            return
+        try:
+            for motor, value in zip((self.left_motor, self.right_motor), values):
+                if value > 0:
+                    motor.forward(value)
+                elif value < 0:
+                    motor.backward(-value)
                 else:
-                    if left_motor + speed_step < speed_factors['left_max']:
-                        left_motor.forward(left_motor.value() + speed_step)
-                    else:
-                        right_motor.forward(right_motor.value() - speed_step)
+                    motor.stop()
+        finally:
+            self.speed_control_lock.release()
+        if self.point_controller.path:
+            from geometry_2d import get_angle
+            self.wanted_point = self.point_controller.path[0]
+            self.wanted_angle = get_angle(self.wanted_point, self.current_point, principal=False, degrees=True)
+        if self.telemetry is not None:
+            self.record_goals()
+            self.telemetry.record('state', (self.clock(),) + tuple(self.current_point) + (self.current_angle,) +
+                                  tuple(self.wanted_point) + (self.wanted_angle,) + tuple(values))
+
+    def report_overrun(self, report):
+        self.lprint('Control tick overran: {:.1f}ms, {:.1f}ms late'.format(report.duration * 1e3, report.lateness * 1e3))
+
+    def current_angle_updater(self):
+        from geometry_2d import signed_angle_dif
+        from magnetometer import HMC5883L
+        event_current_angle = self.current_angle
+        self.magnetometer = HMC5883L(self.backend.smbus(1), clock=self.clock)  # or bus 0 for older version boards
+        if self.instruments is not None:
+            self.instruments.wrap(self.magnetometer, 'read', 'magnetometer.read')
+        self.magnetometer.start()
+        if self.telemetry is not None:
+            from telemetry import MAGNETOMETER
+            self.telemetry.add_stream('magnetometer', MAGNETOMETER, self.magnetometer.samples)
+        next_sample = 0
+        while self.running:
+            if not self.magnetometer.wait(0.5):
+                continue
+            samples, next_sample, lost = self.magnetometer.samples.read(next_sample)
+            if not len(samples):
+                continue
+            headings = self.heading_pipeline.process(samples)
+            self.odometry.add_headings(headings)
+            t, heading, variance = headings[-1]
+            self.current_angle = math.degrees(heading)
+            self.current_angle_variance = float(variance)
+            if abs(signed_angle_dif(self.current_angle, event_current_angle)) > self.angle_threshold:
+                event_current_angle = self.current_angle
+                self.current_angle_change_event.set()
+                self.control_scheduler.notify()
+
+        self.magnetometer.stop()
+        self.lprint('current_angle_updater thread is exiting')
+
+    def calibrate_compass(self, seconds=10):
+        """ Turns the car in place while recording the magnetometer and fits the hard and soft iron calibration """
+        from heading_filter import IronCalibration
+        if self.magnetometer is None:
+            raise RuntimeError('Cannot calibrate the compass before starting the angle updater thread')
+        with self.speed_control_lock:
+            self.lprint('Calibrating the compass')
+            first = self.magnetometer.samples.written
+            self.left_motor.forward(self.speed_factors['left_min'])
+            self.right_motor.backward(self.speed_factors['right_min'])
+            self.clock.sleep(seconds)
+            self.right_motor.stop()
+            self.left_motor.stop()
+            sweep = self.magnetometer.samples.read(first)[0]
+        self.heading_pipeline.stages[0] = IronCalibration.from_sweep(sweep)
+        self.heading_pipeline.reset()
+        self.lprint('= {}'.format(self.heading_pipeline.stages[0].to_dict()))
+        self.save_profile()
+
+    def current_point_updater(self):
+        encoder = self.backend.input_device(self.encoder_pin)
+        while self.running:
+            if not encoder.wait_for_active(0.5):
+                continue
+            # Only move the current_point if both wheels turn the same way, turning in place does not move the car
+            if self.left_motor.value > 0 and self.right_motor.value > 0:
+                direction = 1
+            elif self.left_motor.value < 0 and self.right_motor.value < 0:
+                direction = -1
             else:
-                if right_motor.value() <= 0 or left_motor.value <= 0:
-                    right_motor.forward(speed_factors['right_max'] - speed_step)
-                    left_motor.forward(speed_factors['left_max'])
-                else:
-                    if right_motor + speed_step < speed_factors['right_max']:
-                        right_motor.forward(right_motor.value() + speed_step)
-                    else:
-                        left_motor.forward(left_motor.value() - speed_step)
-
-        # If the angle is okay but we need to get to the wanted_point
-        elif match_point:
-            lprint('Angle is okay moving to wanted point')
-            if right_motor.value() <= 0 or left_motor.value <= 0:
-                right_motor.forward(speed_factors['right_max'])
-                left_motor.forward(speed_factors['left_max'])
-        # If we arrived at wanted_point and wanted_angle then stop
+                direction = 0
+            now = self.clock()
+            with self.odometry_lock:
+                self.odometry.add_pulse(now, direction)
+                pose = self.odometry.snapshot()
+                self.current_point = pose.x, pose.y
+            if self.telemetry is not None:
+                self.telemetry.record('pulses', (now, direction))
+            self.current_point_change_event.set()
+            self.control_scheduler.notify()
+            encoder.wait_for_inactive(0.5)
+        encoder.close()
+        self.lprint('current_point_updater thread is exiting')
+
+    def record_telemetry(self, directory, **options):
+        """
+        Records the state, magnetometer, pulses and goals streams to directory while the car is on,
+        options go to telemetry.Telemetry. replay.Replay can run the drive again from them.
+        Every stream is recorded from one thread: state and goals from the control loop, pulses from
+        current_point_updater and magnetometer from the HMC5883L's thread
+        """
+        from telemetry import Telemetry, STATE, PULSES, GOALS
+        self.telemetry = Telemetry(directory, clock=self.clock, **options)
+        for name, dtype in (('state', STATE), ('pulses', PULSES), ('goals', GOALS)):
+            self.telemetry.add_stream(name, dtype)
+        return self.telemetry
+
+    def instrument(self):
+        """
+        Starts measuring the hot paths and returns the instrumentation.Instruments, see Instruments.wrap_scheduler for
+        the 'control' loop and the event it sleeps on. 'magnetometer.read' times the I2C reads and
+        'speed_control_lock.wait' the lock acquisitions. uninstrument() takes every wrapper out again
+        """
+        if self.instruments is None:
+            from instrumentation import Instruments
+            self.instruments = Instruments()
+            self.instruments.wrap_scheduler(self.control_scheduler, 'control')
+            self.instruments.wrap_lock(self, 'speed_control_lock', 'speed_control_lock')
+            if self.magnetometer is not None:
+                self.instruments.wrap(self.magnetometer, 'read', 'magnetometer.read')
+        return self.instruments
+
+    def uninstrument(self):
+        """ Takes the instrumentation out again and returns the Instruments with what they measured """
+        instruments, self.instruments = self.instruments, None
+        if instruments is not None:
+            instruments.restore()
+        return instruments
+
+    def turn_on(self, calibrate_first=False, debugging=False):
+        """ Loads the calibration profile and starts the threads, calibrate_first calibrates if there is no profile yet """
+        from calibration import load_profile
+        self.debug = debugging
+        self.lprint("Turning on hardware control")
+        profile = load_profile(self.profile_path) if self.profile_path else None
+        if profile is not None:
+            self.apply_profile(profile)
+            self.lprint("Loaded the calibration profile {}".format(self.profile_path))
+        elif calibrate_first:
+            self.calibrate()
+        self.running = True
+        if self.telemetry is not None:
+            self.telemetry.start()
+        self.threads = [self.clock.Thread(name='current_angle_updater', target=self.current_angle_updater),
+                        self.clock.Thread(name='current_point_updater', target=self.current_point_updater),
+                        self.clock.Thread(name='speed_control', target=self.speed_control)]
+        for thread in self.threads:
+            thread.start()
+
+    def turn_off(self):
+        self.lprint("Turning off hardware control")
+        self.running = False
+        self.control_scheduler.stop()
+        for thread in self.threads:
+            if thread.is_alive():
+                thread.join()
+        if self.telemetry is not None:
+            self.record_goals()
+            self.telemetry.stop()
+        if self.speed_factor_pairs:
+            self.save_profile()  # With the pairs speed_table refined
+        self.clock.sleep(2)
+        self.right_motor.stop()
+        self.left_motor.stop()
+
+    def lprint(self, msg):
+        if self.debug:
+            print(msg)
+
+
+_default_car = None
+
+
+def default_car():
+    """ The Car of the module level names, made on first use on make_backend() with the SMARTCAR_PROFILE profile """
+    global _default_car
+    if _default_car is None:
+        profile_path = os.environ.get('SMARTCAR_PROFILE')
+        _default_car = Car() if profile_path is None else Car(profile_path=profile_path)
+    return _default_car
+
+
+def __getattr__(name):
+    if name.startswith('__'):
+        raise AttributeError(name)
+    return getattr(default_car(), name)
+
+
+class _CarModule(types.ModuleType):
+    """ Sets the names the module does not have on default_car() instead of hiding the car's behind new globals """
+
+    def __setattr__(self, name, value):
+        if name.startswith('__') or name in vars(self):
+            types.ModuleType.__setattr__(self, name, value)
         else:
-            right_motor.stop()
-            left_motor.stop()
-        speed_control_lock.release()
-    lprint('speed_control thread is exiting.')
-
-
-def current_angle_updater():
-    global current_angle
-    event_current_angle = current_angle
-    Register_A = 0  # Address of Configuration register A
-    Register_B = 0x01  # Address of configuration register B
-    Register_mode = 0x02  # Address of mode register
-
-    X_axis_H = 0x03  # Address of X-axis MSB data register
-    Z_axis_H = 0x05  # Address of Z-axis MSB data register
-    Y_axis_H = 0x07  # Address of Y-axis MSB data register
-    declination = -0.00669  # define declination angle of location where measurement going to be done
+            setattr(default_car(), name, value)
+
 
-    def Magnetometer_Init():
-        # write to Configuration Register A
-        bus.write_byte_data(Device_Address, Register_A, 0x70)
-
-        # Write to Configuration Register B for gain
-        bus.write_byte_data(Device_Address, Register_B, 0xa0)
-
-        # Write to mode Register for selecting mode
-        bus.write_byte_data(Device_Address, Register_mode, 0)
-
-    def read_raw_data(addr):
-
-        # Read raw 16-bit value
-        high = bus.read_byte_data(Device_Address, addr)
-        low = bus.read_byte_data(Device_Address, addr + 1)
-
-        # concatenate higher and lower value
-        value = ((high << 8) | low)
-
-        # to get signed value from module
-        if value > 32768:
-            value = value - 65536
-        return value
-
-    bus = smbus.SMBus(1)  # or bus = smbus.SMBus(0) for older version boards
-    Device_Address = 0x1e  # HMC5883L magnetometer device address
-    Magnetometer_Init()  # initialize HMC5883L magnetometer
-    while True:
-        time.sleep(0.1)
-        # Read Accelerometer raw value
-        x = read_raw_data(X_axis_H)
-        z = read_raw_data(Z_axis_H)
-        y = read_raw_data(Y_axis_H)
-
-        heading = math.atan2(y, x) + declination
-
-        # Due to declination check for >360 degree
-        if (heading > 2 * numpy.pi):
-            heading = heading - 2 * numpy.pi
-
-        # check for sign
-        if (heading < 0):
-            heading = heading + 2 * numpy.pi
-
-        # convert into angle
-        heading_angle = int(heading * 180 / numpy.pi)
-        current_angle = heading_angle
-        if abs(current_angle - event_current_angle) > angle_threshold:
-            event_current_angle = current_angle
-            current_angle_change_event.set()
-
-    lprint('current_angle_updater thread is exiting')
-
-
-def current_point_updater():
-    while running:
-        global current_point
-        ldr.wait_for_active()
-        # Only update the current_point if the car is not turning
-        if left_motor.value() > 0 and right_motor.value > 0:
-            p = to_cartesian(length_moved_per_pulse, current_angle)
-            current_point = current_point[0] + p[0], current_point[1] + p[1]
-        current_point_change_event.set()
-        ldr.wait_for_inactive()  # We may not need this !!!
-    lprint('current_point_updater thread is exiting')
-
-
-speed_control_thread = threading.Thread(name='speed_control', target=speed_control)
-calibrate_thread = threading.Thread(name='calibrate', target=calibrate)
-speed_control_lock = threading.RLock()
-current_angle_updater_thread = threading.Thread(name='current_angle_updater', target=current_angle_updater)
-current_angle_change_event = threading.Event()
-current_point_updater_thread = threading.Thread(name='current_point_updater', target=current_point_updater)
-current_point_change_event = threading.Event()
-
-def turn_on(calibrate_first=False, debugging=False):
-    global running, debug
-    debug = debugging
-    lprint("Turning on hardware control")
-    running = True
-    current_angle_updater_thread.start()
-    if calibrate_first:
-        calibrate_thread.start()
-    #current_point_updater_thread.start()
-    speed_control_thread.start()
-
-
-def turn_off():
-    global running
-    lprint("Turning off hardware control")
-    running = False
-    for thread in [calibrate_thread, speed_control_thread, current_angle_updater_thread, current_point_updater_thread]:
-        if thread.is_alive():
-            thread.join()
-    time.sleep(2)
-    right_motor.stop()
-    left_motor.stop()
-
-
-def lprint(msg):
-    if debug:
-        print(msg)
+sys.modules[__name__].__class__ = _CarModule
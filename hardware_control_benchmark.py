@@ -0,0 +1,28 @@
+import subprocess
+import sys
+from geometry_2d_benchmark import best_time
+
+
+def import_time(statement, repeat=5):
+    """ Best time of running statement in a fresh interpreter, without the interpreter's own start up """
+    code = 'import time\nbegin = time.perf_counter()\n{}\nprint(time.perf_counter() - begin)'.format(statement)
+    return min(float(subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout)
+               for i in range(repeat))
+
+
+def bench_import():
+    for statement in ('import hardware_control', 'import geometry_2d', 'import hardware_control\nhardware_control.Car(profile_path=None)'):
+        print('{:<60} {:>8.1f}ms'.format(statement.replace('\n', '; '), import_time(statement) * 1e3))
+
+
+def bench_car():
+    from hardware_control import Car
+    from simulation import Simulator
+    print('Car(Simulator()) {:.1f}us  first motor {:.1f}us'.format(
+        best_time(lambda: Car(Simulator(), profile_path=None), repeat=5) * 1e6,
+        best_time(lambda: Car(Simulator(), profile_path=None).left_motor, repeat=5) * 1e6))
+
+
+if __name__ == '__main__':
+    bench_import()
+    bench_car()
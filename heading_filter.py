@@ -0,0 +1,203 @@
+"""
+Streaming heading pipeline for the magnetometer\n
+Stages take and return numpy batches so a whole ring buffer read is processed at once:
+samples are (N, 4) arrays of (time, x, y, z) like magnetometer.HMC5883L pushes,
+headings are (N, 3) arrays of (time, heading, variance) with the heading in radians in [0, 2pi)
+and an optional 4th column with a turn rate in radians/s for ComplementaryFilter\n
+Typical use:
+pipeline = Pipeline(IronCalibration.from_sweep(sweep), Heading(declination), LowPass(0.2))
+headings = pipeline.process(samples)
+"""
+import numpy
+
+
+class Pipeline:
+    """ Runs a batch through the stages in order """
+
+    def __init__(self, *stages):
+        self.stages = list(stages)
+
+    def process(self, batch):
+        for stage in self.stages:
+            batch = stage.process(batch)
+        return batch
+
+    def reset(self):
+        for stage in self.stages:
+            if hasattr(stage, 'reset'):
+                stage.reset()
+
+
+class IronCalibration:
+    """
+    Hard and soft iron correction of the x and y axes: (x, y) -> matrix @ ((x, y) - offset)\n
+    A level sweep of the car turning in place traces an ellipse, from_sweep fits it
+    and returns the correction that maps it to a circle around the origin with the same area
+    """
+
+    def __init__(self, offset=(0, 0), matrix=((1, 0), (0, 1))):
+        self.offset = numpy.asarray(offset, dtype=numpy.float64)
+        self.matrix = numpy.asarray(matrix, dtype=numpy.float64)
+
+    @classmethod
+    def from_sweep(cls, samples):
+        """ Fits the (N, 4) samples of a full turn, raises ValueError if they do not describe an ellipse """
+        samples = numpy.asarray(samples, dtype=numpy.float64)
+        a, b, c, d, e, f = fit_ellipse(samples[:, 1], samples[:, 2])
+        shape = numpy.array(((a, b / 2), (b / 2, c)))
+        offset = numpy.linalg.solve(2 * shape, (-d, -e))
+        # (p - offset)' shape (p - offset) = k on the ellipse
+        shape = shape / (offset @ shape @ offset - f)
+        values, vectors = numpy.linalg.eigh(shape)
+        if values.min() <= 0:
+            raise ValueError('The sweep does not describe an ellipse')
+        radius = 1 / numpy.sqrt(numpy.sqrt(values.prod()))
+        return cls(offset, radius * (vectors * numpy.sqrt(values)) @ vectors.T)
+
+    def process(self, samples):
+        samples = numpy.array(samples, dtype=numpy.float64)
+        samples[:, 1:3] = (samples[:, 1:3] - self.offset) @ self.matrix.T
+        return samples
+
+    def to_dict(self):
+        return {'offset': self.offset.tolist(), 'matrix': self.matrix.tolist()}
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(values['offset'], values['matrix'])
+
+
+class Heading:
+    """
+    Turns (time, x, y, z) samples into (time, heading, variance)\n
+    The heading is atan2(y, x) + declination in [0, 2pi) like current_angle_updater computed it,
+    noise is the standard deviation of one axis in counts after calibration
+    """
+
+    def __init__(self, declination=0, noise=2):
+        self.declination = declination
+        self.noise = noise
+
+    def process(self, samples):
+        samples = numpy.asarray(samples, dtype=numpy.float64)
+        x, y = samples[:, 1], samples[:, 2]
+        headings = numpy.empty((len(samples), 3))
+        headings[:, 0] = samples[:, 0]
+        headings[:, 1] = numpy.mod(numpy.arctan2(y, x) + self.declination, 2 * numpy.pi)
+        with numpy.errstate(divide='ignore'):
+            headings[:, 2] = self.noise ** 2 / (x ** 2 + y ** 2)
+        return headings
+
+
+class LowPass:
+    """
+    First order low pass filter of the heading with time_constant in seconds\n
+    The heading is unwrapped against the filter state before filtering, so 359 and 1 degrees average to 0
+    instead of 180. The variance is propagated through the filter, the first sample is taken as is
+    """
+
+    def __init__(self, time_constant):
+        self.time_constant = time_constant
+        self.reset()
+
+    def reset(self):
+        self._time = None
+        self._heading = 0.0
+        self._variance = numpy.inf
+
+    def process(self, headings):
+        headings = numpy.asarray(headings, dtype=numpy.float64)
+        if not len(headings):
+            return headings[:, :3].copy()
+        times = headings[:, 0]
+        # Out of order samples are treated as simultaneous
+        dt = numpy.maximum(numpy.diff(times, prepend=times[0] if self._time is None else self._time), 0)
+        alpha = -numpy.expm1(-dt / self.time_constant)  # 1 - exp(-dt / time_constant)
+        if self._time is None:
+            alpha[0] = 1
+        keep = 1 - alpha
+        measured = numpy.unwrap(numpy.concatenate(((self._heading,), headings[:, 1])))[1:]
+        prediction, process_variance = self._prediction(headings, dt)
+        heading = _linear_recurrence(keep, keep * prediction + alpha * measured, self._heading)
+        variance = _linear_recurrence(keep ** 2, keep ** 2 * process_variance + alpha ** 2 * headings[:, 2],
+                                      0.0 if self._time is None else self._variance)
+        self._time, self._heading, self._variance = times[-1], heading[-1] % (2 * numpy.pi), variance[-1]
+        return numpy.stack((times, numpy.mod(heading, 2 * numpy.pi), variance), axis=1)
+
+    def _prediction(self, headings, dt):
+        """ Returns the change of the heading between samples and the variance it adds """
+        return 0.0, 0.0
+
+
+class ComplementaryFilter(LowPass):
+    """
+    LowPass that integrates the turn rate in the 4th column of the headings (radians/s, e.g. from the wheels)
+    between samples, so the filter does not lag while turning\n
+    rate_noise is the variance the integration adds per second, in radians^2/s
+    """
+
+    def __init__(self, time_constant, rate_noise=0.01):
+        self.rate_noise = rate_noise
+        LowPass.__init__(self, time_constant)
+
+    def _prediction(self, headings, dt):
+        if headings.shape[1] < 4:
+            return 0.0, self.rate_noise * dt
+        return headings[:, 3] * dt, self.rate_noise * dt
+
+
+def fit_ellipse(x, y):
+    """
+    Least squares ellipse through the points (Fitzgibbon's direct fit, Halir and Flusser's stable form)\n
+    Returns the conic coefficients (a, b, c, d, e, f) of a x^2 + b xy + c y^2 + d x + e y + f = 0
+    """
+    x = numpy.asarray(x, dtype=numpy.float64)
+    y = numpy.asarray(y, dtype=numpy.float64)
+    # Centering and scaling keeps the scatter matrices well conditioned for raw counts
+    mx, my = x.mean(), y.mean()
+    s = max(x.std(), y.std(), 1e-12)
+    u, v = (x - mx) / s, (y - my) / s
+    quadratic = numpy.stack((u * u, u * v, v * v), axis=1)
+    linear = numpy.stack((u, v, numpy.ones_like(u)), axis=1)
+    s1, s2, s3 = quadratic.T @ quadratic, quadratic.T @ linear, linear.T @ linear
+    t = -numpy.linalg.solve(s3, s2.T)
+    m = s1 + s2 @ t
+    m = numpy.stack((m[2] / 2, -m[1], m[0] / 2))
+    _, vectors = numpy.linalg.eig(m)
+    vectors = vectors.real
+    condition = 4 * vectors[0] * vectors[2] - vectors[1] ** 2
+    if not (condition > 0).any():
+        raise ValueError('The points do not describe an ellipse')
+    a1 = vectors[:, numpy.argmax(condition > 0)]
+    a, b, c = a1
+    d, e, f = t @ a1
+    # Back to the original coordinates: u = (x - mx) / s, v = (y - my) / s
+    a, b, c, d, e = a / s ** 2, b / s ** 2, c / s ** 2, d / s, e / s
+    return (a, b, c, d - 2 * a * mx - b * my, e - 2 * c * my - b * mx,
+            f + a * mx ** 2 + b * mx * my + c * my ** 2 - d * mx - e * my)
+
+
+def _linear_recurrence(a, u, y0, block=32):
+    """
+    Returns y with y[n] = a[n] * y[n - 1] + u[n] and y[-1] = y0 without a python loop over the samples\n
+    Blocks of samples are solved at once with the products of a, and the values carried between blocks
+    follow the same recurrence, which is solved the same way
+    """
+    a = numpy.broadcast_to(numpy.asarray(a, dtype=numpy.float64), numpy.shape(u))
+    u = numpy.asarray(u, dtype=numpy.float64)
+    n = len(u)
+    if n <= 1:
+        return a * y0 + u
+    blocks = -(-n // block)
+    pad = blocks * block - n
+    a = numpy.concatenate((a, numpy.ones(pad))).reshape(blocks, block)
+    u = numpy.concatenate((u, numpy.zeros(pad))).reshape(blocks, block)
+    logs = numpy.cumsum(numpy.log(numpy.maximum(a, 1e-300)), axis=1)
+    # weights[b, i, j] is the product of a[b, j + 1 .. i], zero for j > i
+    weights = numpy.exp(numpy.minimum(logs[:, :, None] - logs[:, None, :], 0))
+    weights *= numpy.tri(block, dtype=bool)
+    local = numpy.einsum('bij,bj->bi', weights, u)
+    decay = numpy.exp(logs)
+    carried = _linear_recurrence(decay[:, -1], local[:, -1], y0, block)
+    starts = numpy.concatenate(((y0,), carried[:-1]))
+    return (local + decay * starts[:, None]).reshape(-1)[:n]
@@ -0,0 +1,294 @@
+"""
+Low overhead instrumentation of the hot paths: latency histograms and counters kept per thread\n
+Instruments measures by putting wrappers in place of methods and attributes of the objects it instruments
+(wrap, wrap_scheduler, wrap_lock, wrap_event) and restore() puts the originals back, so code that is not instrumented runs exactly
+as before and costs nothing. Durations are measured with time.perf_counter_ns, values in seconds of another clock
+are recorded in nanoseconds too. Every thread records into its own Histograms and counters without locking,
+snapshot() merges them on demand into a dict that save() writes as JSON
+"""
+import json
+import math
+import os
+import threading
+import time
+
+_MISSING = object()
+
+
+class Histogram:
+    """
+    Counts of non negative integer values in fixed log-linear buckets like an HDR histogram\n
+    Values below 2 ** bits have a bucket each, above that every power of two is split into 2 ** (bits - 1) buckets,
+    so a value is known to within 2 ** (1 - bits) of itself (about 3% with the default bits=6).
+    Values from 2 ** maximum_bits on (about 18 minutes in nanoseconds) are counted in the last bucket
+    """
+
+    def __init__(self, bits=6, maximum_bits=40):
+        self.bits = bits
+        self.counts = [0] * (self._index(2 ** maximum_bits - 1) + 1)
+        self.total = 0
+        self.minimum = math.inf
+        self.maximum = 0
+        self._last = len(self.counts) - 1
+
+    def _index(self, value):
+        shift = value.bit_length() - self.bits
+        return value if shift <= 0 else (shift << (self.bits - 1)) + (value >> shift)
+
+    def bucket(self, index):
+        """ The (lowest, highest) values counted in the bucket at index """
+        half = 1 << (self.bits - 1)
+        if index < 2 * half:
+            return index, index
+        shift = (index >> (self.bits - 1)) - 1
+        lowest = (index - (shift << (self.bits - 1))) << shift
+        return lowest, lowest + (1 << shift) - 1
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def record(self, value):
+        # _index() inline, this runs on the hot paths
+        value = int(value)
+        if value < 0:
+            value = 0
+        shift = value.bit_length() - self.bits
+        index = value if shift <= 0 else (shift << (self.bits - 1)) + (value >> shift)
+        self.counts[index if index < self._last else self._last] += 1
+        self.total += value
+        if value > self.maximum:
+            self.maximum = value
+        if value < self.minimum:
+            self.minimum = value
+
+    def merge(self, other):
+        """ Adds the counts of another Histogram with the same bits and maximum_bits """
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total += other.total
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+
+    def percentile(self, percent):
+        """ The value percent of the values are at or below, the middle of its bucket """
+        count = self.count
+        if not count:
+            return 0
+        rank = max(percent / 100 * count, 1)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                lowest, highest = self.bucket(index)
+                return min(max((lowest + highest) // 2, self.minimum), self.maximum)
+        return self.maximum
+
+    def to_dict(self):
+        count = self.count
+        return {'count': count, 'mean': self.total / count if count else 0.0,
+                'min': self.minimum if count else 0, 'max': self.maximum,
+                'p50': self.percentile(50), 'p90': self.percentile(90), 'p99': self.percentile(99), 'p99.9': self.percentile(99.9),
+                'buckets': [[*self.bucket(index), count] for index, count in enumerate(self.counts) if count]}
+
+
+class Instruments:
+    """
+    Histograms and counters by name, one set per thread, and the wrappers that fill them\n
+    histogram(name) and count(name) are for the calling thread. The wrappers record
+    name (the call's duration), name + '.wait' (time to acquire a lock or until an event wait returns) and count
+    name + '.set', '.wakeups' and '.timeouts' for events
+    """
+
+    def __init__(self, bits=6, maximum_bits=40):
+        self.bits = bits
+        self.maximum_bits = maximum_bits
+        self._local = threading.local()
+        self._threads = {}  # Thread name: (histograms, counters) of the thread
+        self._threads_lock = threading.Lock()
+        self._wrapped = []  # (owner, attribute, original or _MISSING if it was not an attribute of the instance)
+
+    def _own(self):
+        try:
+            return self._local.own
+        except AttributeError:
+            own = self._local.own = ({}, {})
+            with self._threads_lock:
+                name = threading.current_thread().name
+                while name in self._threads:
+                    name += "'"  # A thread of the same name before, keep both
+                self._threads[name] = own
+            return own
+
+    def histogram(self, name):
+        """ The Histogram of name of the calling thread """
+        histograms = self._own()[0]
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = Histogram(self.bits, self.maximum_bits)
+        return histogram
+
+    def count(self, name, amount=1):
+        counters = self._own()[1]
+        counters[name] = counters.get(name, 0) + amount
+
+    def wrap(self, owner, attribute, name):
+        """ Times the calls of the method attribute of owner into name """
+        method = getattr(owner, attribute)
+        histogram = self.histogram
+        clock = time.perf_counter_ns
+
+        def timed(*args, **kwargs):
+            begin = clock()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                histogram(name).record(clock() - begin)
+        self.replace(owner, attribute, timed)
+
+    def wrap_scheduler(self, scheduler, name):
+        """
+        Measures a controller.Scheduler: name + '.tick' the duration of every tick, '.period' the time between ticks,
+        '.jitter' how late deadline ticks start, '.latency' from the time of the pose a tick sensed to the end of
+        its actuate and counts the ticks notify() started as '.event_ticks' and the notify() calls as '.notify'.
+        The event the loop sleeps on is wrapped as name + '.wake', its '.wake.wait' are the loop's sleeps
+        """
+        tick, sense, actuate, notify = scheduler.tick, scheduler.sense, scheduler.actuate, scheduler.notify
+        histogram, count = self.histogram, self.count
+        clock = time.perf_counter_ns
+        last = [None]
+        sensed = [None]
+
+        def timed_tick(now, deadline=None):
+            if last[0] is not None:
+                histogram(name + '.period').record((now - last[0]) * 1e9)
+            last[0] = now
+            if deadline is None:
+                count(name + '.event_ticks')
+            else:
+                histogram(name + '.jitter').record((now - deadline) * 1e9)
+            begin = clock()
+            try:
+                tick(now, deadline)
+            finally:
+                histogram(name + '.tick').record(clock() - begin)
+
+        def timed_sense():
+            pose = sense()
+            sensed[0] = pose.time
+            return pose
+
+        def timed_actuate(command):
+            actuate(command)
+            if sensed[0] is not None:
+                histogram(name + '.latency').record((scheduler.clock() - sensed[0]) * 1e9)
+
+        def counted_notify():
+            count(name + '.notify')
+            notify()
+        for attribute, value in (('tick', timed_tick), ('sense', timed_sense), ('actuate', timed_actuate), ('notify', counted_notify)):
+            self.replace(scheduler, attribute, value)
+        self.wrap_event(scheduler, '_wake', name + '.wake')
+
+    def wrap_lock(self, owner, attribute, name):
+        """ Times how long acquiring the lock owner.attribute takes into name + '.wait' """
+        self.replace(owner, attribute, _TimedLock(getattr(owner, attribute), self, name))
+
+    def wrap_event(self, owner, attribute, name):
+        """ Counts the sets of the event owner.attribute and times its waits """
+        self.replace(owner, attribute, _CountedEvent(getattr(owner, attribute), self, name))
+
+    def replace(self, owner, attribute, value):
+        """ Sets owner.attribute to value until restore() """
+        self._wrapped.append((owner, attribute, vars(owner).get(attribute, _MISSING)))
+        setattr(owner, attribute, value)
+
+    def restore(self):
+        """ Puts back everything replaced, latest first. What was recorded is kept """
+        while self._wrapped:
+            owner, attribute, original = self._wrapped.pop()
+            if original is _MISSING:
+                delattr(owner, attribute)  # The class attribute, e.g. a method, shows through again
+            else:
+                setattr(owner, attribute, original)
+
+    def snapshot(self, threads=False):
+        """
+        Returns {'histograms': {name: Histogram.to_dict()}, 'counters': {name: count}} of all threads together,
+        with threads also the same for every thread under 'threads'
+        """
+        with self._threads_lock:
+            owns = list(self._threads.items())
+        histograms, counters = {}, {}
+        for thread, (own_histograms, own_counters) in owns:
+            for name, histogram in list(own_histograms.items()):
+                merged = histograms.get(name)
+                if merged is None:
+                    merged = histograms[name] = Histogram(self.bits, self.maximum_bits)
+                merged.merge(histogram)
+            for name, count in list(own_counters.items()):
+                counters[name] = counters.get(name, 0) + count
+        snapshot = {'histograms': {name: histograms[name].to_dict() for name in sorted(histograms)},
+                    'counters': dict(sorted(counters.items()))}
+        if threads:
+            snapshot['threads'] = {thread: {'histograms': {name: histogram.to_dict() for name, histogram in list(own_histograms.items())},
+                                            'counters': dict(own_counters)}
+                                   for thread, (own_histograms, own_counters) in owns}
+        return snapshot
+
+    def save(self, path, threads=False):
+        """ Writes snapshot() to path as JSON, replacing the old file in one step """
+        temporary = path + '.tmp'
+        with open(temporary, 'w') as file:
+            json.dump(self.snapshot(threads), file, indent=2)
+        os.replace(temporary, path)
+
+
+class _TimedLock:
+    """ Stands in for a lock and times the acquisitions """
+
+    def __init__(self, lock, instruments, name):
+        self.lock = lock
+        self._histogram = instruments.histogram
+        self._name = name + '.wait'
+
+    def acquire(self, blocking=True, timeout=-1):
+        begin = time.perf_counter_ns()
+        acquired = self.lock.acquire(blocking, timeout)
+        self._histogram(self._name).record(time.perf_counter_ns() - begin)
+        return acquired
+
+    def release(self):
+        self.lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exception):
+        self.release()
+
+
+class _CountedEvent:
+    """ Stands in for an event, counts the sets and times the waits """
+
+    def __init__(self, event, instruments, name):
+        self.event = event
+        self._instruments = instruments
+        self._name = name
+
+    def set(self):
+        self._instruments.count(self._name + '.set')
+        self.event.set()
+
+    def clear(self):
+        self.event.clear()
+
+    def is_set(self):
+        return self.event.is_set()
+
+    def wait(self, timeout=None):
+        begin = time.perf_counter_ns()
+        woken = self.event.wait(timeout)
+        self._instruments.histogram(self._name + '.wait').record(time.perf_counter_ns() - begin)
+        self._instruments.count(self._name + ('.wakeups' if woken else '.timeouts'))
+        return woken
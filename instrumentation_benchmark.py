@@ -0,0 +1,50 @@
+import math
+import threading
+import types
+from instrumentation import *
+from controller import PointController, Scheduler
+from odometry import Odometry
+from geometry_2d_benchmark import best_time
+
+
+def bench_histogram():
+    histogram = Histogram()
+    values = iter(range(10 ** 9))
+    print('Histogram.record {:.3f}us'.format(best_time(lambda: histogram.record(next(values))) * 1e6))
+    instruments = Instruments()
+    print('Instruments.histogram(name).record {:.3f}us'.format(best_time(lambda: instruments.histogram('x').record(1000)) * 1e6))
+    for thread in range(4):
+        worker = threading.Thread(target=lambda: [instruments.histogram('x').record(i) for i in range(1000)])
+        worker.start()
+        worker.join()
+    print('snapshot of 5 threads {:.1f}us'.format(best_time(instruments.snapshot) * 1e6))
+
+
+def bench_scheduler():
+    """ A control tick as it is, instrumented and after restore() """
+    odometry = Odometry()
+    controller = PointController()
+    scheduler = Scheduler(0.05, controller, odometry.snapshot, lambda command: None)
+    holder = types.SimpleNamespace(lock=threading.RLock())
+
+    def tick():
+        controller.set_path([(1, 1)])
+        scheduler.tick(scheduler.last_tick + 0.05 if scheduler.last_tick > -math.inf else 0.0)
+
+    def acquire():
+        with holder.lock:
+            pass
+    plain, plain_lock = best_time(tick), best_time(acquire)
+    instruments = Instruments()
+    instruments.wrap_scheduler(scheduler, 'control')
+    instruments.wrap_lock(holder, 'lock', 'lock')
+    instrumented, instrumented_lock = best_time(tick), best_time(acquire)
+    instruments.restore()
+    restored, restored_lock = best_time(tick), best_time(acquire)
+    print('Scheduler.tick  plain {:.2f}us  instrumented {:.2f}us  restored {:.2f}us'.format(plain * 1e6, instrumented * 1e6, restored * 1e6))
+    print('with RLock  plain {:.3f}us  instrumented {:.3f}us  restored {:.3f}us'.format(plain_lock * 1e6, instrumented_lock * 1e6, restored_lock * 1e6))
+
+
+if __name__ == '__main__':
+    bench_histogram()
+    bench_scheduler()
@@ -0,0 +1,196 @@
+import math
+import struct
+import time
+import numpy
+from timing import REAL_CLOCK
+
+# HMC5883L registers
+ADDRESS = 0x1e  # I2C address
+REGISTER_A = 0x00  # Configuration register A: averaging and output rate
+REGISTER_B = 0x01  # Configuration register B: gain
+REGISTER_MODE = 0x02
+REGISTER_DATA = 0x03  # X MSB, X LSB, Z MSB, Z LSB, Y MSB, Y LSB
+REGISTER_STATUS = 0x09
+REGISTER_IDENTIFICATION = 0x0a  # 'H43' in 0x0a to 0x0c
+
+OUTPUT_RATES = {0.75: 0, 1.5: 1, 3: 2, 7.5: 3, 15: 4, 30: 5, 75: 6}  # Hz -> DO2..DO0
+AVERAGING = {1: 0, 2: 1, 4: 2, 8: 3}  # Samples averaged per output -> MA1..MA0
+GAINS = {1370: 0, 1090: 1, 820: 2, 660: 3, 440: 4, 390: 5, 330: 6, 230: 7}  # LSB per gauss -> GN2..GN0
+MODE_CONTINUOUS = 0x00
+OVERFLOW = -4096  # Value of an axis whose ADC overflowed
+
+
+class RingBuffer:
+    """
+    Fixed size ring of float64 records for one producer thread and one consumer thread\n
+    The producer writes a slot and only then advances written, the consumer only reads.
+    Storing an int is atomic in CPython so neither side ever takes a lock,
+    a consumer that falls more than capacity records behind loses the oldest ones
+    """
+
+    def __init__(self, capacity, width):
+        self.capacity = capacity
+        self.written = 0  # Records pushed so far, the next one goes to slot written % capacity
+        self._data = numpy.zeros((capacity, width))
+
+    def __len__(self):
+        return min(self.written, self.capacity)
+
+    def push(self, record):
+        self._data[self.written % self.capacity] = record
+        self.written += 1
+
+    def extend(self, records):
+        """ Pushes the rows of records in one go, of more than capacity only the last ones are kept """
+        written = self.written + len(records)
+        records = records[len(records) - min(len(records), self.capacity):]
+        head = (written - len(records)) % self.capacity
+        count = min(len(records), self.capacity - head)
+        self._data[head:head + count] = records[:count]
+        self._data[:len(records) - count] = records[count:]
+        self.written = written
+
+    def read(self, start):
+        """
+        Returns (records, end, lost): a copy of the records pushed since index start,
+        the index to pass to the next read and the count of records that were overwritten before being read
+        """
+        end = self.written
+        first = max(start, end - self.capacity)
+        head, tail = first % self.capacity, end % self.capacity
+        if first == end:
+            records = self._data[:0].copy()
+        elif head < tail:
+            records = self._data[head:tail].copy()
+        else:
+            records = numpy.concatenate((self._data[head:], self._data[:tail]))
+        # Slots the producer reused while they were being copied are not valid
+        overwritten = min(max(self.written - self.capacity - first, 0), len(records))
+        return records[overwritten:], end, first - start + overwritten
+
+    def latest(self, count=1):
+        """ Returns a copy of the last count records, oldest first """
+        return self.read(max(self.written - count, 0))[0]
+
+
+class HMC5883L:
+    """
+    Streaming driver for the HMC5883L magnetometer\n
+    Every sample is one block read of the six data registers instead of six single byte reads.
+    start() runs a thread that samples at the output rate and pushes (clock(), x, y, z) records
+    into the samples ring buffer, x, y and z are in raw counts. clock is a timing clock
+    """
+
+    def __init__(self, bus, address=ADDRESS, rate=75, averaging=8, gain=390, capacity=1024, clock=REAL_CLOCK):
+        self.bus = bus
+        self.clock = clock
+        self.address = address
+        self.rate = rate
+        self.averaging = averaging
+        self.gain = gain
+        self.samples = RingBuffer(capacity, 4)
+        self.overflows = 0  # Samples dropped because an axis overflowed
+        self._new_sample = clock.Event()
+        self._thread = None
+        self._running = False
+
+    def configure(self):
+        """ Writes the rate, averaging, gain and continuous mode to the device """
+        self.bus.write_byte_data(self.address, REGISTER_A, AVERAGING[self.averaging] << 5 | OUTPUT_RATES[self.rate] << 2)
+        self.bus.write_byte_data(self.address, REGISTER_B, GAINS[self.gain] << 5)
+        self.bus.write_byte_data(self.address, REGISTER_MODE, MODE_CONTINUOUS)
+
+    def read(self):
+        """ Returns (x, y, z) in raw counts from a single block read """
+        x, z, y = struct.unpack('>hhh', bytes(self.bus.read_i2c_block_data(self.address, REGISTER_DATA, 6)))
+        return x, y, z
+
+    def start(self):
+        self.configure()
+        self._running = True
+        self._thread = self.clock.Thread(name='magnetometer', target=self._stream, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def wait(self, timeout=None):
+        """ Blocks until a sample is pushed after the last wait() returned, returns False on timeout """
+        arrived = self._new_sample.wait(timeout)
+        self._new_sample.clear()
+        return arrived
+
+    def _stream(self):
+        period = 1 / self.rate
+        deadline = self.clock()
+        while self._running:
+            x, y, z = self.read()
+            if OVERFLOW in (x, y, z):
+                self.overflows += 1
+            else:
+                self.samples.push((self.clock(), x, y, z))
+                self._new_sample.set()
+            # Sleep to the next output period, skip the periods that were missed instead of bursting to catch up
+            deadline += period
+            delay = deadline - self.clock()
+            if delay > 0:
+                self.clock.sleep(delay)
+            else:
+                deadline = self.clock()
+
+
+class FakeSMBus:
+    """
+    Stands in for smbus.SMBus with an emulated HMC5883L so the driver runs without hardware\n
+    field(t) returns the (x, y, z) reading in counts at time t, the default is a level car turning at 90 degrees/s.
+    Counts the transactions and the time they would take on the wire at clock_hz
+    """
+
+    def __init__(self, field=None, clock_hz=100000, clock=time.monotonic, address=ADDRESS):
+        self.field = field if field is not None else _turning_field
+        self.clock_hz = clock_hz
+        self.clock = clock
+        self.address = address
+        self.registers = bytearray(13)
+        self.registers[REGISTER_IDENTIFICATION:] = b'H43'
+        self.transactions = 0
+        self.bus_time = 0  # Seconds the transactions would have taken on a real bus
+
+    def write_byte_data(self, address, register, value):
+        self._transaction(address, 3)  # Address, register, value
+        self.registers[register] = value
+
+    def read_byte_data(self, address, register):
+        self._transaction(address, 4)  # Address, register, repeated start address, value
+        if register == REGISTER_DATA:
+            self._latch()
+        return self.registers[register]
+
+    def read_i2c_block_data(self, address, register, length):
+        self._transaction(address, 3 + length)
+        if register == REGISTER_DATA:
+            self._latch()
+        # The register pointer wraps around like the device's
+        return [self.registers[(register + i) % len(self.registers)] for i in range(length)]
+
+    def _transaction(self, address, wire_bytes):
+        if address != self.address:
+            raise OSError(121, 'Remote I/O error')
+        self.transactions += 1
+        # 9 clocks per byte with the acknowledge, plus the start and stop conditions
+        self.bus_time += (9 * wire_bytes + 2) / self.clock_hz
+
+    def _latch(self):
+        x, y, z = (max(-2048, min(2047, int(round(v)))) for v in self.field(self.clock()))
+        self.registers[REGISTER_DATA:REGISTER_DATA + 6] = struct.pack('>hhh', x, z, y)
+
+
+def _turning_field(t):
+    angle = math.radians(90 * t)
+    return 300 * math.cos(angle), 300 * math.sin(angle), -400
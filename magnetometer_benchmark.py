@@ -0,0 +1,70 @@
+import time
+import numpy
+from magnetometer import *
+from magnetometer import REGISTER_DATA
+from heading_filter import *
+from geometry_2d_benchmark import best_time
+
+
+def read_bytewise(bus, address=ADDRESS):
+    """ The old way: two single byte reads per axis """
+    values = []
+    for register in (REGISTER_DATA, REGISTER_DATA + 4, REGISTER_DATA + 2):  # X, Y, Z
+        value = bus.read_byte_data(address, register) << 8 | bus.read_byte_data(address, register + 1)
+        values.append(value - 65536 if value >= 32768 else value)
+    return tuple(values)
+
+
+def bench_reads():
+    bus = FakeSMBus()
+    driver = HMC5883L(bus)
+    for name, read in (('byte reads', lambda: read_bytewise(bus)), ('block read', driver.read)):
+        bus.transactions, bus.bus_time = 0, 0
+        read()
+        transactions, wire_time = bus.transactions, bus.bus_time
+        print('{:<12} {} transactions per sample  {:>7.1f}us on a 100kHz bus  {:>6.2f}us in python'.format(
+            name, transactions, wire_time * 1e6, best_time(read) * 1e6))
+
+
+def bench_ring_buffer():
+    ring = RingBuffer(1024, 4)
+    record = (0.0, 1.0, 2.0, 3.0)
+    print('ring push {:.2f}us'.format(best_time(lambda: ring.push(record)) * 1e6))
+    for count in (1, 10, 100):
+        start = ring.written - count
+        print('ring read {:>3} records {:.2f}us'.format(count, best_time(lambda: ring.read(start)) * 1e6))
+
+
+def bench_stream(seconds=2):
+    """ Sample period and jitter of the streaming thread against the 75Hz output rate """
+    driver = HMC5883L(FakeSMBus())
+    driver.start()
+    time.sleep(seconds)
+    driver.stop()
+    times = driver.samples.latest(driver.samples.written)[:, 0]
+    periods = numpy.diff(times)
+    print('stream {} samples in {}s  period {:.2f}ms  jitter (std) {:.3f}ms  worst {:.2f}ms'.format(
+        len(times), seconds, periods.mean() * 1e3, periods.std() * 1e3, periods.max() * 1e3))
+
+
+def bench_heading_pipeline():
+    """ Cost of the heading pipeline per sample for batches of the sizes the updater reads """
+    rng = numpy.random.default_rng(0)
+    t = numpy.arange(10000) / 75
+    angles = numpy.radians(90) * t
+    samples = numpy.column_stack((t, 300 * numpy.cos(angles) + 40, 200 * numpy.sin(angles) - 25, numpy.full(len(t), -400)))
+    samples[:, 1:3] += rng.normal(0, 2, (len(t), 2))
+    print('ellipse fit of a 10000 sample sweep {:.1f}us'.format(best_time(lambda: IronCalibration.from_sweep(samples)) * 1e6))
+    pipeline = Pipeline(IronCalibration.from_sweep(samples), Heading(), LowPass(0.2))
+    for count in (1, 10, 100, 10000):
+        batch = samples[:count]
+        time_per_batch = best_time(lambda: (pipeline.reset(), pipeline.process(batch)))
+        print('pipeline {:>5} samples per batch {:>9.1f}us  {:>7.2f}us per sample'.format(
+            count, time_per_batch * 1e6, time_per_batch / count * 1e6))
+
+
+if __name__ == '__main__':
+    bench_reads()
+    bench_ring_buffer()
+    bench_stream()
+    bench_heading_pipeline()
@@ -0,0 +1,271 @@
+import numpy
+from geometry_2d import *
+from geometry_2d import _as_points_array, _sbbox_extents, _crossings
+
+
+class ObstacleIndex:
+    """
+    Broad-phase spatial index of obstacle polygons\n
+    Obstacles are bucketed in a uniform grid by their straight bounding box (get_sbbox),
+    so moving one obstacle only touches the cells it left and entered.
+    cell_size should be close to the size of a typical obstacle\n
+    Format for obstacles: ((x1,y1),(x2,y2),(x3,y3)) or an (N, 2) numpy.ndarray
+    """
+
+    def __init__(self, cell_size=1.0):
+        self.cell_size = cell_size
+        self._cells = {}  # (column, row) -> set of obstacle ids
+        self._polygons = {}  # obstacle id -> (N, 2) array
+        self._ranges = {}  # obstacle id -> (first column, first row, last column, last row)
+        self._extents = numpy.empty((16, 4))  # Row per obstacle id: xmin, ymin, xmax, ymax
+        self._alive = numpy.zeros(16, dtype=bool)
+        self._free_ids = []
+        self._next_id = 0
+
+    def __len__(self):
+        return len(self._polygons)
+
+    def __contains__(self, obstacle_id):
+        return obstacle_id in self._polygons
+
+    def __iter__(self):
+        return iter(self._polygons)
+
+    def get(self, obstacle_id):
+        """ Returns the obstacle's points as an (N, 2) array """
+        return self._polygons[obstacle_id]
+
+    def items(self):
+        return self._polygons.items()
+
+    # -----------------------Updates-----------------------
+
+    def insert(self, points):
+        """ Adds an obstacle and returns its id """
+        if self._free_ids:
+            obstacle_id = self._free_ids.pop()
+        else:
+            obstacle_id = self._next_id
+            self._next_id += 1
+            if obstacle_id >= len(self._alive):
+                self._extents = numpy.concatenate((self._extents, numpy.empty_like(self._extents)))
+                self._alive = numpy.concatenate((self._alive, numpy.zeros_like(self._alive)))
+        self._store(obstacle_id, points)
+        return obstacle_id
+
+    def remove(self, obstacle_id):
+        """ Removes an obstacle, raises KeyError if the id is unknown """
+        del self._polygons[obstacle_id]
+        self._unlink(obstacle_id, self._ranges.pop(obstacle_id))
+        self._alive[obstacle_id] = False
+        self._free_ids.append(obstacle_id)
+
+    def update(self, obstacle_id, points):
+        """ Replaces the points of an obstacle, e.g. after it moved """
+        if obstacle_id not in self._polygons:
+            raise KeyError(obstacle_id)
+        self._store(obstacle_id, points)
+
+    def _store(self, obstacle_id, points):
+        points = _as_points_array(points)
+        extents = _sbbox_extents(points)
+        cell_range = self._cell_range(*extents)
+        old_range = self._ranges.get(obstacle_id)
+        if old_range != cell_range:
+            if old_range is not None:
+                self._unlink(obstacle_id, old_range)
+            for cell in self._range_cells(cell_range):
+                self._cells.setdefault(cell, set()).add(obstacle_id)
+            self._ranges[obstacle_id] = cell_range
+        self._polygons[obstacle_id] = points
+        self._extents[obstacle_id] = extents
+        self._alive[obstacle_id] = True
+
+    def _unlink(self, obstacle_id, cell_range):
+        for cell in self._range_cells(cell_range):
+            ids = self._cells[cell]
+            ids.discard(obstacle_id)
+            if not ids:
+                del self._cells[cell]
+
+    # -----------------------Queries-----------------------
+
+    def query_window(self, xmin, ymin, xmax, ymax):
+        """ Returns the ids of the obstacles whose bounding box overlaps the window, sorted """
+        first_column, first_row, last_column, last_row = self._cell_range(xmin, ymin, xmax, ymax)
+        if (last_column - first_column + 1) * (last_row - first_row + 1) > len(self._cells):
+            # The window covers more cells than are occupied, test every obstacle at once
+            ids = numpy.flatnonzero(self._alive)
+        else:
+            ids = set()
+            for cell in self._range_cells((first_column, first_row, last_column, last_row)):
+                ids.update(self._cells.get(cell, ()))
+            ids = numpy.fromiter(ids, dtype=numpy.intp, count=len(ids))
+            ids.sort()
+        extents = self._extents[ids]
+        overlap = (extents[:, 0] <= xmax) & (extents[:, 2] >= xmin) & (extents[:, 1] <= ymax) & (extents[:, 3] >= ymin)
+        return ids[overlap].tolist()
+
+    def query_shape(self, points, tolerance=0):
+        """ Returns the ids of the obstacles whose bounding box is within tolerance of the shape's bounding box """
+        xmin, ymin, xmax, ymax = _sbbox_extents(points)
+        return self.query_window(xmin - tolerance, ymin - tolerance, xmax + tolerance, ymax + tolerance)
+
+    def nearest(self, point, k=1):
+        """
+        Returns up to k (obstacle id, distance) pairs sorted by the distance from the point to the obstacle
+        The distance is 0 for a point inside an obstacle
+        """
+        if not self._polygons or k <= 0:
+            return []
+        column, row = self._cell(*point)
+        extents = self._extents[self._alive]
+        first_column, first_row, last_column, last_row = self._cell_range(
+            extents[:, 0].min(), extents[:, 1].min(), extents[:, 2].max(), extents[:, 3].max())
+        # Rings beyond this radius cannot contain any obstacle
+        max_radius = max(column - first_column, last_column - column, row - first_row, last_row - row, 0)
+        distances = {}
+        found = []
+        for radius in range(max_radius + 1):
+            ids = {i for cell in self._ring_cells(column, row, radius) for i in self._cells.get(cell, ())}
+            ids = numpy.fromiter(ids.difference(distances), dtype=numpy.intp)
+            # The distance to the bounding box is a lower bound, visit the closest boxes first
+            extents = self._extents[ids]
+            dx = numpy.maximum(numpy.maximum(extents[:, 0] - point[0], point[0] - extents[:, 2]), 0)
+            dy = numpy.maximum(numpy.maximum(extents[:, 1] - point[1], point[1] - extents[:, 3]), 0)
+            bounds = numpy.hypot(dx, dy)
+            for i in numpy.argsort(bounds):
+                if len(found) == k and bounds[i] >= found[-1][1]:
+                    distances[ids[i]] = numpy.inf  # Cannot be among the k nearest
+                    continue
+                distances[ids[i]] = _point_distance(point, self._polygons[ids[i]])
+                found = sorted(distances.items(), key=lambda item: item[1])[:k]
+            # Everything not seen yet is at least this far away
+            if len(found) == k and found[-1][1] <= self._ring_reach(point, column, row, radius):
+                break
+        return [(int(i), float(d)) for i, d in found if d < numpy.inf]
+
+    def ray(self, origin, angle, max_distance):
+        """
+        Casts a ray from the origin with the angle (radians, counter clock wise from the positive x axis)
+        Returns (obstacle id, distance to the first hit) pairs for the obstacles hit within max_distance,
+        sorted by distance
+        """
+        direction = numpy.cos(angle), numpy.sin(angle)
+        candidates = set()
+        for cell in self._ray_cells(origin, direction, max_distance):
+            candidates.update(self._cells.get(cell, ()))
+        hits = []
+        for obstacle_id in sorted(candidates):
+            distance = _ray_distance(origin, direction, self._polygons[obstacle_id])
+            if distance <= max_distance:
+                hits.append((obstacle_id, distance))
+        return sorted(hits, key=lambda hit: hit[1])
+
+    def intersections(self, points):
+        """
+        Returns {obstacle id: intersection points} for the obstacles whose outline crosses the shape's outline
+        Only the obstacles returned by query_shape are tested
+        """
+        ids = self.query_shape(points)
+        if not ids:
+            return {}
+        found, hits = get_batch_intersections((points,), [self._polygons[i] for i in ids])
+        result = {}
+        for p, candidate in zip(found.tolist(), hits[:, 2]):
+            result.setdefault(ids[candidate], []).append(tuple(p))
+        return result
+
+    def overlapping(self, points, tolerance=0):
+        """ Returns the ids of the obstacles overlapping the shape, see is_overlapping """
+        ids = self.query_shape(points, tolerance)
+        if not ids:
+            return []
+        overlap = is_overlapping_many(points, [self._polygons[i] for i in ids], tolerance)
+        return [i for i, o in zip(ids, overlap) if o]
+
+    # -----------------------Grid helpers-----------------------
+
+    def _cell(self, x, y):
+        return int(numpy.floor(x / self.cell_size)), int(numpy.floor(y / self.cell_size))
+
+    def _cell_range(self, xmin, ymin, xmax, ymax):
+        return self._cell(xmin, ymin) + self._cell(xmax, ymax)
+
+    @staticmethod
+    def _range_cells(cell_range):
+        first_column, first_row, last_column, last_row = cell_range
+        for column in range(first_column, last_column + 1):
+            for row in range(first_row, last_row + 1):
+                yield column, row
+
+    @staticmethod
+    def _ring_cells(column, row, radius):
+        if radius == 0:
+            yield column, row
+            return
+        for c in range(column - radius, column + radius + 1):
+            yield c, row - radius
+            yield c, row + radius
+        for r in range(row - radius + 1, row + radius):
+            yield column - radius, r
+            yield column + radius, r
+
+    def _ring_reach(self, point, column, row, radius):
+        """ Distance from the point to the nearest cell outside the square of rings up to radius """
+        x, y = point
+        return min(x - (column - radius) * self.cell_size, (column + radius + 1) * self.cell_size - x,
+                   y - (row - radius) * self.cell_size, (row + radius + 1) * self.cell_size - y)
+
+    def _ray_cells(self, origin, direction, max_distance):
+        """ Walks the grid cells crossed by the ray (Amanatides & Woo) """
+        column, row = self._cell(*origin)
+        steps, next_t, delta_t = [], [], []
+        for axis, cell in enumerate((column, row)):
+            d = direction[axis]
+            if d > 0:
+                steps.append(1)
+                next_t.append(((cell + 1) * self.cell_size - origin[axis]) / d)
+                delta_t.append(self.cell_size / d)
+            elif d < 0:
+                steps.append(-1)
+                next_t.append((cell * self.cell_size - origin[axis]) / d)
+                delta_t.append(-self.cell_size / d)
+            else:
+                steps.append(0)
+                next_t.append(numpy.inf)
+                delta_t.append(numpy.inf)
+        yield column, row
+        while min(next_t) <= max_distance:
+            if next_t[0] < next_t[1]:
+                column += steps[0]
+                next_t[0] += delta_t[0]
+            else:
+                row += steps[1]
+                next_t[1] += delta_t[1]
+            yield column, row
+
+
+def _point_distance(point, polygon):
+    """ Distance from a point to a closed polygon, 0 if the point is inside """
+    starts, ends = polygon, numpy.roll(polygon, -1, axis=0)
+    if _crossings(numpy.array((point,), dtype=numpy.float64), starts, ends).sum() % 2 == 1:
+        return 0.0
+    d = ends - starts
+    lengths = numpy.maximum((d ** 2).sum(axis=1), 1e-300)
+    t = numpy.clip(((numpy.asarray(point) - starts) * d).sum(axis=1) / lengths, 0, 1)
+    closest = starts + t[:, None] * d
+    return float(numpy.hypot(*(closest - point).T).min())
+
+
+def _ray_distance(origin, direction, polygon):
+    """ Distance along a unit direction from the origin to the first edge of a closed polygon, inf if missed """
+    starts = polygon - origin
+    edges = numpy.roll(polygon, -1, axis=0) - polygon
+    denominator = direction[0] * edges[:, 1] - direction[1] * edges[:, 0]
+    parallel = denominator == 0
+    denominator = numpy.where(parallel, 1, denominator)
+    t = (starts[:, 0] * edges[:, 1] - starts[:, 1] * edges[:, 0]) / denominator  # Along the ray
+    u = (starts[:, 0] * direction[1] - starts[:, 1] * direction[0]) / denominator  # Along the edge
+    hit = ~parallel & (t >= 0) & (u >= 0) & (u <= 1)
+    return float(t[hit].min()) if hit.any() else numpy.inf
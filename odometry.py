@@ -0,0 +1,128 @@
+import collections
+import math
+import numpy
+
+Pose = collections.namedtuple('Pose', 'time x y theta covariance')
+Pose.__doc__ = """ Pose estimate, theta in radians counter clock wise from the positive x axis, covariance of (x, y, theta) """
+
+
+class Odometry:
+    """
+    Dead reckoning from encoder pulses and the heading stream\n
+    Every pulse moves the car length_per_pulse forward (direction 1), backward (-1) or not at all (0,
+    e.g. while turning in place) along the last heading received at or before the pulse.
+    The heading is measured absolutely by the compass, so theta and its variance are the heading stream's
+    and only the position covariance accumulates: distance_noise (standard deviation per pulse) along the track
+    and the heading variance across it\n
+    add_pulses and add_headings may run in two different threads. Each side only replaces its own immutable
+    state in one assignment, so neither needs a lock and snapshot() can be called from any thread
+    """
+
+    def __init__(self, length_per_pulse=0.01, distance_noise=None, max_headings=4096):
+        self.length_per_pulse = length_per_pulse
+        self.distance_noise = length_per_pulse * 0.05 if distance_noise is None else distance_noise
+        self.max_headings = max_headings
+        self.reset()
+
+    def reset(self, x=0, y=0, theta=0, time=0):
+        """ Sets the pose, call it while no pulses or headings are being added """
+        self._position = (time, float(x), float(y), 0.0, 0.0, 0.0)  # time, x, y, var x, cov xy, var y
+        self._headings = (numpy.array((time,), dtype=numpy.float64), numpy.array((theta,), dtype=numpy.float64),
+                          numpy.zeros(1))  # times, headings, variances
+
+    def snapshot(self):
+        """ Returns the current Pose """
+        time, x, y, xx, xy, yy = self._position
+        times, headings, variances = self._headings
+        covariance = numpy.array(((xx, xy, 0), (xy, yy, 0), (0, 0, variances[-1])))
+        return Pose(max(time, times[-1]), x, y, headings[-1] % (2 * numpy.pi), covariance)
+
+    def add_headings(self, headings):
+        """ Adds an (N, 3) batch of (time, heading in radians, variance) like heading_filter produces """
+        headings = numpy.asarray(headings, dtype=numpy.float64)
+        if not len(headings):
+            return
+        times, angles, variances = self._headings
+        # Keep the heading in effect at the last pulse and everything after it
+        first = max(numpy.searchsorted(times, self._position[0], 'right') - 1, len(times) + len(headings) - self.max_headings, 0)
+        self._headings = (numpy.concatenate((times[first:], headings[:, 0])),
+                          numpy.concatenate((angles[first:], headings[:, 1])),
+                          numpy.concatenate((variances[first:], headings[:, 2])))
+
+    def add_pulse(self, time, direction=1):
+        """ add_pulses for a single pulse as it arrives, without the array overhead """
+        _, x, y, xx, xy, yy = self._position
+        heading_times, headings, variances = self._headings
+        # Live pulses are almost always newer than the last heading
+        index = -1 if time >= heading_times[-1] else max(int(numpy.searchsorted(heading_times, time, 'right')) - 1, 0)
+        theta, theta_variance = float(headings[index]), float(variances[index])
+        cos, sin = math.cos(theta), math.sin(theta)
+        distance = direction * self.length_per_pulse
+        along = abs(direction) * self.distance_noise ** 2
+        across = distance ** 2 * theta_variance
+        self._position = (float(time), x + distance * cos, y + distance * sin, xx + cos * cos * along + sin * sin * across,
+                          xy + cos * sin * (along - across), yy + sin * sin * along + cos * cos * across)
+
+    def add_pulses(self, times, directions=1):
+        """
+        Adds the pulses with the times in increasing order and their directions (1, -1 or 0)\n
+        Returns the (N, 4) array of (time, x, y, theta) after every pulse
+        """
+        times = numpy.asarray(times, dtype=numpy.float64)
+        directions = numpy.broadcast_to(numpy.asarray(directions, dtype=numpy.float64), times.shape)
+        time, x, y, xx, xy, yy = self._position
+        if not len(times):
+            return numpy.empty((0, 4))
+        heading_times, headings, variances = self._headings
+        index = numpy.maximum(numpy.searchsorted(heading_times, times, 'right') - 1, 0)
+        theta, theta_variance = headings[index], variances[index]
+        cos, sin = numpy.cos(theta), numpy.sin(theta)
+        distance = directions * self.length_per_pulse
+        xs = x + numpy.cumsum(distance * cos)
+        ys = y + numpy.cumsum(distance * sin)
+        # Rotate diag(along, across) of every step into x, y and sum them up
+        along = numpy.abs(directions) * self.distance_noise ** 2
+        across = distance ** 2 * theta_variance
+        xx += (cos * cos * along + sin * sin * across).sum()
+        xy += (cos * sin * (along - across)).sum()
+        yy += (sin * sin * along + cos * cos * across).sum()
+        self._position = (float(times[-1]), float(xs[-1]), float(ys[-1]), float(xx), float(xy), float(yy))
+        return numpy.stack((times, xs, ys, theta), axis=1)
+
+
+def replay(pulses, headings, odometry=None, chunk=1024):
+    """
+    Feeds recorded logs through an Odometry the way they arrived live\n
+    pulses is an (N, 2) array of (time, direction) or an (N,) array of times of forward pulses,
+    headings is an (M, 3) array of (time, heading, variance).
+    Returns the (N, 4) array of (time, x, y, theta) after every pulse
+    """
+    odometry = Odometry() if odometry is None else odometry
+    pulses = numpy.asarray(pulses, dtype=numpy.float64)
+    if pulses.ndim == 1:
+        pulses = numpy.stack((pulses, numpy.ones_like(pulses)), axis=1)
+    headings = numpy.asarray(headings, dtype=numpy.float64)
+    # Headings received up to every pulse, the ones after a pulse are never used for it
+    received = numpy.searchsorted(headings[:, 0], pulses[:, 0], 'right')
+    poses = []
+    first = added = 0
+    while first < len(pulses):
+        # Up to chunk pulses and chunk headings at a time, so the odometry keeps every heading the pulses need
+        last = min(first + chunk, max(numpy.searchsorted(received, added + chunk, 'right'), first + 1))
+        odometry.add_headings(headings[added:received[last - 1]])
+        added = received[last - 1]
+        poses.append(odometry.add_pulses(pulses[first:last, 0], pulses[first:last, 1]))
+        first = last
+    odometry.add_headings(headings[added:])
+    return numpy.concatenate(poses) if poses else numpy.empty((0, 4))
+
+
+def save_log(path, pulses, headings):
+    """ Saves recorded pulse and heading logs to an .npz file for replay """
+    numpy.savez(path, pulses=pulses, headings=headings)
+
+
+def load_log(path):
+    """ Returns (pulses, headings) saved by save_log """
+    with numpy.load(path) as log:
+        return log['pulses'], log['headings']
@@ -0,0 +1,38 @@
+import numpy
+from odometry import *
+from geometry_2d_benchmark import best_time
+
+
+def synthetic_log(seconds, pulse_rate=200, heading_rate=75, seed=0):
+    """ Returns (pulses, headings) of a car driving a slow circle, reversing for the last sixth """
+    rng = numpy.random.default_rng(seed)
+    heading_times = numpy.arange(0, seconds, 1 / heading_rate)
+    headings = numpy.column_stack((heading_times, numpy.mod(0.3 * heading_times + rng.normal(0, 0.01, len(heading_times)), 2 * numpy.pi),
+                                   numpy.full(len(heading_times), 1e-4)))
+    pulse_times = numpy.sort(rng.uniform(0, seconds, int(seconds * pulse_rate)))
+    pulses = numpy.column_stack((pulse_times, numpy.where(pulse_times < seconds * 5 / 6, 1, -1)))
+    return pulses, headings
+
+
+def bench_replay():
+    for seconds in (10, 100, 1000):
+        pulses, headings = synthetic_log(seconds)
+        t = best_time(lambda: replay(pulses, headings), repeat=3)
+        print('replay {:>5}s log  {:>7} pulses {:>7} headings  {:>9.1f}ms  {:>6.1f} pulses/us'.format(
+            seconds, len(pulses), len(headings), t * 1e3, len(pulses) / t / 1e6))
+
+
+def bench_live():
+    pulses, headings = synthetic_log(10)
+    odometry = Odometry()
+    odometry.add_headings(headings)
+    time = float(headings[-1, 0]) + 1
+    print('add_pulse {:.2f}us  add_headings (1 sample) {:.2f}us  snapshot {:.2f}us'.format(
+        best_time(lambda: odometry.add_pulse(time)) * 1e6,
+        best_time(lambda: odometry.add_headings(headings[-1:])) * 1e6,
+        best_time(odometry.snapshot) * 1e6))
+
+
+if __name__ == '__main__':
+    bench_replay()
+    bench_live()
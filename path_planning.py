@@ -0,0 +1,595 @@
+import heapq
+import numpy
+from geometry_2d import *
+from geometry_2d import _convex_hull, _bbox_pairs
+
+# -----------------------Configuration space-----------------------
+
+
+def get_footprint(moving_shape, pivot_point, tolerance=0, sides=16):
+    """
+    Returns the region swept by moving_shape while it turns in place around pivot_point,
+    relative to the pivot point and grown by tolerance\n
+    A full turn sweeps a circle, it is returned as a regular polygon that circumscribes it.
+    The radius is rounded up to a micro unit so that rotating the shape gives the same footprint
+    (and the same cached graph in plan())
+    """
+    offsets = numpy.asarray(moving_shape, dtype=numpy.float64) - numpy.asarray(pivot_point, dtype=numpy.float64)
+    radius = numpy.hypot(offsets[:, 0], offsets[:, 1]).max() + tolerance
+    return _regular_polygon(numpy.ceil(radius * 1e6) / 1e6, sides)
+
+
+def inflate(obstacle, footprint):
+    """
+    Returns the configuration space obstacle: the convex Minkowski sum of the obstacle's convex hull
+    and the reflected footprint, counter clock wise\n
+    A pivot point outside of it keeps the footprint clear of the obstacle
+    """
+    hull = _convex_hull(obstacle)
+    return _convex_hull((hull[:, None, :] - footprint[None, :, :]).reshape(-1, 2))
+
+
+def _regular_polygon(radius, sides):
+    """ A regular polygon that circumscribes the circle of the radius """
+    angles = numpy.arange(sides) * 2 * numpy.pi / sides
+    return numpy.stack((numpy.cos(angles), numpy.sin(angles)), axis=1) * radius / numpy.cos(numpy.pi / sides)
+
+# -----------------------Visibility graph-----------------------
+
+
+class VisibilityGraph:
+    """
+    Reduced visibility graph over the inflated (configuration space) obstacles with A* queries\n
+    Only the bitangent segments between obstacle vertices are kept, with the obstacle that blocks them if any.
+    Adding, moving or removing an obstacle only re-tests the segments around it:
+    the visible segments that cross a new obstacle and the ones that a removed obstacle blocked.
+    Start and destination are connected per query\n
+    Format for obstacles: ((x1,y1),(x2,y2),(x3,y3)) or an (N, 2) numpy.ndarray
+    """
+
+    def __init__(self, footprint, cell_size=None):
+        self.footprint = numpy.asarray(footprint, dtype=numpy.float64)
+        self.cell_size = cell_size
+        size = self.footprint.max(axis=0) - self.footprint.min(axis=0)
+        self._eps = 1e-9 * max(1.0, float(size.max()))
+        # Obstacles, padded to the same number of vertices so they can be clipped against at once
+        self._obstacles = {}  # obstacle id -> node ids
+        self._keys = {}  # obstacle content key -> obstacle id, see set_obstacles
+        self._vertices = numpy.zeros((0, 3, 2))
+        self._units = numpy.zeros((0, 3, 2))  # Unit edge directions, zero for padding
+        self._extents = numpy.zeros((0, 4))
+        self._obstacle_alive = numpy.zeros(0, dtype=bool)
+        # Nodes are the inflated obstacles' vertices
+        self._points = numpy.zeros((0, 2))
+        # Tangent rows of the two edges at every node, see _tangent_rows
+        self._previous_rows = numpy.zeros((0, 3))
+        self._next_rows = numpy.zeros((0, 3))
+        self._previous_node = numpy.zeros(0, dtype=numpy.intp)
+        self._next_node = numpy.zeros(0, dtype=numpy.intp)
+        self._owners = numpy.zeros(0, dtype=numpy.intp)
+        self._node_alive = numpy.zeros(0, dtype=bool)
+        self._free_nodes = []
+        self._node_count = 0
+        # Bitangent segments, visible or not
+        self._pairs = numpy.zeros((0, 2), dtype=numpy.intp)
+        self._blockers = numpy.zeros(0, dtype=numpy.intp)  # The obstacle blocking each segment, -1 if it is visible
+        self._adjacency = {}  # node -> {node: length} for the visible segments
+
+    def __len__(self):
+        return len(self._obstacles)
+
+    # -----------------------Updates-----------------------
+
+    def add_obstacles(self, obstacles):
+        """ Adds many obstacles in one batch and returns their ids """
+        ids = [self._store(o) for o in obstacles]
+        new_nodes = numpy.array([n for i in ids for n in self._obstacles[i]], dtype=numpy.intp)
+        self._block(ids)
+        self._connect(new_nodes)
+        return ids
+
+    def add_obstacle(self, points):
+        """ Adds an obstacle and returns its id """
+        return self.add_obstacles((points,))[0]
+
+    def remove_obstacle(self, obstacle_id):
+        """ Removes an obstacle, raises KeyError if the id is unknown """
+        nodes = self._obstacles.pop(obstacle_id)
+        for node in nodes:
+            for neighbour in self._adjacency.pop(node, {}):
+                del self._adjacency[neighbour][node]
+        self._node_alive[nodes] = False
+        self._free_nodes.extend(nodes)
+        keep = self._node_alive[self._pairs].all(axis=1)
+        self._pairs, self._blockers = self._pairs[keep], self._blockers[keep]
+        self._obstacle_alive[obstacle_id] = False
+        # Segments that the obstacle was blocking may be visible now, or blocked by another one
+        recheck = numpy.flatnonzero(self._blockers == obstacle_id)
+        if len(recheck):
+            a, b = self._pairs[recheck].T
+            blockers = self._blocking(self._points[a], self._points[b])
+            self._blockers[recheck] = blockers
+            visible = blockers < 0
+            self._link(a[visible], b[visible])
+
+    def update_obstacle(self, obstacle_id, points):
+        """ Moves or reshapes an obstacle, the id may change so the new one is returned """
+        self.remove_obstacle(obstacle_id)
+        return self.add_obstacle(points)
+
+    def set_obstacles(self, obstacles):
+        """
+        Makes the graph hold exactly these obstacles,
+        only the obstacles that are new or changed since the last call are added or removed
+        """
+        keys = [numpy.ascontiguousarray(o, dtype=numpy.float64).tobytes() for o in obstacles]
+        wanted = set(keys)
+        for key in [k for k in self._keys if k not in wanted]:
+            self.remove_obstacle(self._keys.pop(key))
+        added = {k: o for k, o in zip(keys, obstacles) if k not in self._keys}
+        for key, obstacle_id in zip(added, self.add_obstacles(added.values())):
+            self._keys[key] = obstacle_id
+
+    def _store(self, points):
+        polygon = inflate(points, self.footprint)
+        obstacle_id = len(self._obstacle_alive)
+        dead = numpy.flatnonzero(~self._obstacle_alive)
+        if len(dead):
+            obstacle_id = dead[0]
+        else:
+            self._vertices = _grow(self._vertices, obstacle_id + 1)
+            self._units = _grow(self._units, obstacle_id + 1)
+            self._extents = _grow(self._extents, obstacle_id + 1)
+            self._obstacle_alive = _grow(self._obstacle_alive, obstacle_id + 1)
+        width = self._vertices.shape[1]
+        if len(polygon) > width:
+            # Pad the old obstacles with repeats of their last vertex
+            extra = len(polygon) - width
+            self._vertices = numpy.concatenate((self._vertices, numpy.repeat(self._vertices[:, -1:], extra, axis=1)), axis=1)
+            self._units = numpy.concatenate((self._units, numpy.zeros((len(self._units), extra, 2))), axis=1)
+            width = len(polygon)
+        edges = numpy.roll(polygon, -1, axis=0) - polygon
+        self._vertices[obstacle_id] = numpy.concatenate((polygon, numpy.repeat(polygon[-1:], width - len(polygon), axis=0)))
+        self._units[obstacle_id] = 0
+        self._units[obstacle_id, :len(polygon)] = edges / numpy.hypot(edges[:, 0], edges[:, 1])[:, None]
+        self._extents[obstacle_id] = numpy.concatenate((polygon.min(axis=0), polygon.max(axis=0)))
+        self._obstacle_alive[obstacle_id] = True
+        if self.cell_size is None:
+            self.cell_size = float((polygon.max(axis=0) - polygon.min(axis=0)).max())
+        nodes = [self._new_node() for _ in polygon]
+        self._points[nodes] = polygon
+        self._previous_node[nodes] = numpy.roll(nodes, 1)
+        self._next_node[nodes] = numpy.roll(nodes, -1)
+        self._previous_rows[nodes] = _tangent_rows(polygon, numpy.roll(polygon, 1, axis=0))
+        self._next_rows[nodes] = _tangent_rows(polygon, numpy.roll(polygon, -1, axis=0))
+        self._owners[nodes] = obstacle_id
+        self._obstacles[obstacle_id] = nodes
+        return obstacle_id
+
+    def _new_node(self):
+        if self._free_nodes:
+            node = self._free_nodes.pop()
+        else:
+            node = self._node_count
+            self._node_count += 1
+            for name in ('_points', '_previous_rows', '_next_rows', '_previous_node', '_next_node',
+                         '_owners', '_node_alive'):
+                setattr(self, name, _grow(getattr(self, name), node + 1))
+        self._node_alive[node] = True
+        return node
+
+    def _block(self, obstacle_ids):
+        """ Drops the visible segments that cross any of the new obstacles """
+        visible = numpy.flatnonzero(self._blockers < 0)
+        if len(visible) == 0:
+            return
+        near = numpy.zeros(len(visible), dtype=bool)
+        for obstacle_id in obstacle_ids:
+            near |= self._crosses_box(self._pairs[visible], self._extents[obstacle_id])
+        recheck = visible[near]
+        a, b = self._pairs[recheck].T
+        blockers = self._blocking(self._points[a], self._points[b], only=obstacle_ids)
+        blocked = blockers >= 0
+        self._blockers[recheck[blocked]] = blockers[blocked]
+        for u, v in zip(a[blocked].tolist(), b[blocked].tolist()):
+            del self._adjacency[u][v]
+            del self._adjacency[v][u]
+
+    def _connect(self, new_nodes):
+        """ Finds the bitangent segments between the new nodes and all the nodes and tests their visibility """
+        if len(new_nodes) == 0:
+            return
+        alive = numpy.flatnonzero(self._node_alive)
+        is_new = numpy.zeros(len(self._node_alive), dtype=bool)
+        is_new[new_nodes] = True
+        points = _homogeneous(self._points[alive])
+        step = max(1, (1 << 21) // len(alive))
+        pairs = []
+        for i in range(0, len(new_nodes), step):
+            a = new_nodes[i:i+step, None]
+            b = alive[None, :]
+            # Pairs between new nodes are only taken once
+            mask = ~is_new[b] | (b > a)
+            # Tangent at both ends, the cross products come out of (N x 3) @ (3 x M) products
+            mask &= (self._previous_rows[a[:, 0]] @ points.T) * (self._next_rows[a[:, 0]] @ points.T) >= 0
+            own = _homogeneous(self._points[a[:, 0]])
+            mask &= (own @ self._previous_rows[alive].T) * (own @ self._next_rows[alive].T) >= 0
+            # Inside an obstacle only its own edges are kept
+            same = self._owners[a] == self._owners[b]
+            mask &= ~same | (b == self._previous_node[a]) | (b == self._next_node[a])
+            rows, columns = numpy.nonzero(mask)
+            pairs.append(numpy.stack((a[rows, 0], b[0, columns]), axis=1))
+        pairs = numpy.concatenate(pairs)
+        blockers = self._blocking(self._points[pairs[:, 0]], self._points[pairs[:, 1]])
+        self._pairs = numpy.concatenate((self._pairs, pairs))
+        self._blockers = numpy.concatenate((self._blockers, blockers))
+        self._link(*pairs[blockers < 0].T)
+
+    def _link(self, a, b):
+        lengths = numpy.hypot(*(self._points[a] - self._points[b]).T)
+        for u, v, length in zip(a.tolist(), b.tolist(), lengths.tolist()):
+            self._adjacency.setdefault(u, {})[v] = length
+            self._adjacency.setdefault(v, {})[u] = length
+
+    def _crosses_box(self, pairs, extents):
+        """ True for the segments whose bounding box overlaps the extents (xmin, ymin, xmax, ymax) """
+        p, q = self._points[pairs[:, 0]], self._points[pairs[:, 1]]
+        low, high = numpy.minimum(p, q), numpy.maximum(p, q)
+        return (low[:, 0] <= extents[2]) & (high[:, 0] >= extents[0]) & (low[:, 1] <= extents[3]) & (high[:, 1] >= extents[1])
+
+    # -----------------------Queries-----------------------
+
+    def shortest_path(self, start, destination):
+        """
+        Returns the shortest collision free path for the pivot point as a list of points from start to destination,
+        or None if the destination is not reachable\n
+        Obstacles that already contain the start point are ignored for the first segment so the car can back out
+        """
+        start = numpy.asarray(start, dtype=numpy.float64)
+        destination = numpy.asarray(destination, dtype=numpy.float64)
+        if self._containing(destination).size:
+            return None
+        ignore = self._containing(start)
+        if not self._blocked(start[None], destination[None], ignore)[0]:
+            return [tuple(start.tolist()), tuple(destination.tolist())]
+        nodes = numpy.flatnonzero(self._node_alive)
+        # Temporary segments from the start and to the destination
+        ends = _homogeneous(numpy.stack((start, destination)))
+        tangent = (self._previous_rows[nodes] @ ends.T) * (self._next_rows[nodes] @ ends.T) >= 0
+        start_tangent, goal_tangent = tangent.T
+        from_start = nodes[start_tangent]
+        from_start = from_start[~self._blocked(numpy.repeat(start[None], len(from_start), axis=0),
+                                               self._points[from_start], ignore)]
+        to_goal = nodes[goal_tangent]
+        to_goal = to_goal[~self._blocked(self._points[to_goal], numpy.repeat(destination[None], len(to_goal), axis=0))]
+        return self._astar(start, destination, from_start, set(to_goal.tolist()))
+
+    def _astar(self, start, destination, from_start, to_goal):
+        START, GOAL = -1, -2
+        goal = tuple(destination.tolist())
+
+        def heuristic(node):
+            return numpy.hypot(*(self._points[node] - destination)) if node >= 0 else 0.0
+
+        distances = {START: 0.0}
+        parents = {}
+        queue = []
+        for node, length in zip(from_start.tolist(), numpy.hypot(*(self._points[from_start] - start).T).tolist()):
+            distances[node] = length
+            parents[node] = START
+            heapq.heappush(queue, (length + heuristic(node), length, node))
+        done = set()
+        while queue:
+            _, distance, node = heapq.heappop(queue)
+            if node in done:
+                continue
+            if node == GOAL:
+                path = [goal]
+                node = parents[GOAL]
+                while node != START:
+                    path.append(tuple(self._points[node].tolist()))
+                    node = parents[node]
+                path.append(tuple(start.tolist()))
+                return path[::-1]
+            done.add(node)
+            neighbours = list(self._adjacency.get(node, {}).items())
+            if node in to_goal:
+                neighbours.append((GOAL, float(numpy.hypot(*(self._points[node] - destination)))))
+            for neighbour, length in neighbours:
+                d = distance + length
+                if d < distances.get(neighbour, numpy.inf):
+                    distances[neighbour] = d
+                    parents[neighbour] = node
+                    heapq.heappush(queue, (d + heuristic(neighbour), d, neighbour))
+        return None
+
+    def _containing(self, point):
+        """ Ids of the inflated obstacles that strictly contain the point """
+        alive = numpy.flatnonzero(self._obstacle_alive)
+        v, u = self._vertices[alive], self._units[alive]
+        depth = u[:, :, 0] * (point[1] - v[:, :, 1]) - u[:, :, 1] * (point[0] - v[:, :, 0])
+        padding = (u == 0).all(axis=2)
+        return alive[((depth > self._eps) | padding).all(axis=1)]
+
+    def _blocked(self, starts, ends, ignore=(), only=None):
+        """
+        True for the segments that pass through the inside of an inflated obstacle
+        (touching a vertex or sliding along an edge is allowed), see _blocking
+        """
+        return self._blocking(starts, ends, ignore, only) >= 0
+
+    def _blocking(self, starts, ends, ignore=(), only=None):
+        """
+        The id of an inflated obstacle each segment passes through the inside of, -1 for the clear ones\n
+        Only the obstacles in only are tested if it is given, the ones in ignore never are.
+        Segments are walked in cell sized pieces: every round pairs the next piece of the segments
+        that are still clear with the obstacles in the same grid cells, so a blocked segment stops
+        costing anything as soon as it is found to be blocked
+        """
+        blockers = numpy.full(len(starts), -1, dtype=numpy.intp)
+        obstacles = numpy.flatnonzero(self._obstacle_alive) if only is None else numpy.asarray(only, dtype=numpy.intp)
+        obstacles = numpy.setdiff1d(obstacles, ignore)
+        if len(starts) == 0 or len(obstacles) == 0:
+            return blockers
+        d = ends - starts
+        if only is not None:
+            # A handful of obstacles, clip every whole segment against each of them
+            segments = numpy.repeat(numpy.arange(len(starts)), len(obstacles))
+            zeros = numpy.zeros(len(segments))
+            tested = numpy.tile(obstacles, len(starts))
+            hit = self._clip(starts[segments], d[segments], tested, zeros, zeros + 1)
+            blockers[segments[hit]] = tested[hit]
+            return blockers
+        extents = self._extents[obstacles]
+        pieces = numpy.maximum(numpy.ceil(numpy.hypot(d[:, 0], d[:, 1]) / self.cell_size), 1)
+        active = numpy.arange(len(starts))
+        k = 0
+        while len(active):
+            active = active[pieces[active] > k]
+            t0, t1 = k / pieces[active], (k + 1) / pieces[active]
+            p = starts[active] + d[active] * t0[:, None]
+            q = starts[active] + d[active] * t1[:, None]
+            piece, o = _bbox_pairs(numpy.minimum(p, q), numpy.maximum(p, q), extents[:, :2], extents[:, 2:], self.cell_size)
+            segments = active[piece]
+            hit = self._clip(starts[segments], d[segments], obstacles[o], t0[piece], t1[piece])
+            blockers[segments[hit]] = obstacles[o[hit]]
+            active = active[blockers[active] < 0]
+            k += 1
+        return blockers
+
+    def _clip(self, starts, directions, obstacles, t0, t1):
+        """
+        Clips every segment piece p + t*d, t0 <= t <= t1, against its obstacle's edges at once (Cyrus-Beck)
+        True where a part of the piece longer than rounding errors is inside the obstacle
+        """
+        inside = numpy.zeros(len(starts), dtype=bool)
+        step = max(1, (1 << 21) // self._vertices.shape[1])
+        for i in range(0, len(starts), step):
+            chunk = slice(i, i + step)
+            v, u = self._vertices[obstacles[chunk]], self._units[obstacles[chunk]]
+            p, d = starts[chunk, None, :], directions[chunk, None, :]
+            # Signed distance of p + t*d from every edge line is a + t*b, positive on the inside
+            a = u[:, :, 0] * (p[:, :, 1] - v[:, :, 1]) - u[:, :, 1] * (p[:, :, 0] - v[:, :, 0])
+            b = u[:, :, 0] * d[:, :, 1] - u[:, :, 1] * d[:, :, 0]
+            padding = (u == 0).all(axis=2)
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                limit = (self._eps - a) / b
+            entering = numpy.maximum(numpy.where(b > 0, limit, -numpy.inf).max(axis=1), t0[chunk])
+            leaving = numpy.minimum(numpy.where(b < 0, limit, numpy.inf).min(axis=1), t1[chunk])
+            outside = ((b == 0) & (a <= self._eps) & ~padding).any(axis=1)
+            inside[chunk] = ~outside & (leaving - entering > 1e-9)
+        return inside
+
+
+def _tangent_rows(points, neighbours):
+    """
+    Rows (e_y, -e_x, -(p x e)) for the edges e from the points p to their neighbours\n
+    The row times (x, y, 1) is the cross product (q - p) x e for a point q = (x, y),
+    so the tangent test of many node pairs becomes a matrix product.
+    A line from p to q is tangent to a convex polygon at p if both edges at p give the same sign (or zero)
+    """
+    e = neighbours - points
+    return numpy.stack((e[:, 1], -e[:, 0], -(points[:, 0] * e[:, 1] - points[:, 1] * e[:, 0])), axis=1)
+
+
+def _homogeneous(points):
+    return numpy.concatenate((points, numpy.ones((len(points), 1))), axis=1)
+
+
+def _grow(array, size):
+    """ Returns the array with at least size rows, doubling its capacity when needed """
+    if len(array) >= size:
+        return array
+    grown = numpy.zeros((max(size, 2 * len(array)),) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+# -----------------------Occupancy grid-----------------------
+
+FREE = 0
+INFLATED = 1  # Free space the pivot point cannot enter without the car touching an obstacle
+OCCUPIED = 2
+
+# Wavefront step costs, 7/5 approximates sqrt(2) for the diagonal moves
+_STRAIGHT_COST = 5
+_DIAGONAL_COST = 7
+_UNREACHABLE = numpy.iinfo(numpy.int32).max
+
+
+class OccupancyGrid:
+    """
+    Raster planning mode: obstacles are rasterized into a uint8 grid (FREE, INFLATED or OCCUPIED per cell)\n
+    Cell (column, row) covers origin + (column, row) * resolution up to the next cell.
+    cost_to_go() runs a bucketed Dijkstra wavefront from a destination over the whole grid in NumPy,
+    the field is cached so every later request to the same destination only reads the neighbouring cells
+    of the current position (next_point) and any start point can be planned from it (shortest_path)
+    """
+
+    def __init__(self, origin, size, resolution, cached_fields=4):
+        self.origin = numpy.asarray(origin, dtype=numpy.float64)
+        self.resolution = resolution
+        self.columns, self.rows = size
+        # One cell of OCCUPIED padding all around so neighbour lookups never leave the array
+        self.cells = numpy.full((self.rows + 2, self.columns + 2), OCCUPIED, dtype=numpy.uint8)
+        self.cells[1:-1, 1:-1] = FREE
+        self.cached_fields = cached_fields
+        self._fields = {}  # destination cell -> cost to go, most recently used last
+        width = self.columns + 2
+        self._offsets = numpy.array([-1, 1, -width, width, -width - 1, -width + 1, width - 1, width + 1])
+        self._costs = numpy.array([_STRAIGHT_COST] * 4 + [_DIAGONAL_COST] * 4, dtype=numpy.int32)
+
+    @property
+    def grid(self):
+        """ The (rows, columns) uint8 grid without its padding """
+        return self.cells[1:-1, 1:-1]
+
+    def add_obstacles(self, obstacles):
+        """ Marks the cells whose center is inside an obstacle, or that hold one of its vertices, as OCCUPIED """
+        for points in obstacles:
+            points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+            (c0, r0), (c1, r1) = self._cell(points.min(axis=0)), self._cell(points.max(axis=0))
+            c0, r0 = max(c0, 0), max(r0, 0)
+            c1, r1 = min(c1, self.columns - 1), min(r1, self.rows - 1)
+            if c0 > c1 or r0 > r1:
+                continue
+            columns, rows = numpy.meshgrid(numpy.arange(c0, c1 + 1), numpy.arange(r0, r1 + 1))
+            centers = self.origin + (numpy.stack((columns.ravel(), rows.ravel()), axis=1) + 0.5) * self.resolution
+            inside = get_points_inside(centers, points)
+            self.grid[rows.ravel()[inside], columns.ravel()[inside]] = OCCUPIED
+            vertices = numpy.array([self._cell(p) for p in points])
+            valid = (vertices >= 0).all(axis=1) & (vertices[:, 0] < self.columns) & (vertices[:, 1] < self.rows)
+            self.grid[vertices[valid, 1], vertices[valid, 0]] = OCCUPIED
+        self._fields.clear()
+
+    def inflate(self, radius):
+        """
+        Marks the FREE cells closer than radius to an OCCUPIED cell as INFLATED\n
+        The distance transform is separable: the distance along the columns first,
+        then the squared distance over the rows, both limited to the radius so that
+        each pass is a handful of whole array shifts
+        """
+        reach = int(numpy.ceil(radius / self.resolution))
+        occupied = self.grid == OCCUPIED
+        far = numpy.int32(reach + 1)
+        vertical = numpy.where(occupied, 0, far).astype(numpy.int32)
+        for k in range(1, reach + 1):
+            vertical[k:] = numpy.minimum(vertical[k:], numpy.where(occupied[:-k], k, far))
+            vertical[:-k] = numpy.minimum(vertical[:-k], numpy.where(occupied[k:], k, far))
+        squared = vertical ** 2
+        distance = squared.copy()
+        for k in range(1, reach + 1):
+            distance[:, k:] = numpy.minimum(distance[:, k:], squared[:, :-k] + k * k)
+            distance[:, :-k] = numpy.minimum(distance[:, :-k], squared[:, k:] + k * k)
+        self.grid[~occupied & (distance * self.resolution ** 2 < radius ** 2)] = INFLATED
+        self._fields.clear()
+
+    def cost_to_go(self, destination):
+        """
+        Returns the (rows + 2, columns + 2) int32 cost to go field of the destination, padding included
+        in units of resolution / 5 (see _STRAIGHT_COST), cached for the last few destinations
+        """
+        key = self._cell(destination)
+        field = self._fields.pop(key, None)
+        if field is None:
+            field = self._wavefront(key)
+            if len(self._fields) >= self.cached_fields:
+                del self._fields[next(iter(self._fields))]
+        self._fields[key] = field
+        return field
+
+    def next_point(self, point, destination):
+        """
+        Returns the center of the neighbouring cell to go to from point towards the destination,
+        or None if the destination cannot be reached from point\n
+        Only reads 8 cells once the destination's field is cached
+        """
+        field = self.cost_to_go(destination).ravel()
+        index = self._index(self._cell(point))
+        if field[index] == _UNREACHABLE:
+            return None
+        if field[index] == 0:
+            return tuple(destination)
+        neighbours = index + self._offsets
+        best = neighbours[numpy.argmin(field[neighbours])]
+        return self._center(best)
+
+    def shortest_path(self, start, destination):
+        """
+        Returns the path from start to destination as a list of points (cell centers where it turns),
+        or None if there is none
+        """
+        field = self.cost_to_go(destination).ravel()
+        index = self._index(self._cell(start))
+        if field[index] == _UNREACHABLE:
+            return None
+        indices = [index]
+        while field[index] > 0:
+            neighbours = index + self._offsets
+            index = neighbours[numpy.argmin(field[neighbours])]
+            indices.append(index)
+        # Only keep the cells where the direction changes
+        indices = numpy.array(indices)
+        steps = numpy.diff(indices)
+        turns = numpy.flatnonzero(steps[1:] != steps[:-1]) + 1
+        path = [tuple(start)] + [self._center(i) for i in indices[turns]] + [tuple(destination)]
+        return path
+
+    def _wavefront(self, cell):
+        """ Dial's bucketed Dijkstra from the cell, every bucket of equal cost is expanded in one NumPy pass """
+        free = (self.cells != OCCUPIED).ravel() & (self.cells != INFLATED).ravel()
+        cost = numpy.full(free.shape, _UNREACHABLE, dtype=numpy.int32)
+        start = self._index(cell)
+        if not free[start]:
+            return cost.reshape(self.cells.shape)
+        cost[start] = 0
+        buckets = {0: [numpy.array([start])]}
+        current = 0
+        while buckets:
+            frontier = buckets.pop(current, None)
+            if frontier is not None:
+                frontier = numpy.unique(numpy.concatenate(frontier))
+                frontier = frontier[cost[frontier] == current]
+                for offset, step in zip(self._offsets, self._costs):
+                    neighbours = frontier + offset
+                    better = free[neighbours] & (cost[neighbours] > current + step)
+                    neighbours = neighbours[better]
+                    if len(neighbours):
+                        cost[neighbours] = current + step
+                        buckets.setdefault(current + step, []).append(neighbours)
+            current += 1
+        return cost.reshape(self.cells.shape)
+
+    def _cell(self, point):
+        column, row = numpy.floor((numpy.asarray(point, dtype=numpy.float64) - self.origin) / self.resolution)
+        return int(column), int(row)
+
+    def _index(self, cell):
+        """ Flat index into the padded cells, points outside of the grid land on the padding """
+        column = min(max(cell[0], -1), self.columns) + 1
+        row = min(max(cell[1], -1), self.rows) + 1
+        return row * (self.columns + 2) + column
+
+    def _center(self, index):
+        row, column = divmod(int(index), self.columns + 2)
+        return tuple((self.origin + (numpy.array((column, row)) - 0.5) * self.resolution).tolist())
+
+# -----------------------Cached planners-----------------------
+
+
+_graphs = {}  # footprint key -> VisibilityGraph, reused by plan()
+
+
+def plan(moving_shape, pivot_point, obstacles, destination, tolerance=0):
+    """
+    Plans the shortest path of the pivot point to the destination, see geometry_2d.get_shortest_path\n
+    The visibility graph is cached per footprint so consecutive calls with mostly the same obstacles
+    only update what changed
+    """
+    footprint = get_footprint(moving_shape, pivot_point, tolerance)
+    key = footprint.tobytes()
+    graph = _graphs.get(key)
+    if graph is None:
+        _graphs.clear()  # The car's footprint changed, the old graphs are useless
+        graph = _graphs[key] = VisibilityGraph(footprint)
+    graph.set_obstacles(obstacles)
+    return graph.shortest_path(pivot_point, destination)
@@ -0,0 +1,258 @@
+"""
+Offline replay of recorded drives: the telemetry of a Car streamed back through its heading pipeline, odometry
+and point controller, many times faster than real time:
+    python replay.py <telemetry directory> [--profile calibration.json] [--trace trace.tel]\n
+Car.record_telemetry records the magnetometer samples, the encoder pulses and the paths the car is given next to
+the state of every control tick. Replay feeds them to a Car's heading_pipeline, odometry and point_controller in
+the order they arrived and recomputes every tick: the pose, what the controller decided and why, as TRACE records.
+It reads the logs chunk ticks at a time and keeps only running statistics, so the memory stays flat however long
+the drive was. statistics() summarizes the ticks replayed so far: the heading error histogram, the time to settle
+on every goal, how often the steering oscillated while driving and how far the replayed pose is from the recorded one\n
+The replay starts from the pose the car started from, so it needs the logs from the beginning of the drive
+(max_files large enough that rotation deleted nothing). Ticks while the car was calibrating are replayed as the
+point controller would have decided them, the recorded motor values show what the calibrator did instead,
+and the replayed positions do not start over after a calibration like the car's do (Car.reanchor)
+"""
+import argparse
+import json
+import math
+import numpy
+from controller import PointController, RunningStats
+from telemetry import LogFile, STATE, MAGNETOMETER, PULSES, GOALS, log_files, read_header, read_log
+
+# A control tick replayed: the pose (degrees), the point driven to, its distance, the heading error (degrees), the
+# index of the decision in PointController.MODES, the PID output and the commands, then what the car recorded
+TRACE = numpy.dtype([('time', '<f8'), ('x', '<f4'), ('y', '<f4'), ('angle', '<f4'), ('target_x', '<f4'), ('target_y', '<f4'),
+                     ('distance', '<f4'), ('error', '<f4'), ('mode', 'u1'), ('turn', '<f4'), ('left_command', '<f4'),
+                     ('right_command', '<f4'), ('left', '<f4'), ('right', '<f4'), ('recorded_x', '<f4'),
+                     ('recorded_y', '<f4'), ('recorded_angle', '<f4')])
+_MODES = {mode: index for index, mode in enumerate(PointController.MODES)}
+
+
+class Replay:
+    """
+    Replays the drive recorded in directory, car is the Car whose heading_pipeline, odometry and point_controller
+    run it, by default a new one with the calibration profile applied. bins are the edges of the heading error
+    histogram in degrees, it counts the ticks the controller was not idle
+    """
+
+    def __init__(self, directory, car=None, profile=None, chunk=4096, bins=numpy.arange(-180, 181, 5)):
+        if car is None:
+            from hardware_control import Car, GpioBackend
+            car = Car(GpioBackend(), profile_path=None)  # Nothing is driven, the devices are never made
+            if profile is not None:
+                car.apply_profile(profile)
+        self.directory = directory
+        self.car = car
+        self.chunk = chunk
+        self.bins = numpy.asarray(bins, dtype=numpy.float64)
+        self.ticks = 0
+        self.first_time = self.last_time = None
+        self.modes = numpy.zeros(len(PointController.MODES), dtype=numpy.int64)
+        self.histogram = numpy.zeros(len(self.bins) - 1, dtype=numpy.int64)
+        self.settle_times = RunningStats()  # Seconds from a goal to the controller going idle
+        self.unsettled = 0  # Goals replaced by the next one before the controller went idle
+        self.oscillations = 0  # Changes of the side of the heading error beyond heading_tolerance while driving
+        self.driving = 0.0  # Seconds in 'drive'
+        self.position_difference = RunningStats()  # Meters between the replayed and the recorded position
+        self._goal_time = None
+        self._side = 0
+
+    def chunks(self):
+        """ Yields the TRACE records of the recorded ticks, up to chunk ticks at a time """
+        state = _Cursor(self.directory, 'state', STATE)
+        samples = _Cursor(self.directory, 'magnetometer', MAGNETOMETER)
+        pulses = _Cursor(self.directory, 'pulses', PULSES)
+        goals = _Cursor(self.directory, 'goals', GOALS)
+        while True:
+            ticks = state.take(self.chunk)
+            if not len(ticks):
+                return
+            end = float(ticks['time'][-1])
+            new_samples = samples.until(end)
+            if len(new_samples):
+                raw = numpy.column_stack([new_samples[field] for field in ('time', 'x', 'y', 'z')]).astype(numpy.float64)
+                headings = self.car.heading_pipeline.process(raw)
+            else:
+                headings = numpy.empty((0, 3))
+            trace = self._replay(ticks, headings, pulses.until(end), goals.until(end))
+            self._summarize(trace)
+            yield trace
+
+    def run(self, trace_path=None):
+        """ Replays the whole drive, saving the trace as a telemetry file of stream 'trace' if trace_path is given """
+        log = None
+        if trace_path is not None:
+            count = sum(read_header(path)[2] for path in log_files(self.directory, 'state'))
+            log = LogFile(trace_path, 'trace', TRACE, max(count, 1))
+        try:
+            for trace in self.chunks():
+                if log is not None:
+                    log.append(trace)
+        finally:
+            if log is not None:
+                log.close()
+        return self.statistics()
+
+    def statistics(self):
+        return {'ticks': self.ticks,
+                'duration': self.last_time - self.first_time if self.ticks else 0.0,
+                'modes': dict(zip(PointController.MODES, self.modes.tolist())),
+                'heading_error_histogram': {'bins': self.bins.tolist(), 'counts': self.histogram.tolist()},
+                'settle_time': self.settle_times.to_dict(),
+                'unsettled': self.unsettled + (self._goal_time is not None),
+                'oscillations': self.oscillations,
+                'oscillations_per_minute': self.oscillations / self.driving * 60 if self.driving else 0.0,
+                'position_difference': self.position_difference.to_dict()}
+
+    def _replay(self, ticks, headings, pulses, goals):
+        odometry = self.car.odometry
+        controller = self.car.point_controller
+        tolerance = controller.heading_tolerance
+        times = ticks['time'].astype(numpy.float64)
+        # Where the data received up to every tick ends
+        heading_ends = numpy.searchsorted(headings[:, 0], times, 'right')
+        pulse_ends = numpy.searchsorted(pulses['time'], times, 'right')
+        goal_ends = numpy.searchsorted(goals['time'], times, 'right')
+        pulse_times, directions = pulses['time'].tolist(), pulses['direction'].tolist()
+        rows = []
+        heading = pulse = goal = 0
+        last = self.last_time
+        for i, now in enumerate(times.tolist()):
+            if heading_ends[i] > heading:
+                odometry.add_headings(headings[heading:heading_ends[i]])
+                heading = heading_ends[i]
+            if pulse_ends[i] - pulse > 8:
+                odometry.add_pulses(pulse_times[pulse:pulse_ends[i]], directions[pulse:pulse_ends[i]])
+                pulse = pulse_ends[i]
+            while pulse < pulse_ends[i]:
+                # One at a time like the car adds them, a tick rarely has more than a few
+                odometry.add_pulse(pulse_times[pulse], directions[pulse])
+                pulse += 1
+            if goal_ends[i] > goal:
+                self._set_goals(goals[goal:goal_ends[i]])
+                goal = goal_ends[i]
+            pose = odometry.snapshot()
+            dt = now - last if last is not None else self.car.control_period
+            last = now
+            left, right = controller.update(pose, dt)
+            mode = controller.mode
+            if controller.path:
+                target_x, target_y = controller.path[0]
+                distance = math.hypot(target_x - pose.x, target_y - pose.y)
+            else:
+                target_x = target_y = distance = math.nan
+            if mode == 'drive':
+                self.driving += dt
+                if abs(controller.error) > tolerance:
+                    side = 1 if controller.error > 0 else -1
+                    self.oscillations += self._side == -side
+                    self._side = side
+            else:
+                self._side = 0
+            if mode == 'idle' and self._goal_time is not None:
+                self.settle_times.add(now - self._goal_time)
+                self._goal_time = None
+            rows.append((now, pose.x, pose.y, math.degrees(pose.theta), target_x, target_y, distance,
+                         math.degrees(controller.error), _MODES[mode], controller.turn, left, right))
+        self.last_time = last
+        trace = numpy.zeros(len(ticks), TRACE)
+        columns = numpy.array(rows, dtype=numpy.float64)
+        for column, field in enumerate(TRACE.names[:12]):
+            trace[field] = columns[:, column]
+        for field, recorded in (('left', 'left'), ('right', 'right'), ('recorded_x', 'current_x'),
+                                ('recorded_y', 'current_y'), ('recorded_angle', 'current_angle')):
+            trace[field] = ticks[recorded]
+        return trace
+
+    def _set_goals(self, goals):
+        """ Gives the controller the paths recorded by Car.set_path, the last one is in effect """
+        for start, end in zip(*_groups(goals['index'])):
+            group = goals[start:end]
+            points = [(float(x), float(y)) for x, y in zip(group['x'], group['y']) if not math.isnan(x)]
+            headings = group['heading'][~numpy.isnan(group['heading'])]
+            self.car.point_controller.set_path(points, math.radians(headings[0]) if len(headings) else None)
+            if self._goal_time is not None:
+                self.unsettled += 1
+            self._goal_time = float(group['time'][0]) if points or len(headings) else None
+            self._side = 0
+
+    def _summarize(self, trace):
+        if not len(trace):
+            return
+        if self.first_time is None:
+            self.first_time = float(trace['time'][0])
+        self.ticks += len(trace)
+        self.modes += numpy.bincount(trace['mode'], minlength=len(self.modes))
+        active = trace['mode'] != _MODES['idle']
+        self.histogram += numpy.histogram(trace['error'][active], self.bins)[0]
+        difference = numpy.hypot(trace['x'] - trace['recorded_x'], trace['y'] - trace['recorded_y'])
+        for value in difference.tolist():
+            self.position_difference.add(value)
+
+
+def _groups(index):
+    """ The (starts, ends) of the paths in goal records, every path starts at index 0 """
+    starts = numpy.flatnonzero(index == 0)
+    return starts, numpy.append(starts[1:], len(index))
+
+
+class _Cursor:
+    """ Reads the records of a stream in order across its files, without loading more than it returns """
+
+    def __init__(self, directory, stream, dtype):
+        self.dtype = dtype
+        self._files = log_files(directory, stream)
+        self._records = None
+        self._position = 0
+
+    def take(self, count):
+        """ The next count records, fewer at the end of the stream """
+        return self._read(lambda records, position, remaining: min(position + remaining, len(records)), count)
+
+    def until(self, time):
+        """ The next records up to and including time """
+        def end(records, position, remaining):
+            times = records['time']
+            # Gallop ahead so only the records up to time are searched, not the whole file
+            step = 64
+            while position + step < len(records) and times[position + step] <= time:
+                step *= 2
+            window = times[position:position + step + 1]
+            return position + int(numpy.searchsorted(window, time, 'right'))
+        return self._read(end)
+
+    def _read(self, end, count=None):
+        parts = []
+        while count is None or count > 0:
+            if self._records is None:
+                if not self._files:
+                    break
+                self._records = read_log(self._files.pop(0))
+                self._position = 0
+            last = end(self._records, self._position, count)
+            parts.append(numpy.array(self._records[self._position:last]))
+            if count is not None:
+                count -= last - self._position
+            self._position = last
+            if last < len(self._records):
+                break
+            self._records = None
+        return numpy.concatenate(parts) if parts else numpy.empty(0, self.dtype)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replays a drive recorded by Car.record_telemetry and prints its statistics')
+    parser.add_argument('directory', help='the telemetry directory')
+    parser.add_argument('--profile', help='the calibration profile the car drove with')
+    parser.add_argument('--trace', help='save the replayed ticks to this telemetry file')
+    arguments = parser.parse_args()
+    profile = None
+    if arguments.profile:
+        from calibration import load_profile
+        profile = load_profile(arguments.profile)
+    print(json.dumps(Replay(arguments.directory, profile=profile).run(arguments.trace), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+import numpy
+from replay import *
+from telemetry import LogFile, log_files, read_log
+
+repeats = (1, 10, 100)
+
+
+def record_drive(directory):
+    """ Records a simulated drive around four points """
+    from hardware_control import Car
+    from simulation import Simulator
+    car = Car(Simulator(), profile_path=None)
+    car.record_telemetry(directory)
+    car.turn_on()
+    for point in ((1, 0.5), (0, 1), (-0.5, 0), (0, 0)):
+        car.move_to_point(*point)
+        car.clock.sleep(8)
+    car.turn_off()
+
+
+def repeat_drive(source, directory, count, max_records=2 ** 18):
+    """ Writes the drive count times one after the other, in files of at most max_records like rotation does """
+    for stream in ('state', 'magnetometer', 'pulses', 'goals'):
+        records = read_log(log_files(source, stream)[0])
+        span = float(records['time'][-1]) + 1
+        log = None
+        index = 0
+        for i in range(count):
+            shifted = numpy.array(records)
+            shifted['time'] += i * span
+            while len(shifted):
+                if log is None or log.count == log.capacity:
+                    if log is not None:
+                        log.close()
+                    log = LogFile(os.path.join(directory, '{}-{:06d}.tel'.format(stream, index)), stream, records.dtype, max_records)
+                    index += 1
+                shifted = shifted[log.append(shifted):]
+        log.close()
+
+
+def bench_replay():
+    source = tempfile.mkdtemp()
+    try:
+        record_drive(source)
+        for count in repeats:
+            directory = tempfile.mkdtemp()
+            try:
+                repeat_drive(source, directory, count)
+                begin = time.perf_counter()
+                statistics = Replay(directory).run()
+                elapsed = time.perf_counter() - begin
+                # Again to measure the memory, tracing the allocations slows it down
+                tracemalloc.start()
+                Replay(directory).run()
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                print('replay {:>7} ticks {:>8.0f}s of driving in {:>6.2f}s  {:>5.0f}x real time  peak memory {:>5.1f}MiB'.format(
+                    statistics['ticks'], statistics['duration'], elapsed, statistics['duration'] / elapsed, peak / 2 ** 20))
+            finally:
+                shutil.rmtree(directory)
+    finally:
+        shutil.rmtree(source)
+
+
+if __name__ == '__main__':
+    bench_replay()
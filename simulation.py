@@ -0,0 +1,354 @@
+import heapq
+import itertools
+import math
+import threading
+import numpy
+from magnetometer import FakeSMBus
+from odometry import Pose
+
+
+class VirtualClock:
+    """
+    Simulated time for the timing clock interface\n
+    Time stands still while any registered thread runs and jumps to the next wake up time once all of them
+    are blocked in sleep() or in the wait() of one of the clock's Events, so threaded code runs as fast as the
+    computer allows and sees the same times it would in real time. Threads made with clock.Thread are registered
+    while they run and so is the thread that creates the clock, unless register is False.
+    hooks are called with the time step every time the time moves\n
+    advance() moves the time directly, e.g. from run_headless when no other threads are involved
+    """
+
+    def __init__(self, time=0.0, register=True):
+        self.time = time
+        self.hooks = []
+        self._condition = threading.Condition()
+        self._threads = {threading.get_ident()} if register else set()  # Registered thread idents
+        self._runnable = len(self._threads)  # Registered threads that are not blocked
+        self._wakeups = []  # Heap of (time, sequence, waiter)
+        self._sequence = itertools.count()
+
+    def __call__(self):
+        return self.time
+
+    def advance(self, seconds):
+        with self._condition:
+            self._move(self.time + max(seconds, 0))
+
+    def sleep(self, seconds):
+        self._block(self.time + max(seconds, 0))
+
+    def Event(self):
+        return _VirtualEvent(self)
+
+    def Thread(self, *args, **kwargs):
+        return _VirtualThread(self, *args, **kwargs)
+
+    def _move(self, time):
+        step = time - self.time
+        self.time = time
+        for hook in self.hooks:
+            hook(step)
+
+    def _block(self, deadline=None, event=None):
+        """ Blocks the calling registered thread until the deadline or until the event is set, returns the event's state """
+        with self._condition:
+            if threading.get_ident() not in self._threads:
+                raise RuntimeError('Only threads registered with the VirtualClock can wait on it')
+            if event is not None and event._flag:
+                return True
+            if deadline is not None and deadline <= self.time:
+                return event is not None and event._flag
+            waiter = [False]  # Released
+            if deadline is not None:
+                heapq.heappush(self._wakeups, (deadline, next(self._sequence), waiter))
+            if event is not None:
+                event._waiters.append(waiter)
+            self._runnable -= 1
+            self._step()
+            while not waiter[0]:
+                self._condition.wait()
+            return event is not None and event._flag
+
+    def _release(self, waiter):
+        if not waiter[0]:
+            waiter[0] = True
+            self._runnable += 1
+
+    def _step(self):
+        """ Moves the time to the next wake up while every registered thread is blocked """
+        while self._runnable <= 0 and self._wakeups:
+            deadline, _, waiter = heapq.heappop(self._wakeups)
+            if waiter[0]:
+                continue  # Released by its event already
+            if deadline > self.time:
+                self._move(deadline)
+            self._release(waiter)
+            while self._wakeups and self._wakeups[0][0] <= self.time:
+                self._release(heapq.heappop(self._wakeups)[2])
+            self._condition.notify_all()
+
+
+class _VirtualEvent:
+    """ threading.Event whose wait() timeout runs on a VirtualClock """
+
+    def __init__(self, clock):
+        self._clock = clock
+        self._flag = False
+        self._waiters = []
+
+    def is_set(self):
+        return self._flag
+
+    def set(self):
+        with self._clock._condition:
+            self._flag = True
+            for waiter in self._waiters:
+                self._clock._release(waiter)
+            self._waiters = []
+            self._clock._condition.notify_all()
+
+    def clear(self):
+        self._flag = False
+
+    def wait(self, timeout=None):
+        return self._clock._block(None if timeout is None else self._clock.time + timeout, self)
+
+
+class _VirtualThread(threading.Thread):
+    """ threading.Thread that is registered with a VirtualClock while it runs """
+
+    def __init__(self, clock, *args, **kwargs):
+        threading.Thread.__init__(self, *args, **kwargs)
+        self._clock = clock
+        self._finished = clock.Event()
+
+    def start(self):
+        # Registered before it starts so the time cannot run ahead of it
+        with self._clock._condition:
+            self._clock._runnable += 1
+        threading.Thread.start(self)
+
+    def run(self):
+        with self._clock._condition:
+            self._clock._threads.add(threading.get_ident())
+        try:
+            threading.Thread.run(self)
+        finally:
+            self._finished.set()
+            with self._clock._condition:
+                self._clock._threads.discard(threading.get_ident())
+                self._clock._runnable -= 1
+                self._clock._step()
+
+    def join(self, timeout=None):
+        # A registered thread waits in virtual time so the clock can move on while the other thread finishes
+        if threading.get_ident() in self._clock._threads and not self._finished.wait(timeout):
+            return
+        threading.Thread.join(self)
+
+
+class DifferentialDrive:
+    """
+    Kinematic model of the car\n
+    Wheel commands are in [-1, 1] like gpiozero.Motor.value, the wheel speeds follow them with a first order lag
+    of time_constant seconds up to max_speed (m/s). track_width is the distance between the wheels.
+    Commands below deadband do not turn a wheel and gains scales the (left, right) wheel speeds
+    to model mismatched motors
+    """
+
+    def __init__(self, track_width=0.16, max_speed=0.5, time_constant=0.05, x=0, y=0, theta=0, deadband=0.0, gains=(1.0, 1.0)):
+        self.track_width = track_width
+        self.max_speed = max_speed
+        self.time_constant = time_constant
+        self.deadband = deadband
+        self.gains = gains
+        self.x, self.y, self.theta = float(x), float(y), float(theta)
+        self.time = 0.0
+        self.commands = [0.0, 0.0]  # Left, right
+        self.speeds = [0.0, 0.0]  # Left, right wheel speeds in m/s
+        self.distance = [0.0, 0.0]  # Distance rolled by each wheel, backward counts negative
+        self.travelled = [0.0, 0.0]  # Distance rolled by each wheel in either direction
+        self.energy = 0.0  # Integral of the squared commands, a proxy for the battery use
+
+    def set_commands(self, left, right):
+        self.commands = [max(-1.0, min(1.0, left)), max(-1.0, min(1.0, right))]
+
+    def advance(self, dt):
+        if dt <= 0:
+            return
+        # Exact first order response over the step, then the car moves along an arc with the mean speeds
+        keep = math.exp(-dt / self.time_constant)
+        old = self.speeds
+        targets = [0.0 if abs(c) < self.deadband else c * g * self.max_speed for c, g in zip(self.commands, self.gains)]
+        self.speeds = [v + (s - v) * keep for v, s in zip(targets, old)]
+        left, right = ((o + n) / 2 for o, n in zip(old, self.speeds))
+        self.distance = [self.distance[0] + left * dt, self.distance[1] + right * dt]
+        self.travelled = [self.travelled[0] + abs(left) * dt, self.travelled[1] + abs(right) * dt]
+        self.energy += (self.commands[0] ** 2 + self.commands[1] ** 2) * dt
+        forward = (left + right) / 2 * dt
+        turn = (right - left) / self.track_width * dt
+        if abs(turn) < 1e-12:
+            self.x += forward * math.cos(self.theta)
+            self.y += forward * math.sin(self.theta)
+        else:
+            radius = forward / turn
+            self.x += radius * (math.sin(self.theta + turn) - math.sin(self.theta))
+            self.y -= radius * (math.cos(self.theta + turn) - math.cos(self.theta))
+        self.theta = (self.theta + turn) % (2 * math.pi)
+        self.time += dt
+
+    def pose(self):
+        return Pose(self.time, self.x, self.y, self.theta, numpy.zeros((3, 3)))
+
+
+class SimulatedMotor:
+    """ gpiozero.Motor stand in driving one wheel of a DifferentialDrive, side is 0 for the left and 1 for the right """
+
+    def __init__(self, plant, side):
+        self.plant = plant
+        self.side = side
+
+    @property
+    def value(self):
+        return self.plant.commands[self.side]
+
+    @value.setter
+    def value(self, value):
+        commands = list(self.plant.commands)
+        commands[self.side] = value
+        self.plant.set_commands(*commands)
+
+    def forward(self, speed=1):
+        self.value = speed
+
+    def backward(self, speed=1):
+        self.value = -speed
+
+    def stop(self):
+        self.value = 0
+
+    def close(self):
+        self.stop()
+
+
+class SimulatedEncoder:
+    """
+    gpiozero.DigitalInputDevice stand in for the wheel encoder on one wheel of a DifferentialDrive\n
+    It is active for the first half of every length_per_pulse the wheel rolls in either direction.
+    The waits sleep on the clock until the predicted next edge, at least min_poll and at most max_poll seconds at a time
+    """
+
+    def __init__(self, plant, clock, length_per_pulse=0.01, side=0, min_poll=0.0005, max_poll=0.01):
+        self.plant = plant
+        self.clock = clock
+        self.length_per_pulse = length_per_pulse
+        self.side = side
+        self.min_poll = min_poll
+        self.max_poll = max_poll
+
+    @property
+    def is_active(self):
+        return self.plant.travelled[self.side] / self.length_per_pulse % 1 < 0.5
+
+    def wait_for_active(self, timeout=None):
+        return self._wait(True, timeout)
+
+    def wait_for_inactive(self, timeout=None):
+        return self._wait(False, timeout)
+
+    def close(self):
+        pass
+
+    def _wait(self, active, timeout):
+        end = math.inf if timeout is None else self.clock() + timeout
+        while self.is_active != active:
+            if self.clock() >= end:
+                return False
+            phase = self.plant.travelled[self.side] / self.length_per_pulse % 1
+            remaining = ((0.5 if phase < 0.5 else 1.0) - phase) * self.length_per_pulse
+            speed = abs(self.plant.speeds[self.side])
+            step = remaining / speed if speed > 0 else self.max_poll
+            self.clock.sleep(min(max(step, self.min_poll), self.max_poll, end - self.clock()))
+        return True
+
+
+class Simulator:
+    """
+    hardware_control backend running the car on a DifferentialDrive in virtual time\n
+    The magnetometer reads the plant's heading rotated by the declination, distorted by the soft_iron matrix,
+    offset by hard_iron and with magnetometer_noise counts of gaussian noise on every axis.
+    The encoder is on the left wheel. Pass it to hardware_control.Car, or set the SMARTCAR_BACKEND=simulation
+    environment variable for hardware_control's default car. The thread that makes the clock is registered with it
+    and has to let time pass with clock.sleep(). Simulators sharing one clock run their cars in the same time
+    """
+
+    def __init__(self, plant=None, clock=None, magnetometer_noise=2.0, field_strength=300, hard_iron=(0, 0),
+                 soft_iron=((1, 0), (0, 1)), declination=-0.00669, length_per_pulse=0.01, seed=0):
+        self.plant = DifferentialDrive(deadband=0.2, gains=(1.0, 0.95)) if plant is None else plant
+        self.clock = VirtualClock() if clock is None else clock
+        self.clock.hooks.append(self.plant.advance)
+        self.magnetometer_noise = magnetometer_noise
+        self.field_strength = field_strength
+        self.hard_iron = numpy.asarray(hard_iron, dtype=numpy.float64)
+        self.soft_iron = numpy.asarray(soft_iron, dtype=numpy.float64)
+        self.declination = declination
+        self.length_per_pulse = length_per_pulse
+        self.random = numpy.random.default_rng(seed)
+
+    def motor(self, name, forward_pin, backward_pin):
+        return SimulatedMotor(self.plant, 0 if name == 'left' else 1)
+
+    def smbus(self, number):
+        return FakeSMBus(field=self._field, clock=self.clock)
+
+    def input_device(self, pin):
+        return SimulatedEncoder(self.plant, self.clock, self.length_per_pulse)
+
+    def _field(self, t):
+        heading = self.plant.theta - self.declination
+        x, y = self.soft_iron @ (self.field_strength * math.cos(heading), self.field_strength * math.sin(heading)) + self.hard_iron
+        noise = self.random.normal(0, self.magnetometer_noise, 3)
+        return x + noise[0], y + noise[1], -400 + noise[2]
+
+
+def run_headless(scheduler, plant, duration, sensor_period=None, on_sensor=None):
+    """
+    Runs a controller.Scheduler against the plant in virtual time, as fast as the computer allows\n
+    Control ticks happen at the scheduler's deadlines. If sensor_period is given there is a sensor reading
+    every sensor_period seconds that wakes the scheduler like Scheduler.notify() does. on_sensor(time) is called
+    for every reading and only wakes the scheduler when it returns True.
+    The plant moves with the clock's hooks and is added to them if it is not there yet.
+    Returns the (N, 4) array of (time, x, y, theta) at every tick
+    """
+    clock = scheduler.clock
+    if not isinstance(clock, VirtualClock):
+        raise ValueError('run_headless needs a scheduler with a VirtualClock')
+    if plant.advance not in clock.hooks:
+        clock.hooks.append(plant.advance)
+    end = clock() + duration
+    deadline = clock()
+    next_sensor = clock() + sensor_period if sensor_period else math.inf
+    woken = False
+    trace = []
+    while True:
+        # Wakes are held back until min_interval after the last tick like in Scheduler.run
+        wake = scheduler.last_tick + scheduler.min_interval if woken else math.inf
+        now = min(deadline, next_sensor, max(wake, clock()))
+        if now > end:
+            break
+        clock.advance(now - clock())
+        if now == next_sensor:
+            next_sensor += sensor_period
+            woken = (on_sensor is None or on_sensor(now)) or woken
+        if woken and scheduler.last_tick + scheduler.min_interval <= now < deadline:
+            scheduler.tick(now)
+            deadline = now + scheduler.period
+        elif now >= deadline:
+            scheduler.tick(now, deadline)
+            deadline = scheduler.next_deadline(deadline, now)
+        else:
+            continue
+        woken = False
+        trace.append((now, plant.x, plant.y, plant.theta))
+    clock.advance(end - clock())
+    return numpy.array(trace).reshape(-1, 4)
@@ -0,0 +1,41 @@
+import os
+import time
+os.environ.setdefault('SMARTCAR_BACKEND', 'simulation')
+from controller import *
+from odometry import Pose
+from simulation import *
+
+
+def bench_headless():
+    """ Scheduler and PointController on a plant without threads """
+    for seconds in (10, 100):
+        plant = DifferentialDrive()
+        clock = VirtualClock()
+        controller = PointController()
+        controller.set_path([(1, 0), (1, 1), (0, 1), (0, 0)] * (seconds // 10))
+        scheduler = Scheduler(0.05, controller, lambda: Pose(clock(), plant.x, plant.y, plant.theta, None),
+                              lambda command: plant.set_commands(*command), clock=clock)
+        begin = time.perf_counter()
+        run_headless(scheduler, plant, seconds, sensor_period=1 / 75)
+        real = time.perf_counter() - begin
+        print('run_headless {:>4}s  {:>8.1f}ms  {:>7.0f}x real time'.format(seconds, real * 1e3, seconds / real))
+
+
+def bench_hardware_control():
+    """ The full threaded hardware_control stack on the Simulator backend """
+    import hardware_control
+    begin = time.perf_counter()
+    hardware_control.turn_on()
+    hardware_control.move_to_point(1, 0.5)
+    hardware_control.clock.sleep(10)
+    real = time.perf_counter() - begin
+    virtual = hardware_control.clock()
+    plant = hardware_control.backend.plant
+    print('hardware_control {:.0f}s  {:>8.1f}ms  {:>7.0f}x real time  odometry {}  plant ({:.3f}, {:.3f})'.format(
+        virtual, real * 1e3, virtual / real, tuple(round(v, 3) for v in hardware_control.current_point), plant.x, plant.y))
+    hardware_control.turn_off()
+
+
+if __name__ == '__main__':
+    bench_headless()
+    bench_hardware_control()
@@ -0,0 +1,143 @@
+"""
+Monte Carlo parameter sweeps of simulated move_to_point missions for tuning hardware_control\n
+A mission runs a hardware_control.Car on a Simulator from the origin to a goal, so the sensor threads,
+the control loop and the speed table it sweeps are the ones the car drives with.
+run_sweep runs many missions in a process pool and writes one column per parameter and metric to an .npz file.
+Finished batches are kept next to it, so an interrupted sweep continues where it stopped when run again
+"""
+import itertools
+import math
+import multiprocessing
+import os
+import numpy
+from hardware_control import Car
+from simulation import Simulator
+
+# The defaults of hardware_control.Car, speed_factors is split into one parameter per key
+PARAMETERS = {'angle_threshold': float(Car.angle_threshold), 'location_threshold': Car.location_threshold,
+              **Car.default_speed_factors, 'goal_x': 1.0, 'goal_y': 0.5, 'seed': 0}
+METRICS = ('time_to_goal', 'final_error', 'overshoot', 'energy', 'distance')
+
+
+def mission(duration=30.0, control_period=Car.control_period, **parameters):
+    """
+    Runs move_to_point(goal_x, goal_y) on a Car for duration seconds of virtual time, parameters are PARAMETERS
+    and seed sets the sensor noise. angle_threshold, location_threshold and control_period replace the Car's
+    constants and the speed factors its uncalibrated ones\n
+    Returns the metrics: time_to_goal when the controller considered the goal reached (nan if it never did),
+    final_error the true distance to the goal at the end, overshoot the furthest the car went past the goal
+    along the line from the start, energy the plant's integral of the squared motor values and
+    distance the mean distance rolled by the wheels
+    """
+    unknown = set(parameters) - set(PARAMETERS)
+    if unknown:
+        raise TypeError('Unknown parameters {}'.format(sorted(unknown)))
+    parameters = dict(PARAMETERS, **parameters)
+    constants = {'angle_threshold': parameters['angle_threshold'], 'location_threshold': parameters['location_threshold'],
+                 'control_period': control_period}
+    simulator = Simulator(seed=int(parameters['seed']))
+    plant = simulator.plant
+    car = type('SweepCar', (Car,), constants)(simulator, profile_path=None)
+    car.apply_profile(dict(car.current_profile(), speed_factors={key: parameters[key] for key in Car.default_speed_factors}))
+    state = {'arrived': math.nan, 'trace': []}
+    drive = car.control_scheduler.actuate
+
+    def actuate(values):
+        drive(values)
+        state['trace'].append((plant.x, plant.y))
+        if not car.point_controller.path and math.isnan(state['arrived']):
+            state['arrived'] = car.clock()
+    car.control_scheduler.actuate = actuate
+    goal_x, goal_y = parameters['goal_x'], parameters['goal_y']
+    car.move_to_point(goal_x, goal_y)  # Before the control loop starts so its first tick has the goal
+    car.turn_on()
+    car.clock.sleep(duration)
+    result = {'time_to_goal': state['arrived'],
+              'final_error': math.hypot(plant.x - goal_x, plant.y - goal_y),
+              'energy': plant.energy,
+              'distance': sum(plant.travelled) / 2}
+    car.turn_off()
+    trace = numpy.array(state['trace']).reshape(-1, 2)
+    length = math.hypot(goal_x, goal_y)
+    along = (trace[:, 0] * goal_x + trace[:, 1] * goal_y) / length if length else numpy.zeros(1)
+    result['overshoot'] = max(float(along.max(initial=0)) - length, 0.0)
+    return result
+
+
+def grid(**values):
+    """
+    Returns the scenarios of every combination of the values, single values are kept fixed,
+    e.g. grid(angle_threshold=(2, 5, 10), seed=range(50)) repeats every threshold with 50 noise seeds
+    """
+    names = list(values)
+    return [dict(zip(names, combination))
+            for combination in itertools.product(*(numpy.atleast_1d(values[name]).tolist() for name in names))]
+
+
+def run_sweep(path, scenarios, processes=None, batch=8, **mission_options):
+    """
+    Runs mission() for every scenario, a dict of PARAMETERS, in a pool of processes (one per core by default)\n
+    Every batch of scenarios is saved to path + '.parts' as it finishes and batches found there are not run again,
+    so calling run_sweep again with the same scenarios resumes it. When all are done the columns of
+    PARAMETERS and METRICS in scenario order are saved to path and returned as a dict of arrays.
+    mission_options, e.g. duration, are passed to every mission
+    """
+    scenarios = [dict(PARAMETERS, **scenario) for scenario in scenarios]
+    unknown = set().union(*scenarios) - set(PARAMETERS) if scenarios else set()
+    if unknown:
+        raise ValueError('Unknown parameters {}'.format(sorted(unknown)))
+    parts = path + '.parts'
+    os.makedirs(parts, exist_ok=True)
+    batches = [scenarios[first:first + batch] for first in range(0, len(scenarios), batch)]
+    names = [os.path.join(parts, '{:06d}.npz'.format(index)) for index in range(len(batches))]
+    todo = [(index, batches[index], mission_options) for index in range(len(batches))
+            if not _resume(names[index], batches[index])]
+    if todo:
+        with multiprocessing.Pool(processes) as pool:
+            # Unordered so a slow batch does not hold back saving the others
+            for index, columns in pool.imap_unordered(_run_batch, todo):
+                _save(names[index], columns)
+    columns = {}
+    for name in names:
+        with numpy.load(name) as part:
+            for key in part.files:
+                columns.setdefault(key, []).append(part[key])
+    columns = {key: numpy.concatenate(columns[key]) if key in columns else numpy.empty(0)
+               for key in tuple(PARAMETERS) + METRICS}
+    _save(path, columns)
+    for name in names:
+        os.remove(name)
+    os.rmdir(parts)
+    return columns
+
+
+def load_sweep(path):
+    """ Returns the dict of columns saved by run_sweep """
+    with numpy.load(path) as sweep:
+        return {key: sweep[key] for key in sweep.files}
+
+
+def _run_batch(arguments):
+    index, scenarios, mission_options = arguments
+    results = [mission(**scenario, **mission_options) for scenario in scenarios]
+    columns = {key: numpy.array([scenario[key] for scenario in scenarios], dtype=numpy.float64) for key in PARAMETERS}
+    columns.update((key, numpy.array([result[key] for result in results], dtype=numpy.float64)) for key in METRICS)
+    return index, columns
+
+
+def _resume(name, scenarios):
+    """ Whether the batch was saved already, a saved batch of other scenarios means the sweep changed """
+    if not os.path.exists(name):
+        return False
+    with numpy.load(name) as part:
+        for key in PARAMETERS:
+            if not numpy.array_equal(part[key], [scenario[key] for scenario in scenarios]):
+                raise ValueError('{} holds other scenarios, remove it to start the sweep over'.format(os.path.dirname(name)))
+    return True
+
+
+def _save(path, columns):
+    # Written under another name first so an interruption never leaves a partial file behind
+    temporary = path + '.tmp.npz'
+    numpy.savez(temporary, **columns)
+    os.replace(temporary, path)
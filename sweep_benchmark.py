@@ -0,0 +1,32 @@
+import os
+import shutil
+import tempfile
+import time
+from sweep import *
+
+
+def bench_mission():
+    begin = time.perf_counter()
+    mission(duration=30)
+    real = time.perf_counter() - begin
+    print('mission 30s  {:>8.1f}ms  {:>5.0f}x real time'.format(real * 1e3, 30 / real))
+
+
+def bench_scaling(missions=32):
+    """ Missions per second for every process count up to the number of cores """
+    directory = tempfile.mkdtemp()
+    scenarios = grid(angle_threshold=(2, 5, 10, 20), seed=range(missions // 4))
+    try:
+        for processes in sorted({1, 2, os.cpu_count() // 2 or 1, os.cpu_count()}):
+            begin = time.perf_counter()
+            run_sweep(os.path.join(directory, '{}.npz'.format(processes)), scenarios, processes=processes, duration=10)
+            real = time.perf_counter() - begin
+            print('run_sweep {:>3} missions {:>2} processes  {:>7.2f}s  {:>6.1f} missions/s'.format(
+                len(scenarios), processes, real, len(scenarios) / real))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    bench_mission()
+    bench_scaling()
@@ -0,0 +1,247 @@
+"""
+Binary telemetry: fixed width records appended to memory mapped files\n
+File format, little endian, one stream per file:
+    0      8 bytes  MAGIC
+    8      u4       VERSION
+    12     u4       HEADER_SIZE, the offset of the first record
+    16     u8       count of records written, updated after the records so readers never see a partial one
+    24     u4       record size in bytes
+    28     u4       length of the schema
+    32     schema   JSON {"stream": name, "fields": numpy dtype descr}, NUL padded up to HEADER_SIZE
+    HEADER_SIZE     count records of the schema's dtype
+A file is made at its full size when it is opened (sparse, so unwritten space costs no disk) and cut down
+to the records written when it is closed. read_log() maps the records as a NumPy structured array without copying\n
+Record dtypes of the streams hardware_control.Car records:
+    STATE         every control tick: time, current point and angle, wanted point and angle, left and right motor values
+    MAGNETOMETER  every magnetometer sample: time and raw x, y, z counts
+    PULSES        every encoder pulse: time and direction (1 forward, -1 backward, 0 turning in place)
+    GOALS         every path the point controller is given: a record per point, index counting from 0 in the path,
+                  and the heading to turn to (degrees) in every record or NaN. An empty path is one record of NaNs\n
+Rotation: Telemetry starts a new file of a stream, <directory>/<stream>-<index>.tel, when the current one reaches
+max_bytes and deletes the oldest files of the stream beyond max_files
+Tail follows a stream while it is being recorded, reading only the records appended since it last read
+"""
+import json
+import mmap
+import os
+import struct
+import numpy
+from magnetometer import RingBuffer
+from timing import REAL_CLOCK
+
+MAGIC = b'SCTELEM\0'
+VERSION = 1
+HEADER_SIZE = 4096  # A page, so the records are page aligned for mapping
+_HEADER = struct.Struct('<8sIIQII')
+
+STATE = numpy.dtype([('time', '<f8'), ('current_x', '<f4'), ('current_y', '<f4'), ('current_angle', '<f4'),
+                     ('wanted_x', '<f4'), ('wanted_y', '<f4'), ('wanted_angle', '<f4'), ('left', '<f4'), ('right', '<f4')])
+MAGNETOMETER = numpy.dtype([('time', '<f8'), ('x', '<i2'), ('y', '<i2'), ('z', '<i2')])
+PULSES = numpy.dtype([('time', '<f8'), ('direction', 'i1')])
+GOALS = numpy.dtype([('time', '<f8'), ('index', '<u2'), ('x', '<f4'), ('y', '<f4'), ('heading', '<f4')])
+
+
+class LogFile:
+    """ Writes records of dtype to a new file at path, at most capacity of them """
+
+    def __init__(self, path, stream, dtype, capacity):
+        self.path = path
+        self.dtype = numpy.dtype(dtype)
+        self.capacity = capacity
+        self.count = 0
+        schema = json.dumps({'stream': stream, 'fields': self.dtype.descr}).encode()
+        if _HEADER.size + len(schema) > HEADER_SIZE:
+            raise ValueError('The schema of {} does not fit the header'.format(stream))
+        self._file = open(path, 'w+b')
+        self._file.truncate(HEADER_SIZE + capacity * self.dtype.itemsize)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._map[:_HEADER.size + len(schema)] = _HEADER.pack(MAGIC, VERSION, HEADER_SIZE, 0, self.dtype.itemsize, len(schema)) + schema
+        self._records = numpy.ndarray((capacity,), self.dtype, self._map, HEADER_SIZE)
+        self._count = numpy.ndarray((1,), '<u8', self._map, 16)
+
+    def append(self, records):
+        """ Appends the records that fit and returns how many did """
+        count = min(len(records), self.capacity - self.count)
+        self._records[self.count:self.count + count] = records[:count]
+        self.count += count
+        self._count[0] = self.count
+        return count
+
+    def close(self):
+        del self._records, self._count
+        self._map.close()
+        self._file.truncate(HEADER_SIZE + self.count * self.dtype.itemsize)
+        self._file.close()
+
+
+def read_header(path):
+    """ Returns (stream, dtype, count) of a telemetry file """
+    with open(path, 'rb') as file:
+        header = file.read(HEADER_SIZE)
+    magic, version, header_size, count, record_size, schema_size = _HEADER.unpack_from(header)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('{} is not a version {} telemetry file'.format(path, VERSION))
+    schema = json.loads(header[_HEADER.size:_HEADER.size + schema_size])
+    return schema['stream'], numpy.dtype([tuple(field) for field in schema['fields']]), count
+
+
+def read_log(path):
+    """ Returns the records of a telemetry file as a read only structured array mapped from the file """
+    stream, dtype, count = read_header(path)
+    if not count:
+        return numpy.empty(0, dtype)
+    return numpy.memmap(path, dtype, 'r', HEADER_SIZE, (count,))
+
+
+def log_files(directory, stream):
+    """ The files of a stream in the directory, oldest first """
+    names = sorted(name for name in os.listdir(directory) if name.startswith(stream + '-') and name.endswith('.tel'))
+    return [os.path.join(directory, name) for name in names]
+
+
+class Telemetry:
+    """
+    Records streams to rotating telemetry files in directory\n
+    record(stream, values) only pushes to the stream's RingBuffer, so the threads recording never wait on the disk.
+    A writer thread moves the new records to the files every period seconds. A stream can also be read from
+    a RingBuffer something else fills, like HMC5883L.samples. Records a stream's ring overwrote before the writer
+    got to them are counted in lost
+    """
+
+    def __init__(self, directory, max_bytes=16 * 2 ** 20, max_files=8, period=0.2, capacity=4096, clock=REAL_CLOCK):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.period = period
+        self.capacity = capacity
+        self.clock = clock
+        self.lost = {}
+        self._streams = {}  # Name: [dtype, ring, next index, LogFile or None]
+        self._wake = clock.Event()
+        self._thread = None
+        self._running = False
+        os.makedirs(directory, exist_ok=True)
+
+    def add_stream(self, name, dtype, ring=None):
+        """ Adds a stream of records of dtype, from ring if given, the writer picks it up at its next write """
+        dtype = numpy.dtype(dtype)
+        ring = RingBuffer(self.capacity, len(dtype.names)) if ring is None else ring
+        self._streams[name] = [dtype, ring, ring.written, None]
+        self.lost[name] = 0
+
+    def record(self, name, values):
+        """
+        Records the values of one record of the stream. Only one thread may record a stream, RingBuffer.push
+        is not safe for two, other threads have to hand their records to it
+        """
+        self._streams[name][1].push(values)
+
+    def start(self):
+        self._running = True
+        self._thread = self.clock.Thread(name='telemetry', target=self._write, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ Writes what is left and closes the files """
+        self._running = False
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        for stream in self._streams.values():
+            if stream[3] is not None:
+                stream[3].close()
+                stream[3] = None
+
+    def flush(self):
+        """ Writes the records recorded so far, called by the writer thread """
+        for name, stream in list(self._streams.items()):
+            dtype, ring, start = stream[:3]
+            rows, stream[2], lost = ring.read(start)
+            self.lost[name] += lost
+            if not len(rows):
+                continue
+            records = numpy.empty(len(rows), dtype)
+            for column, field in enumerate(dtype.names):
+                records[field] = rows[:, column]
+            while len(records):
+                if stream[3] is None or stream[3].count == stream[3].capacity:
+                    self._rotate(name, stream)
+                records = records[stream[3].append(records):]
+
+    def _write(self):
+        while self._running:
+            self._wake.wait(self.period)
+            self.flush()
+
+    def _rotate(self, name, stream):
+        if stream[3] is not None:
+            stream[3].close()
+        files = log_files(self.directory, name)
+        index = int(files[-1][-10:-4]) + 1 if files else 0
+        for path in files[:max(len(files) + 1 - self.max_files, 0)]:
+            os.remove(path)
+        capacity = max((self.max_bytes - HEADER_SIZE) // stream[0].itemsize, 1)
+        stream[3] = LogFile(os.path.join(self.directory, '{}-{:06d}.tel'.format(name, index)), name, stream[0], capacity)
+
+
+class Tail:
+    """
+    Follows a stream in directory while it is being recorded, from its oldest file on\n
+    read() returns the records appended since the last read as a structured array, reading only their bytes,
+    and moves on to the next file once the current one is finished. A file rotation deletes while it is being read
+    is read to the end from the open file, files deleted before the reader got to them are counted in skipped
+    """
+
+    def __init__(self, directory, stream):
+        self.directory = directory
+        self.stream = stream
+        self.dtype = None
+        self.skipped = 0
+        self._file = None
+        self._index = None
+        self._count = 0  # Records of the current file read so far
+
+    def read(self):
+        parts = []
+        while True:
+            files = log_files(self.directory, self.stream)
+            if self._index is not None:
+                files = [path for path in files if int(path[-10:-4]) > self._index]
+            if self._file is None:
+                if not files or not self._open(files[0]):
+                    break
+                files = files[1:]
+            # Telemetry closes a file before it makes the next, so with a newer one the count read below is final
+            count = struct.unpack('<Q', self._read(16, 8))[0]
+            if count > self._count:
+                size = self.dtype.itemsize
+                data = self._read(HEADER_SIZE + self._count * size, (count - self._count) * size)
+                parts.append(numpy.frombuffer(data, self.dtype))
+                self._count += len(data) // size
+            if not files:
+                break
+            self.close()
+        return numpy.concatenate(parts) if parts else numpy.empty(0, self.dtype)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _open(self, path):
+        try:
+            stream, self.dtype, count = read_header(path)
+            self._file = open(path, 'rb', buffering=0)
+        except (FileNotFoundError, ValueError, struct.error):
+            return False  # Deleted, or just made and its header is not written yet
+        index = int(path[-10:-4])
+        if self._index is not None:
+            self.skipped += index - self._index - 1
+        self._index = index
+        self._count = 0
+        return True
+
+    def _read(self, offset, size):
+        self._file.seek(offset)
+        return self._file.read(size)
@@ -0,0 +1,31 @@
+import shutil
+import tempfile
+from telemetry import *
+from geometry_2d_benchmark import best_time
+
+
+def bench_record():
+    directory = tempfile.mkdtemp()
+    try:
+        telemetry = Telemetry(directory, capacity=2 ** 16)
+        telemetry.add_stream('state', STATE)
+        values = (1.0, 0.1, 0.2, 30.0, 1.0, 0.5, 35.0, 0.4, 0.45)
+        print('record {:.2f}us'.format(best_time(lambda: telemetry.record('state', values)) * 1e6))
+
+        def write(count):
+            for i in range(count):
+                telemetry.record('state', values)
+            telemetry.flush()
+        for count in (100, 10000):
+            print('record and flush {:>6} records  {:>8.3f}ms'.format(count, best_time(lambda: write(count), repeat=5) * 1e3))
+        telemetry.stop()
+        path = log_files(directory, 'state')[-1]
+        records = len(read_log(path))
+        print('read_log {} records {:.1f}us  mean of a field {:.1f}us'.format(
+            records, best_time(lambda: read_log(path)) * 1e6, best_time(lambda: read_log(path)['current_x'].mean()) * 1e6))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    bench_record()
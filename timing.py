@@ -0,0 +1,23 @@
+"""
+The clock interface the control code uses instead of the time and threading modules directly\n
+A clock is called for the current time in seconds and has sleep(seconds), Event() and Thread(...)
+like time.sleep, threading.Event and threading.Thread. simulation.VirtualClock implements the same interface
+in simulated time
+"""
+import threading
+import time
+
+
+class RealClock:
+    """ time.monotonic with the sleeping, event and thread primitives that go with it """
+    Event = threading.Event
+    Thread = threading.Thread
+
+    def __call__(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(max(seconds, 0))
+
+
+REAL_CLOCK = RealClock()